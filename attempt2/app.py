@@ -12,16 +12,36 @@ st.set_page_config(
 
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
-from datetime import datetime
+from datetime import datetime, timezone
+import hashlib
 import json
 import os
 from dotenv import load_dotenv
 from firebase.firebase_config import initialize_firebase
 from firebase.item_service import (
     add_item, get_item, get_all_items, update_item, delete_item,
-    search_items, get_user_items
+    search_items, get_user_items, record_view
 )
+from firebase.user_service import record_activity
 from firebase.gemini import generate_content, search_items_semantic
+from firebase.metrics import timed_page
+from firebase.firestore_tracker import ReadBudgetExceeded, track_client, request_scope
+from firebase.catalog import get_catalog, invalidate_catalog, CONDITIONS, SORT_OPTIONS
+from firebase.campus import ALL_CAMPUSES, CAMPUSES, CAMPUS_PARTITIONING, campus_of, normalize_campus
+from firebase.facets import AVAILABILITY
+from firebase.pagination import SEARCH_PAGE_SIZE
+from firebase.projections import LISTING_FIELDS, delete_summary, fetch, get_item_summaries, summarize, sync_summary
+from firebase.replica import record_deletion
+from firebase.write_buffer import defer_update, discard
+from firebase.session_memory import SESSION_MEMORY_REPORT, observe, sessions_summary
+from firebase.inbox_service import INBOX_REFRESH, get_inbox, inbox_counts, stop_inbox, update_proposal_status
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from firebase.schema import ACTIVE, INACTIVE, ITEM_SCHEMA_VERSION, SCHEMA_VERSION_FIELD, STATUS_FIELD, is_active
+from firebase.geo import geocode, location_fields, zone_label, zone_options
+from firebase.typeahead import get_typeahead, index_listing, record_query
+from firebase.similar_items import suggest_trades as suggest_similar_trades
+from firebase.dedup import check_duplicate, index_signature, remove_signature
+from firebase.percolator import notify_matches
 
 # Configure Streamlit page - MUST BE FIRST STREAMLIT COMMAND
 # Load environment variables
@@ -29,7 +49,7 @@ load_dotenv()
 
 # Initialize Firebase Admin SDK
 initialize_firebase()
-db = firestore.client()
+db = track_client(firestore.client())
 
 # Define categories
 CATEGORIES = {
@@ -68,14 +88,15 @@ if 'username' not in st.session_state:
     st.session_state.username = None
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = "Welcome"
-if 'editing_listing' not in st.session_state:
-    st.session_state.editing_listing = None
-if 'trade_item' not in st.session_state:
-    st.session_state.trade_item = None
+if 'editing_listing_id' not in st.session_state:
+    st.session_state.editing_listing_id = None
+if 'trade_item_id' not in st.session_state:
+    st.session_state.trade_item_id = None
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
-if 'cart_items' not in st.session_state:
-    st.session_state.cart_items = []
+# Session state holds item IDs, resolved with lookup_item() against the shared catalog
+if 'cart_item_ids' not in st.session_state:
+    st.session_state.cart_item_ids = []
 if 'search_query' not in st.session_state:
     st.session_state.search_query = ""
 
@@ -160,18 +181,20 @@ def login_user(email, password):
             return {'success': False, 'error': 'User profile not found'}
         
         user_data = user_doc.to_dict()
+        defer_update('users', user.uid, {'last_login': datetime.now(timezone.utc)})
         
         return {
             'success': True,
             'user_id': user_data['id'],
             'email': user_data['email'],
-            'username': user_data['username']
+            'username': user_data['username'],
+            'campus': campus_of(user_data)
         }
     except Exception as e:
         print(f"Error logging in user: {str(e)}")
         return {'success': False, 'error': str(e)}
 
-def register_user(email, password, username):
+def register_user(email, password, username, campus=None):
     """Register a new user in Firebase"""
     try:
         # Create user in Firebase Auth
@@ -186,7 +209,8 @@ def register_user(email, password, username):
             'id': user.uid,
             'email': email,
             'username': username,
-            'created_at': datetime.now(),
+            'campus': normalize_campus(campus),
+            'created_at': datetime.now(timezone.utc),
             'profile': {
                 'bio': '',
                 'location': '',
@@ -202,7 +226,8 @@ def register_user(email, password, username):
             'success': True,
             'user_id': user.uid,
             'email': email,
-            'username': username
+            'username': username,
+            'campus': user_data['campus']
         }
     except Exception as e:
         print(f"Error registering user: {str(e)}")
@@ -241,7 +266,10 @@ def get_all_items():
     """Get all active items from Firestore"""
     try:
         # Get all items from Firestore
-        items_ref = db.collection('items').where('active', '==', True).get()
+        items_ref = (db.collection('items')
+                     .where(STATUS_FIELD, '==', ACTIVE)
+                     .order_by('created_at', direction=firestore.Query.DESCENDING)
+                     .get())
         items = [item.to_dict() for item in items_ref]
         return items
     except Exception as e:
@@ -284,7 +312,7 @@ def propose_trade(from_user_id, to_user_id, offered_item_id, wanted_item_id, mes
         'offered_item_id': offered_item_id,
         'wanted_item_id': wanted_item_id,
         'status': 'pending',
-        'created_at': datetime.now(),
+        'created_at': datetime.now(timezone.utc),
         'message': message
     }
     MOCK_TRADE_PROPOSALS.append(new_proposal)
@@ -316,22 +344,52 @@ def semantic_search(query):
     """Mock semantic search function"""
     return get_mock_search_results(query)
 
+def current_campus():
+    """Campus partition the current session reads: the user's own, or every campus when asked"""
+    if st.session_state.get('all_campuses'):
+        return ALL_CAMPUSES
+    return st.session_state.get('campus')
+
+# Fragments (Streamlit 1.33+) rerun on a timer without rerunning the whole page
+_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+
+
+def live_fragment(func):
+    """Rerun func every INBOX_REFRESH seconds where fragments are supported"""
+    if _fragment is None or INBOX_REFRESH <= 0:
+        return func
+    return _fragment(run_every=INBOX_REFRESH)(func)
+
+
+def lookup_item(item_id):
+    """Resolve an item ID held in session state against the shared catalog, then Firestore"""
+    if not item_id:
+        return None
+    item = get_catalog(campus=current_campus()).get_item(item_id)
+    if item is None and db is not None:
+        doc = db.collection('items').document(item_id).get()
+        if doc.exists:
+            item = {**doc.to_dict(), 'id': doc.id}
+    return item or get_mock_item(item_id)
+
+def show_session_memory():
+    """Measure this session's state and list its largest keys in the sidebar"""
+    ctx = get_script_run_ctx()
+    report = observe(ctx.session_id if ctx else 'local', st.session_state)
+    totals = sessions_summary()
+    with st.sidebar.expander("Session memory"):
+        st.write(f"This session: {report['total_bytes'] / 1024:.1f} KiB")
+        st.write(f"{totals['sessions']} sessions: {totals['total_bytes'] / 1024:.1f} KiB total")
+        for key, size in report['keys'][:10]:
+            st.write(f"- `{key}`: {size / 1024:.1f} KiB")
+
 def find_potential_matches(item_id, user_id):
-    """Mock find potential matches function"""
-    item = get_mock_item(item_id)
-    if not item:
-        return []
-    
-    matches = []
-    for other_item in MOCK_ITEMS:
-        if other_item['user_id'] != user_id and other_item['id'] != item_id:
-            # Simple matching based on category and price range
-            if other_item['category'] == item['category']:
-                price_diff = abs(other_item['price'] - item['price'])
-                if price_diff <= item['price'] * 0.2:  # Within 20% price difference
-                    matches.append(other_item)
-    
-    return matches
+    """Tradeable listings most similar to an item, from the precomputed similar-items graph"""
+    return suggest_similar_trades(get_catalog(campus=current_campus()), item_id, user_id, limit=10)
+
+def suggest_trades(item_id, user_id):
+    """Suggested trades for an item with match scores and fairness flags"""
+    return suggest_similar_trades(get_catalog(campus=current_campus()), item_id, user_id)
 
 def find_trade_matches(item_id, user_id):
     """Mock find trade matches function"""
@@ -375,7 +433,7 @@ def create_item_card(item):
                 if 'user_id' not in st.session_state or not st.session_state.user_id:
                     st.warning("Please log in to propose a trade")
                 else:
-                    st.session_state.selected_item = item
+                    st.session_state.selected_item_id = item.get('id')
                     st.session_state.active_tab = "Propose Trade"
                     st.rerun()
 
@@ -412,12 +470,31 @@ def top_nav():
                                        label_visibility="collapsed")
             if search_query != st.session_state.search_query:
                 st.session_state.search_query = search_query
+                st.session_state.browse_query = search_query
                 st.session_state.active_tab = "Browse"
+                record_query(search_query, current_campus())
                 st.rerun()
+            
+            # Completions of what was typed, so a partial query becomes a good one in one click
+            if search_query.strip():
+                suggestions = [
+                    suggestion for suggestion in get_typeahead(get_catalog(campus=current_campus())).suggest(search_query, k=5)
+                    if suggestion.lower() != search_query.strip().lower()
+                ]
+                if suggestions:
+                    suggestion_cols = st.columns(len(suggestions))
+                    for i, suggestion in enumerate(suggestions):
+                        with suggestion_cols[i]:
+                            if st.button(suggestion, key=f"suggest_{i}", use_container_width=True):
+                                st.session_state.search_query = suggestion
+                                st.session_state.browse_query = suggestion
+                                st.session_state.active_tab = "Browse"
+                                record_query(suggestion, current_campus())
+                                st.rerun()
         
         with col2:
             # Cart button with item count
-            cart_count = len(st.session_state.cart_items)
+            cart_count = len(st.session_state.cart_item_ids)
             if st.button(f"🛒 Cart ({cart_count})", use_container_width=True):
                 st.session_state.active_tab = "Cart"
                 st.rerun()
@@ -432,6 +509,7 @@ def top_nav():
                         st.rerun()
                 with col3_2:
                     if st.button("Logout", use_container_width=True):
+                        stop_inbox(st.session_state.get('user_id'))
                         st.session_state.logged_in = False
                         st.session_state.username = ""
                         st.session_state.active_tab = "Browse"
@@ -481,7 +559,13 @@ def sidebar():
                 st.session_state.redirect_after_login = "My Listings"
             st.rerun()
             
-        if st.button("📋 Trade Proposals", use_container_width=True):
+        # Pending count comes from the live inbox, not a query
+        proposals_label = "📋 Trade Proposals"
+        if st.session_state.logged_in and st.session_state.get('user_id'):
+            pending = inbox_counts(st.session_state.user_id)['pending']
+            if pending:
+                proposals_label += f" ({pending})"
+        if st.button(proposals_label, key="nav_trade_proposals", use_container_width=True):
             if st.session_state.logged_in:
                 st.session_state.active_tab = "Trade Proposals"
             else:
@@ -494,12 +578,28 @@ def sidebar():
         categories = ["All", "Electronics", "Clothing", "Home Goods", "Tools", 
                      "Toys & Games", "Books", "Handmade", "Services", "Other"]
         
+        # Counts come from the in-memory catalog, so they cost no Firestore reads.
+        # They leave out the selected category: each category's count already
+        # ignores it, and "All" has to as well
+        try:
+            facets = get_catalog(campus=current_campus()).facet_counts(**{**browse_filters(), 'category': "All"})
+        except Exception as e:
+            print(f"Error computing category counts: {str(e)}")
+            facets = None
+        
         for category in categories:
-            if st.button(category, key=f"cat_{category}", use_container_width=True):
+            label = category
+            empty = False
+            if facets is not None:
+                count = facets['total'] if category == "All" else facets['category'].get(category, 0)
+                label = f"{category} ({count})"
+                empty = count == 0
+            if st.button(label, key=f"cat_{category}", use_container_width=True, disabled=empty):
                 st.session_state.active_tab = "Browse"
-                st.session_state.selected_category = category
+                st.session_state.browse_category = category
                 st.rerun()
 
+@timed_page
 def login_page():
     """Display login page"""
     st.title("Welcome to NextGen Marketplace")
@@ -519,6 +619,7 @@ def login_page():
                     st.session_state.user_id = result['user_id']
                     st.session_state.user_email = result['email']
                     st.session_state.username = result['username']
+                    st.session_state.campus = result['campus']
                     st.session_state.logged_in = True
                     st.session_state.active_tab = "Browse"
                     
@@ -539,15 +640,17 @@ def login_page():
         email = st.text_input("Email", key="register_email")
         password = st.text_input("Password", type="password", key="register_password")
         username = st.text_input("Username", key="register_username")
+        campus = st.selectbox("Campus", CAMPUSES, key="register_campus") if len(CAMPUSES) > 1 else CAMPUSES[0]
         
         if st.button("Register"):
             if email and password and username:
-                result = register_user(email, password, username)
+                result = register_user(email, password, username, campus)
                 if result['success']:
                     # Initialize session state
                     st.session_state.user_id = result['user_id']
                     st.session_state.user_email = result['email']
                     st.session_state.username = result['username']
+                    st.session_state.campus = result['campus']
                     st.session_state.logged_in = True
                     st.session_state.active_tab = "Browse"
                     
@@ -563,51 +666,111 @@ def login_page():
             else:
                 st.error("Please fill in all fields")
 
+def browse_filters():
+    """Catalog filters for the browse page, read from its widget state"""
+    availability = st.session_state.get('browse_availability', "Any")
+    min_price = st.session_state.get('browse_min_price', 0.0)
+    max_price = st.session_state.get('browse_max_price', 0.0)
+    
+    filters = {
+        'query': st.session_state.get('browse_query', ""),
+        'category': st.session_state.get('browse_category', "All"),
+        'condition': st.session_state.get('browse_conditions', []),
+        'for_trade': True if availability == "For Trade" else None,
+        'for_sale': True if availability == "For Sale" else None
+    }
+    if min_price > 0 or max_price > 0:
+        filters['min_price'] = min_price
+        filters['max_price'] = max_price if max_price > 0 else None
+    return filters
+
+@timed_page
 def browse_page():
     """Display the marketplace browse page"""
     st.title("Browse Marketplace")
     
-    # Initialize items in session state if not exists
-    if 'items' not in st.session_state:
-        st.session_state.items = []
+    # Listings come from the user's campus unless they opt into every campus
+    if CAMPUS_PARTITIONING:
+        st.checkbox("Show listings from all campuses", key="all_campuses")
     
-    # Get items from Firestore
+    # Filter the shared columnar catalog instead of re-reading every item
     try:
-        items_ref = db.collection('items')
-        items = items_ref.get()
-        items = [item.to_dict() for item in items]
-        st.session_state.items = items
+        catalog = get_catalog(campus=current_campus())
     except Exception as e:
         st.error(f"Error loading items: {str(e)}")
         print(f"Error loading items: {str(e)}")
-        items = []
+        return
+    
+    # Facet counts for the current filters, read from widget state so the
+    # widgets below can show them in their labels on this rerun
+    filters = browse_filters()
+    facets = catalog.facet_counts(**filters)
     
     # Search and filter options
-    col1, col2 = st.columns([2, 1])
+    categories = ["All"] + list(CATEGORIES.keys())
+    col1, col2, col3 = st.columns([2, 1, 1])
     with col1:
-        search_query = st.text_input("Search items", "")
+        st.text_input("Search items", key="browse_query")
     with col2:
-        category = st.selectbox(
+        st.selectbox(
             "Category",
-            ["All"] + list(CATEGORIES.keys()),
-            index=0
+            categories,
+            key="browse_category",
+            format_func=lambda c: c if c == "All" else f"{c} ({facets['category'].get(c, 0)})"
+        )
+    with col3:
+        sort = st.selectbox(
+            "Sort by",
+            list(SORT_OPTIONS.keys()) + ['distance'],
+            format_func=lambda key: SORT_OPTIONS.get(key, "Distance (with Near me)")
         )
     
-    # Filter items based on search and category
-    filtered_items = items
-    if search_query:
-        search_query = search_query.lower()
-        filtered_items = [
-            item for item in filtered_items
-            if search_query in item.get('name', '').lower() or
-               search_query in item.get('description', '').lower()
-        ]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.number_input("Min price ($)", min_value=0.0, step=5.0, key="browse_min_price")
+    with col2:
+        st.number_input("Max price ($)", min_value=0.0, step=5.0, key="browse_max_price",
+                        help="Leave at 0 for no upper limit")
+    with col3:
+        st.multiselect(
+            "Condition",
+            CONDITIONS,
+            key="browse_conditions",
+            format_func=lambda c: f"{c} ({facets['condition'].get(c, 0)})"
+        )
+    with col4:
+        st.selectbox(
+            "Availability",
+            ["Any"] + AVAILABILITY,
+            key="browse_availability",
+            format_func=lambda a: a if a == "Any" else f"{a} ({facets['availability'].get(a, 0)})"
+        )
     
-    if category != "All":
-        filtered_items = [
-            item for item in filtered_items
-            if item.get('category') == category
-        ]
+    price_counts = [f"{label}: {count}" for label, count in facets['price'].items() if count]
+    if price_counts:
+        st.caption("Price ranges — " + " · ".join(price_counts))
+    
+    # Proximity search against the catalog's spatial index
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        near_zone = st.selectbox(
+            "Near me",
+            [""] + zone_options(),
+            format_func=lambda code: "Anywhere" if not code else zone_label(code)
+        )
+    with col2:
+        radius_km = st.slider("Within (km)", min_value=0.5, max_value=20.0, value=2.0, step=0.5,
+                              disabled=not near_zone)
+    
+    distances = None
+    if near_zone:
+        lat, lon = geocode(near_zone)
+        rows, distances = catalog.nearby(lat, lon, radius_km=radius_km, sort=sort, **filters)
+    else:
+        # Only the rows on screen are sorted; "Show more" extends the page
+        matching = np.flatnonzero(catalog.combine(catalog.masks(**filters)))
+        rows = catalog.top_rows(matching, st.session_state.get('browse_shown', SEARCH_PAGE_SIZE), sort)
+    filtered_items = catalog.get_items(rows)
     
     # Display items in a grid
     if filtered_items:
@@ -621,26 +784,38 @@ def browse_page():
         for idx, item in enumerate(filtered_items):
             with cols[idx % num_cols]:
                 create_item_card(item)
+                if distances is not None:
+                    st.caption(f"📍 {distances[idx]:.1f} km away")
+        
+        if distances is None and len(rows) < len(matching):
+            if st.button(f"Show more ({len(matching) - len(rows)} remaining)"):
+                st.session_state.browse_shown = len(rows) + SEARCH_PAGE_SIZE
+                st.rerun()
     else:
         st.info("No items found. Try adjusting your search or filters.")
 
+@timed_page
 def item_detail_page():
-    if 'detail_item' not in st.session_state:
+    item = lookup_item(st.session_state.get('detail_item_id'))
+    if item is None:
         st.error("Item not found")
         return
     
-    item = st.session_state.detail_item
+    # Count one view per visit, not per rerun
+    if item.get('id') and st.session_state.get('last_viewed_item') != item['id']:
+        st.session_state.last_viewed_item = item['id']
+        record_view(item['id'])
     
     # Back button
     if st.button("← Back to Marketplace"):
         st.session_state.active_tab = "Browse"
         st.rerun()
     
-    st.header(item['title'])
+    st.header(item.get('name', 'Unnamed Item'))
     create_item_card(item)
     
     # Show potential trades
-    if 'barter_available' in item and item['barter_available']:
+    if item.get('for_trade', bool(item.get('trade_categories') or item.get('looking_for'))):
         st.subheader("Potential Trades")
         st.write("Our AI suggests these fair trades based on value and category:")
         
@@ -650,23 +825,25 @@ def item_detail_page():
             st.info("No matching trades found. Check back later or browse more items.")
         else:
             for trade_item in potential_trades:
-                with st.expander(f"Trade for: {trade_item['title']} (Match Score: {trade_item['match_score']:.2f})"):
+                with st.expander(f"Trade for: {trade_item.get('name', 'Unnamed Item')} (Match Score: {trade_item['match_score']:.2f})"):
                     col1, col2 = st.columns(2)
                     
                     with col1:
                         st.subheader("You Would Give:")
-                        st.write(f"**{item['title']}**")
-                        st.write(f"Value: ${item['price']}")
+                        st.write(f"**{item.get('name', 'Unnamed Item')}**")
+                        st.write(f"Value: ${item.get('price') or 0}")
                     
                     with col2:
                         st.subheader("You Would Receive:")
-                        st.write(f"**{trade_item['title']}**")
-                        st.write(f"Value: ${trade_item['price']}")
+                        st.write(f"**{trade_item.get('name', 'Unnamed Item')}**")
+                        st.write(f"Value: ${trade_item.get('price') or 0}")
                     
-                    trade_difference = abs(item['price'] - trade_item['price'])
+                    item_price = item.get('price') or 0
+                    trade_price = trade_item.get('price') or 0
+                    trade_difference = abs(item_price - trade_price)
                     
                     if trade_difference > 0:
-                        if item['price'] > trade_item['price']:
+                        if item_price > trade_price:
                             st.write(f"**Trade Gap:** You're giving ${trade_difference} more in value")
                         else:
                             st.write(f"**Trade Gap:** You're receiving ${trade_difference} more in value")
@@ -679,15 +856,16 @@ def item_detail_page():
                         st.warning("⚠️ This trade may not be completely fair")
                     
                     if st.button("View This Item", key=f"view_trade_{trade_item['id']}"):
-                        st.session_state.detail_item = trade_item
+                        st.session_state.detail_item_id = trade_item['id']
                         st.rerun()
                     
                     if st.button("Propose This Trade", key=f"propose_{trade_item['id']}"):
                         st.session_state.active_tab = "Propose Trade"
-                        st.session_state.trade_item = trade_item
-                        st.session_state.my_item = item
+                        st.session_state.trade_item_id = trade_item['id']
+                        st.session_state.my_item_id = item['id']
                         st.rerun()
 
+@timed_page
 def create_listing_page():
     """Create a new listing"""
     st.title("Create New Listing")
@@ -726,6 +904,11 @@ def create_listing_page():
             "Shipping Options",
             ["Local Pickup", "Standard Shipping", "Express Shipping"]
         )
+        pickup_zone = st.selectbox(
+            "Pickup Location",
+            [""] + zone_options(),
+            format_func=lambda code: "Not specified" if not code else zone_label(code)
+        )
         
         # Images
         st.subheader("Images")
@@ -749,12 +932,36 @@ def create_listing_page():
                         'trade_categories': trade_categories if pricing_type in ["Trade Only", "Both"] else [],
                         'trade_conditions': trade_conditions if pricing_type in ["Trade Only", "Both"] else [],
                         'shipping_options': shipping_options,
+                        **(location_fields(pickup_zone) if pickup_zone else {}),
                         'user_id': st.session_state.user_id,
                         'username': st.session_state.username,
-                        'active': True,
-                        'created_at': datetime.now()
+                        'campus': normalize_campus(st.session_state.get('campus')),
+                        STATUS_FIELD: ACTIVE,
+                        SCHEMA_VERSION_FIELD: ITEM_SCHEMA_VERSION,
+                        'created_at': datetime.now(timezone.utc),
+                        'updated_at': datetime.now(timezone.utc),
+                        'image_hashes': [hashlib.sha1(f.getvalue()).hexdigest() for f in uploaded_files or []]
                     }
                     
+                    # Flag probable reposts; submitting the same listing again posts it anyway
+                    duplicates = check_duplicate(new_item)
+                    listing_key = f"{name}\x1f{description}"
+                    if duplicates and st.session_state.get('duplicate_warning') != listing_key:
+                        st.session_state.duplicate_warning = listing_key
+                        catalog = get_catalog(campus=new_item['campus'])
+                        own = [d for d in duplicates if d['same_user']]
+                        st.warning(
+                            f"This looks like {'a listing you already posted' if own else 'an existing listing'}. "
+                            "Submit again to post it anyway."
+                        )
+                        for duplicate in duplicates[:5]:
+                            match = catalog.get_item(duplicate['item_id']) or {}
+                            owner = "you" if duplicate['same_user'] else match.get('username', 'another user')
+                            st.write(f"- {match.get('name', duplicate['item_id'])} by {owner} "
+                                     f"({duplicate['similarity']:.0%} similar)")
+                        return
+                    st.session_state.duplicate_warning = None
+                    
                     # Add to Firestore
                     doc_ref = db.collection('items').document()
                     new_item['id'] = doc_ref.id
@@ -780,11 +987,14 @@ def create_listing_page():
                     
                     # Save to Firestore
                     doc_ref.set(new_item)
+                    sync_summary(doc_ref.id, new_item)
+                    index_listing(new_item)
+                    index_signature(doc_ref.id, new_item)
+                    # Alert users whose wishlists this listing satisfies
+                    notify_matches(doc_ref.id, new_item)
                     
-                    # Update local state
-                    if 'items' not in st.session_state:
-                        st.session_state.items = []
-                    st.session_state.items.append(new_item)
+                    # Make the new listing visible to browse on the next rerun
+                    invalidate_catalog(new_item['campus'])
                     
                     st.success("Listing created successfully!")
                     st.rerun()
@@ -792,13 +1002,14 @@ def create_listing_page():
                     st.error(f"Error creating listing: {str(e)}")
                     print(f"Error creating listing: {str(e)}")
 
+@timed_page
 def my_listings_page():
     st.title("My Listings")
     
     try:
-        # Get user's listings from Firestore
-        user_listings = db.collection('items').where('user_id', '==', st.session_state.user_id).get()
-        user_listings = [item.to_dict() for item in user_listings]
+        # Get user's listings from Firestore, only the fields shown here
+        user_listings = fetch(db.collection('items').where('user_id', '==', st.session_state.user_id),
+                              LISTING_FIELDS)
         
         if not user_listings:
             st.info("You haven't created any listings yet.")
@@ -863,7 +1074,8 @@ def my_listings_page():
                         # Listing actions
                         st.write("**Actions:**")
                         if st.button("Edit", key=f"edit_{listing['id']}"):
-                            st.session_state.editing_listing = listing
+                            # The edit page resolves the full document from the ID
+                            st.session_state.editing_listing_id = listing['id']
                             st.session_state.active_tab = "Edit Listing"
                             st.rerun()
                         
@@ -871,7 +1083,12 @@ def my_listings_page():
                             if st.warning("Are you sure you want to delete this listing?"):
                                 try:
                                     # Delete from Firestore
+                                    discard('items', listing['id'])
                                     db.collection('items').document(listing['id']).delete()
+                                    record_deletion(listing['id'], listing)
+                                    delete_summary(listing['id'])
+                                    remove_signature(listing['id'], listing)
+                                    invalidate_catalog()
                                     # Remove from local state
                                     MOCK_ITEMS = [item for item in MOCK_ITEMS if item['id'] != listing['id']]
                                     st.success("Listing deleted successfully!")
@@ -880,18 +1097,22 @@ def my_listings_page():
                                     st.error(f"Error deleting listing: {str(e)}")
                         
                         # Toggle active status
-                        status = "Active" if listing.get('active', True) else "Inactive"
+                        status = "Active" if is_active(listing) else "Inactive"
+                        new_status = INACTIVE if status == "Active" else ACTIVE
                         if st.button(f"Mark as {'Inactive' if status == 'Active' else 'Active'}", 
                                    key=f"toggle_{listing['id']}"):
                             try:
                                 # Update in Firestore
                                 db.collection('items').document(listing['id']).update({
-                                    'active': not listing.get('active', True)
+                                    STATUS_FIELD: new_status,
+                                    'updated_at': datetime.now(timezone.utc)
                                 })
+                                sync_summary(listing['id'], {STATUS_FIELD: new_status}, partial=True)
+                                invalidate_catalog()
                                 # Update local state
                                 for item in MOCK_ITEMS:
                                     if item['id'] == listing['id']:
-                                        item['active'] = not item.get('active', True)
+                                        item[STATUS_FIELD] = new_status
                                 st.success(f"Listing marked as {'Inactive' if status == 'Active' else 'Active'}")
                                 st.rerun()
                             except Exception as e:
@@ -900,83 +1121,86 @@ def my_listings_page():
         st.error(f"Error loading your listings: {str(e)}")
         print(f"Error loading listings: {str(e)}")
 
+@live_fragment
+def proposal_inbox():
+    """Trade offers for the user's items, served from their live inbox"""
+    inbox = get_inbox(st.session_state.user_id)
+    for proposal in inbox.take_unseen():
+        st.toast(f"New trade offer from {proposal.get('proposer_name', 'someone')} for {proposal.get('item_name', 'your item')}")
+    proposals = inbox.listing()
+    
+    # Display trade proposals for user's items
+    st.subheader("Trade Offers for Your Items")
+    if not proposals:
+        st.info("No trade proposals yet")
+    else:
+        for proposal in proposals:
+            with st.expander(f"Trade Offer for {proposal['item_name']}", expanded=True):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write("**Offered By:**")
+                    st.write(f"User: {proposal['proposer_name']}")
+                    st.write(f"Item: {proposal['proposed_item_name']}")
+                    st.write(f"Category: {proposal['proposed_item_category']}")
+                    st.write(f"Condition: {proposal['proposed_item_condition']}")
+                    st.write(f"Price: ${proposal['proposed_item_price']}")
+                    st.write(f"Status: {proposal['status']}")
+                    st.write(f"Proposed: {proposal['created_at'].strftime('%Y-%m-%d %H:%M')}")
+                    
+                    # Display the message
+                    st.write("**Message:**")
+                    st.write(proposal['message'])
+                
+                with col2:
+                    if proposal['status'] == 'pending':
+                        st.write("**Actions:**")
+                        if st.button("Accept", key=f"accept_{proposal['id']}"):
+                            # The inbox reflects the change before the listener delivers it
+                            result = update_proposal_status(st.session_state.user_id, proposal['id'], 'accepted')
+                            if result['success']:
+                                st.success("Trade proposal accepted!")
+                                st.rerun()
+                            else:
+                                st.error(f"Error accepting proposal: {result['error']}")
+                                print(f"Error accepting proposal: {result['error']}")
+                        
+                        if st.button("Reject", key=f"reject_{proposal['id']}"):
+                            result = update_proposal_status(st.session_state.user_id, proposal['id'], 'rejected')
+                            if result['success']:
+                                st.success("Trade proposal rejected!")
+                                st.rerun()
+                            else:
+                                st.error(f"Error rejecting proposal: {result['error']}")
+                                print(f"Error rejecting proposal: {result['error']}")
+
+@timed_page
 def trade_proposals_page():
     """Display trade proposals and allow sending new proposals"""
     st.title("Trade Proposals")
     
     # Get current user's items
     try:
-        user_items = db.collection('items').where('user_id', '==', st.session_state.user_id).get()
-        user_items = [item.to_dict() for item in user_items]
+        user_items = get_item_summaries(user_id=st.session_state.user_id)
         
         if not user_items:
             st.info("You don't have any items listed yet.")
             return
         
-        # Get all trade proposals for user's items
-        proposals = db.collection('trade_proposals').where('item_owner_id', '==', st.session_state.user_id).get()
-        proposals = [proposal.to_dict() for proposal in proposals]
-        
-        # Display trade proposals for user's items
-        st.subheader("Trade Offers for Your Items")
-        if not proposals:
-            st.info("No trade proposals yet")
-        else:
-            for proposal in proposals:
-                with st.expander(f"Trade Offer for {proposal['item_name']}", expanded=True):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write("**Offered By:**")
-                        st.write(f"User: {proposal['proposer_name']}")
-                        st.write(f"Item: {proposal['proposed_item_name']}")
-                        st.write(f"Category: {proposal['proposed_item_category']}")
-                        st.write(f"Condition: {proposal['proposed_item_condition']}")
-                        st.write(f"Price: ${proposal['proposed_item_price']}")
-                        st.write(f"Status: {proposal['status']}")
-                        st.write(f"Proposed: {proposal['created_at'].strftime('%Y-%m-%d %H:%M')}")
-                        
-                        # Display the message
-                        st.write("**Message:**")
-                        st.write(proposal['message'])
-                    
-                    with col2:
-                        if proposal['status'] == 'pending':
-                            st.write("**Actions:**")
-                            if st.button("Accept", key=f"accept_{proposal['id']}"):
-                                try:
-                                    # Update proposal status in Firestore
-                                    db.collection('trade_proposals').document(proposal['id']).update({
-                                        'status': 'accepted',
-                                        'accepted_at': datetime.now()
-                                    })
-                                    st.success("Trade proposal accepted!")
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"Error accepting proposal: {str(e)}")
-                                    print(f"Error accepting proposal: {str(e)}")
-                            
-                            if st.button("Reject", key=f"reject_{proposal['id']}"):
-                                try:
-                                    # Update proposal status in Firestore
-                                    db.collection('trade_proposals').document(proposal['id']).update({
-                                        'status': 'rejected',
-                                        'rejected_at': datetime.now()
-                                    })
-                                    st.success("Trade proposal rejected!")
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"Error rejecting proposal: {str(e)}")
-                                    print(f"Error rejecting proposal: {str(e)}")
+        # Offers come from a snapshot listener, so reruns don't re-read the collection
+        proposal_inbox()
         
         # Section to send new trade proposals
         st.subheader("Send a Trade Proposal")
         
-        # Get all active items from other users
-        all_items = db.collection('items').where('active', '==', True).get()
-        all_items = [item.to_dict() for item in all_items]
-        
-        other_items = [item for item in all_items if item['user_id'] != st.session_state.user_id]
+        # Active items from other users on this campus, from the in-memory catalog;
+        # the pickers only need summaries
+        catalog = get_catalog(campus=current_campus())
+        other_items = [
+            {**summarize(item), 'id': item['id']}
+            for item in catalog.get_items(catalog.filter())
+            if item.get('user_id') != st.session_state.user_id
+        ]
         
         if not other_items:
             st.info("No items available to trade")
@@ -1065,7 +1289,7 @@ def trade_proposals_page():
                         'item_owner_id': target_item['user_id'],
                         'message': message,
                         'status': 'pending',
-                        'created_at': datetime.now()
+                        'created_at': datetime.now(timezone.utc)
                     }
                     
                     # Add to trade_proposals collection
@@ -1081,15 +1305,15 @@ def trade_proposals_page():
         st.error(f"Error loading items: {str(e)}")
         print(f"Error loading items: {str(e)}")
 
+@timed_page
 def propose_trade_page():
-    if 'selected_item' not in st.session_state:
+    target_item = lookup_item(st.session_state.get('selected_item_id'))
+    if target_item is None:
         st.error("No item selected for trade")
         st.session_state.active_tab = "Browse"
         st.rerun()
         return
     
-    target_item = st.session_state.selected_item
-    
     st.header("Propose a Trade")
     
     # Show the item we want
@@ -1103,8 +1327,7 @@ def propose_trade_page():
     
     # Get user's items from Firebase
     try:
-        user_items = db.collection('items').where('user_id', '==', st.session_state.user_id).get()
-        user_items = [item.to_dict() for item in user_items]
+        user_items = get_item_summaries(user_id=st.session_state.user_id)
         
         if not user_items:
             st.info("You don't have any items listed. Create a listing first!")
@@ -1199,7 +1422,7 @@ def propose_trade_page():
                         'item_owner_id': target_item['user_id'],
                         'message': message,
                         'status': 'pending',
-                        'created_at': datetime.now()
+                        'created_at': datetime.now(timezone.utc)
                     }
                     
                     # Add to trade_proposals collection
@@ -1216,38 +1439,40 @@ def propose_trade_page():
         # Cancel
         if st.button("Cancel", use_container_width=True):
             st.session_state.active_tab = "Browse"
-            if 'selected_item' in st.session_state:
-                del st.session_state.selected_item
+            if 'selected_item_id' in st.session_state:
+                del st.session_state.selected_item_id
             st.rerun()
             
     except Exception as e:
         st.error(f"Error loading your items: {str(e)}")
         
 
+@timed_page
 def cart_page():
     st.header("Shopping Cart")
     
-    if not st.session_state.cart_items:
+    cart_items = [item for item in map(lookup_item, st.session_state.cart_item_ids) if item is not None]
+    if not cart_items:
         st.info("Your cart is empty")
         if st.button("Browse Marketplace"):
             st.session_state.active_tab = "Browse"
             st.rerun()
     else:
         total = 0
-        for item in st.session_state.cart_items:
+        for item in cart_items:
             st.divider()
             col1, col2, col3 = st.columns([3, 1, 1])
             
             with col1:
-                st.write(f"**{item['title']}**")
-                st.write(f"${item['price']}")
+                st.write(f"**{item.get('title') or item.get('name', 'Unnamed Item')}**")
+                st.write(f"${item.get('price') or 0}")
             
             with col2:
                 if st.button("Remove", key=f"remove_{item['id']}"):
-                    st.session_state.cart_items.remove(item)
+                    st.session_state.cart_item_ids.remove(item['id'])
                     st.rerun()
             
-            total += item['price']
+            total += item.get('price') or 0
         
         st.divider()
         st.write(f"**Total: ${total}**")
@@ -1255,9 +1480,10 @@ def cart_page():
         if st.button("Proceed to Checkout", use_container_width=True):
             st.success("🎉 Order placed successfully!")
             st.balloons()
-            st.session_state.cart_items = []
+            st.session_state.cart_item_ids = []
             st.rerun()
 
+@timed_page
 def profile_page():
     st.header("My Profile")
     
@@ -1296,14 +1522,16 @@ def profile_page():
         if st.button("Save Changes"):
             st.success("Profile updated successfully!")
 
+@timed_page
 def edit_listing_page():
-    if 'editing_listing' not in st.session_state:
+    # The form needs every field, not the projection shown on My Listings
+    listing = lookup_item(st.session_state.get('editing_listing_id'))
+    if listing is None:
         st.error("No listing selected for editing")
         st.session_state.active_tab = "My Listings"
         st.rerun()
         return
     
-    listing = st.session_state.editing_listing
     st.title("Edit Listing")
     
     with st.form("edit_listing_form"):
@@ -1418,7 +1646,7 @@ def edit_listing_page():
                     'condition': condition,
                     'for_sale': for_sale,
                     'for_trade': for_trade,
-                    'updated_at': datetime.now()
+                    'updated_at': datetime.now(timezone.utc)
                 }
                 
                 # Add optional fields if provided
@@ -1458,7 +1686,7 @@ def edit_listing_page():
                 result = update_item(listing['id'], st.session_state.user_id, updated_listing)
                 if result['success']:
                     st.success("Listing updated successfully!")
-                    del st.session_state.editing_listing
+                    st.session_state.editing_listing_id = None
                     st.session_state.active_tab = "My Listings"
                     st.rerun()
                 else:
@@ -1466,10 +1694,23 @@ def edit_listing_page():
 
 # Main App Logic
 def main():
-    top_nav()
-    header()
-    sidebar()
-    
+    # Count Firestore reads/writes for this rerun and enforce the read budget
+    try:
+        with request_scope(f"page.{st.session_state.active_tab}"):
+            if st.session_state.logged_in and st.session_state.get('user_id'):
+                record_activity(st.session_state.user_id)
+            top_nav()
+            header()
+            sidebar()
+            render_active_tab()
+            if SESSION_MEMORY_REPORT:
+                show_session_memory()
+    except ReadBudgetExceeded as e:
+        # A BaseException, so it would otherwise end Streamlit's script runner
+        print(f"Error rendering page: {str(e)}")
+        st.error("This page needs more data than it is allowed to load. Try narrowing your filters.")
+
+def render_active_tab():
     # Render the active tab
     if st.session_state.active_tab == "Login":
         login_page()
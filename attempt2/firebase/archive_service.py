@@ -0,0 +1,292 @@
+# archive_service.py - Move inactive items and closed trades out of the hot collections
+#
+# Items that have been inactive, and trades and trade proposals that have been
+# closed, for ARCHIVE_AFTER_DAYS are moved into <collection>_archive (or into
+# snapshot files under ARCHIVE_DIR) so browse, search and matching scans only
+# read live documents. Archived documents stay retrievable and restorable.
+#
+#   python -m firebase.archive_service run --dry-run
+#   python -m firebase.archive_service run --days 180 --collections items
+#   python -m firebase.archive_service get items ITEM_ID
+#   python -m firebase.archive_service restore items ITEM_ID
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .firebase_config import db
+from .projections import delete_summary, sync_summary
+from .replica import DELETED_FIELD, TOMBSTONE_COLLECTION, record_deletion
+from .schema import is_active
+from .write_buffer import discard
+from .snapshot import load_snapshot, read_manifest, write_collection, write_manifest
+
+# Days a document must have been inactive or closed before it is archived
+ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+# Archive into snapshot files under this directory instead of *_archive collections
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR')
+ARCHIVE_SUFFIX = '_archive'
+ARCHIVED_AT = 'archived_at'
+# Trade and proposal statuses that will not change again
+CLOSED_STATUSES = ('accepted', 'rejected', 'completed', 'cancelled')
+# Documents per batch; archiving an item costs up to four writes (copy,
+# delete, tombstone, summary) and Firestore allows 500 per batch
+BATCH_SIZE = 100
+
+# Timestamps a document may carry, any of which counts as activity
+_ACTIVITY_FIELDS = ('updated_at', 'accepted_at', 'rejected_at', 'created_at')
+
+
+def _item_archivable(item: Dict) -> bool:
+    return not is_active(item) or bool(item.get(DELETED_FIELD))
+
+
+def _closed(document: Dict) -> bool:
+    return document.get('status') in CLOSED_STATUSES
+
+
+# Which documents of each collection may be archived once they are old enough
+POLICIES = {
+    'items': _item_archivable,
+    'trades': _closed,
+    'trade_proposals': _closed,
+}
+
+
+def archive_collection(collection: str) -> str:
+    """Name of the Firestore collection a collection archives into"""
+    return f"{collection}{ARCHIVE_SUFFIX}"
+
+
+def _utc(value) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _last_activity(document: Dict) -> Optional[datetime]:
+    stamps = [_utc(document.get(field)) for field in _ACTIVITY_FIELDS]
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+def find_archivable(collection: str, days: Optional[float] = None) -> Iterator[Tuple[str, Dict]]:
+    """
+    Documents of a collection that are due for archiving
+
+    Only documents last touched before the cutoff are read: those with an
+    updated_at before it, and legacy documents without updated_at whose
+    created_at is before it.
+
+    Args:
+        collection (str): One of POLICIES
+        days (float): Minimum age in days; defaults to ARCHIVE_AFTER_DAYS
+
+    Yields:
+        tuple: (document ID, document dict)
+    """
+    policy = POLICIES[collection]
+    cutoff = datetime.now(timezone.utc) - timedelta(days=ARCHIVE_AFTER_DAYS if days is None else days)
+    seen = set()
+    for field in ('updated_at', 'created_at'):
+        for doc in db.collection(collection).where(field, '<', cutoff).stream():
+            if doc.id in seen:
+                continue
+            seen.add(doc.id)
+            data = doc.to_dict()
+            if field == 'created_at' and data.get('updated_at') is not None:
+                continue
+            last = _last_activity(data)
+            if (last is None or last < cutoff) and policy(data):
+                yield doc.id, data
+
+
+def _commit_moves(collection: str, documents: List[Tuple[str, Dict]], to_firestore: bool):
+    """Copy documents into the archive collection (unless archived to files) and delete them"""
+    source = db.collection(collection)
+    archive = db.collection(archive_collection(collection))
+    archived_at = datetime.now(timezone.utc)
+    for start in range(0, len(documents), BATCH_SIZE):
+        batch = db.batch()
+        for doc_id, data in documents[start:start + BATCH_SIZE]:
+            if to_firestore:
+                batch.set(archive.document(doc_id), {**data, ARCHIVED_AT: archived_at})
+            discard(collection, doc_id)
+            batch.delete(source.document(doc_id))
+            if collection == 'items':
+                record_deletion(doc_id, data, batch=batch)
+                delete_summary(doc_id, batch=batch)
+        batch.commit()
+
+
+def archive(collections: Optional[List[str]] = None, days: Optional[float] = None,
+            directory: Optional[str] = None, file_format: str = 'jsonl',
+            dry_run: bool = False) -> Dict[str, int]:
+    """
+    Move documents due for archiving out of their hot collections
+
+    With a directory, each run writes a snapshot (see snapshot.py) into a new
+    timestamped subdirectory before deleting anything; otherwise documents
+    are copied into <collection>_archive in the same batch that deletes them.
+
+    Args:
+        collections (list): Collections to archive; defaults to every one in POLICIES
+        days (float): Minimum age in days; defaults to ARCHIVE_AFTER_DAYS
+        directory (str): Archive to snapshot files here; defaults to ARCHIVE_DIR
+        file_format (str): Snapshot format for file archives
+        dry_run (bool): Count documents without moving them
+
+    Returns:
+        dict: Documents archived (or due, on a dry run) per collection
+    """
+    directory = directory or ARCHIVE_DIR
+    due = {name: list(find_archivable(name, days)) for name in collections or POLICIES}
+    counts = {name: len(documents) for name, documents in due.items()}
+    if dry_run:
+        return counts
+
+    if directory:
+        run_dir = os.path.join(directory, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ'))
+        os.makedirs(run_dir, exist_ok=True)
+        entries = {}
+        for name, documents in due.items():
+            entries[name] = write_collection(run_dir, name, [doc_id for doc_id, _ in documents],
+                                             [data for _, data in documents], file_format)
+        # The files are complete before anything is deleted from Firestore
+        write_manifest(run_dir, file_format, entries)
+
+    for name, documents in due.items():
+        _commit_moves(name, documents, to_firestore=not directory)
+    return counts
+
+
+def _archived_from_files(collection: str, doc_id: str, directory: str) -> Optional[Dict]:
+    if not os.path.isdir(directory):
+        return None
+    # Newest run first, so a document archived twice resolves to its latest copy
+    for run in sorted(os.listdir(directory), reverse=True):
+        run_dir = os.path.join(directory, run)
+        try:
+            if collection not in read_manifest(run_dir)['collections']:
+                continue
+            for document in load_snapshot(run_dir, collection):
+                if document['id'] == doc_id:
+                    return document
+        except Exception as e:
+            print(f"Error reading archive {run_dir}: {str(e)}")
+    return None
+
+
+def get_archived(collection: str, doc_id: str, directory: Optional[str] = None) -> Optional[Dict]:
+    """
+    Look up an archived document
+
+    Args:
+        collection (str): Hot collection the document was archived from
+        doc_id (str): Document ID
+        directory (str): File archive to search; defaults to ARCHIVE_DIR
+
+    Returns:
+        dict: The archived document including 'id', or None if it isn't archived
+    """
+    directory = directory or ARCHIVE_DIR
+    try:
+        doc = db.collection(archive_collection(collection)).document(doc_id).get()
+        if doc.exists:
+            return {**doc.to_dict(), 'id': doc.id}
+    except Exception as e:
+        print(f"Error reading archived {collection} {doc_id}: {str(e)}")
+    if directory:
+        return _archived_from_files(collection, doc_id, directory)
+    return None
+
+
+def restore(collection: str, doc_id: str, directory: Optional[str] = None) -> Dict:
+    """
+    Move an archived document back into its hot collection
+
+    The document is stamped with a fresh updated_at so catalog replicas pick
+    it up. Copies in archive files are left in place; the live document takes
+    precedence over them.
+
+    Args:
+        collection (str): Hot collection the document was archived from
+        doc_id (str): Document ID
+        directory (str): File archive to search; defaults to ARCHIVE_DIR
+
+    Returns:
+        dict: Result with success status or error message
+    """
+    try:
+        document = get_archived(collection, doc_id, directory)
+        if document is None:
+            return {
+                'success': False,
+                'error': f'No archived {collection} document {doc_id}'
+            }
+
+        data = {k: v for k, v in document.items() if k not in ('id', ARCHIVED_AT)}
+        data['updated_at'] = datetime.now(timezone.utc)
+        batch = db.batch()
+        batch.set(db.collection(collection).document(doc_id), data)
+        batch.delete(db.collection(archive_collection(collection)).document(doc_id))
+        if collection == 'items':
+            batch.delete(db.collection(TOMBSTONE_COLLECTION).document(doc_id))
+            sync_summary(doc_id, data, batch=batch)
+        batch.commit()
+
+        return {
+            'success': True
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive inactive items and closed trades")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="archive documents that are due")
+    run_parser.add_argument('--days', type=float, default=None,
+                            help=f"minimum age in days (default {ARCHIVE_AFTER_DAYS:g})")
+    run_parser.add_argument('--collections', nargs='+', choices=list(POLICIES), default=None)
+    run_parser.add_argument('--to-dir', default=None,
+                            help="archive to snapshot files in this directory instead of *_archive collections")
+    run_parser.add_argument('--format', default='jsonl', choices=['parquet', 'arrow', 'jsonl'])
+    run_parser.add_argument('--dry-run', action='store_true', help="count documents without moving them")
+
+    for name, help_text in (('get', "print an archived document"), ('restore', "move a document back")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('collection', choices=list(POLICIES))
+        command.add_argument('doc_id')
+        command.add_argument('--dir', default=None, help="file archive to search")
+
+    args = parser.parse_args()
+    if db is None:
+        print("Error: Firestore is not initialized")
+        raise SystemExit(1)
+
+    if args.command == 'run':
+        counts = archive(args.collections, args.days, args.to_dir, args.format, args.dry_run)
+        verb = "Would archive" if args.dry_run else "Archived"
+        print(f"{verb} " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+    elif args.command == 'get':
+        document = get_archived(args.collection, args.doc_id, args.dir)
+        if document is None:
+            print(f"No archived {args.collection} document {args.doc_id}")
+            raise SystemExit(1)
+        for field, value in sorted(document.items()):
+            print(f"{field}: {value}")
+    else:
+        result = restore(args.collection, args.doc_id, args.dir)
+        if not result['success']:
+            print(f"Error: {result['error']}")
+            raise SystemExit(1)
+        print(f"Restored {args.collection}/{args.doc_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 # auth_service.py - Authentication related functions
 import streamlit as st
 from .firebase_config import db
+from .campus import campus_of, normalize_campus, set_user_campus
 import firebase_admin
 from firebase_admin import auth
 import datetime
 import re
 from typing import Dict, Optional, Any
+from .write_buffer import defer_update, discard
+from .token_cache import CertificateRefresher, TokenCache, verify_cached
+from .metrics import instrument_module
+from .firestore_tracker import track_module
 
 def validate_email(email: str) -> bool:
     """Validate email format"""
@@ -41,7 +46,7 @@ def get_next_user_id() -> str:
         print(f"Error getting next user ID: {str(e)}")
         return "user1"  # Default to user1 if there's an error
 
-def register_user(email: str, password: str, username: str) -> Dict:
+def register_user(email: str, password: str, username: str, campus: Optional[str] = None) -> Dict:
     """
     Register a new user with Firebase Authentication and create Firestore profile
     
@@ -49,6 +54,7 @@ def register_user(email: str, password: str, username: str) -> Dict:
         email (str): User's email
         password (str): User's password
         username (str): User's display name
+        campus (str): User's campus; defaults to DEFAULT_CAMPUS
         
     Returns:
         dict: Result with success status and user data or error
@@ -93,20 +99,23 @@ def register_user(email: str, password: str, username: str) -> Dict:
             'user_id': user_id,
             'email': email,
             'username': username,
-            'created_at': datetime.datetime.now(),
-            'last_login': datetime.datetime.now(),
+            'created_at': datetime.datetime.now(datetime.timezone.utc),
+            'last_login': datetime.datetime.now(datetime.timezone.utc),
             'listed_items': [],
             'wishlist': [],
-            'is_active': True
+            'is_active': True,
+            'campus': normalize_campus(campus)
         }
         
         db.collection('users').document(user_id).set(user_data)
+        set_user_campus(user_id, user_data['campus'])
         
         return {
             'success': True,
             'user_id': user_id,
             'email': email,
-            'username': username
+            'username': username,
+            'campus': user_data['campus']
         }
     except Exception as e:
         return {'success': False, 'error': str(e)}
@@ -201,16 +210,31 @@ def delete_user(user_id: str) -> Dict:
         auth.delete_user(user_id)
         
         # Delete user profile from Firestore
+        discard('users', user_id)
         db.collection('users').document(user_id).delete()
         
         return {'success': True}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
+# Verified ID tokens by hash, so reruns of an authenticated session skip verification
+_token_cache = TokenCache()
+
+def _refresh_certificates():
+    # Refetch through the verifier's own caching transport, bypassing its
+    # cache, so the fresh certificates replace the cached ones
+    verifier = auth._get_client(firebase_admin.get_app())._token_verifier
+    verifier.request(verifier.id_token_verifier.cert_url, headers={'Cache-Control': 'no-cache'})
+
+_cert_refresher = CertificateRefresher(_refresh_certificates)
+
 def verify_id_token(id_token: str) -> Dict:
     """
     Verify an ID token
     
+    Tokens already verified are answered from a cache until shortly before
+    they expire.
+    
     Args:
         id_token (str): ID token to verify
         
@@ -221,7 +245,8 @@ def verify_id_token(id_token: str) -> Dict:
         if db is None:
             return {'success': False, 'error': 'Database not initialized'}
             
-        decoded_token = auth.verify_id_token(id_token)
+        _cert_refresher.start()
+        decoded_token = verify_cached(_token_cache, id_token, auth.verify_id_token)
         return {'success': True, 'token': decoded_token}
     except Exception as e:
         return {'success': False, 'error': str(e)}
@@ -310,16 +335,17 @@ def login_user(email: str, password: str) -> Dict:
             
         user_data = user_doc.to_dict()
         
-        # Update last login time
-        db.collection('users').document(user.uid).update({
-            'last_login': datetime.datetime.now()
-        })
+        # Update last login time without holding up the login
+        defer_update('users', user.uid, {'last_login': datetime.datetime.now(datetime.timezone.utc)})
+        
+        set_user_campus(user.uid, campus_of(user_data))
         
         return {
             'success': True,
             'user_id': user.uid,
             'email': user.email,
-            'username': user_data.get('username', '')
+            'username': user_data.get('username', ''),
+            'campus': campus_of(user_data)
         }
         
     except Exception as e:
@@ -351,4 +377,7 @@ def get_user_profile(user_id):
             
         return {'success': True, 'data': user_doc.to_dict()}
     except Exception as e:
-        return {'success': False, 'error': str(e)}
\ No newline at end of file
+        return {'success': False, 'error': str(e)}
+
+instrument_module(__name__)
+track_module(__name__)
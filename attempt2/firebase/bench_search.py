@@ -0,0 +1,149 @@
+# bench_search.py - Throughput and tail-latency benchmark for Gemini-backed search and matching
+#
+#   python -m firebase.bench_search --requests 500 --concurrency 8
+#   LOCAL_MODEL_ERROR_RATE=0.2 python -m firebase.bench_search --kind wishlist
+#
+# Runs against the deterministic local model (GEMINI_BACKEND=local) unless
+# GEMINI_BACKEND is set explicitly, so no API key or quota is needed; gemini
+# reads the setting on first use, after the default below is in place.
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+os.environ.setdefault('GEMINI_BACKEND', 'local')
+
+from . import gemini  # noqa: E402
+from .catalog import is_active, load_items  # noqa: E402
+from .search_service import match_wishlist, rank_search_results  # noqa: E402
+
+# Gemini counters that mean the caller got FALLBACK_RESPONSE
+FALLBACK_STATS = ('failures', 'short_circuited', 'concurrency_rejected', 'deadline_exceeded')
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _queries(items: List[Dict], count: int, seed: int) -> List[str]:
+    """Short queries taken from listing names, so most of them have real matches"""
+    rng = random.Random(seed)
+    names = [item.get('name', '') for item in items if item.get('name')]
+    queries = []
+    for _ in range(count):
+        words = rng.choice(names).split()
+        queries.append(' '.join(words[:rng.randint(1, min(2, len(words)))]))
+    return queries
+
+
+def run(items: List[Dict], kind: str, requests: int, concurrency: int, prompt_items: int,
+        seed: int) -> Dict:
+    """
+    Send requests through search_service concurrently and time each one end to end
+
+    Args:
+        items (list): Active item dicts
+        kind (str): 'search' (rank_search_results) or 'wishlist' (match_wishlist)
+        requests (int): Total requests
+        concurrency (int): Requests in flight at once
+        prompt_items (int): Items included in each prompt
+        seed (int): Seed for query and item sampling
+
+    Returns:
+        dict: Throughput, latency percentiles in ms, and fallback counters
+    """
+    rng = random.Random(seed)
+    queries = _queries(items, requests, seed)
+    samples = [rng.sample(items, min(prompt_items, len(items))) for _ in range(requests)]
+    before = gemini.get_client_stats()
+
+    def one(i):
+        started = time.perf_counter()
+        if kind == 'search':
+            results = rank_search_results(queries[i], samples[i])
+        else:
+            results = match_wishlist('bench-user', [{'item_name': queries[i]}], samples[i])
+        return time.perf_counter() - started, len(results)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    after = gemini.get_client_stats()
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+    counters = {stat: after[stat] - before[stat] for stat in before if isinstance(before[stat], int)}
+    report = {
+        'kind': kind,
+        'backend': gemini.backend(),
+        'requests': requests,
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            'p50': round(_percentile(latencies, 0.50), 1),
+            'p95': round(_percentile(latencies, 0.95), 1),
+            'p99': round(_percentile(latencies, 0.99), 1),
+            'max': round(latencies[-1], 1) if latencies else 0.0
+        },
+        'empty_results': sum(1 for _, count in outcomes if count == 0),
+        'fallbacks': sum(counters.get(stat, 0) for stat in FALLBACK_STATS),
+        'gemini': counters,
+        'breaker_state': after['breaker_state']
+    }
+    if gemini.backend() == 'local':
+        model_stats = gemini.local_model.get_stats()
+        report['local_model'] = model_stats
+        # Malformed output reaches the caller as a "success" but still falls back
+        report['fallbacks'] += model_stats['malformed']
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search and wishlist matching through the Gemini client")
+    parser.add_argument('--kind', choices=['search', 'wishlist'], default='search')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--prompt-items', type=int, default=100, help="items sampled into each prompt")
+    parser.add_argument('--snapshot', help="read items from this snapshot directory instead of the catalog source")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        from .snapshot import load_snapshot
+        items = load_snapshot(args.snapshot, 'items')
+    else:
+        items = load_items()
+    items = [item for item in items if is_active(item)]
+    if not items:
+        print("Error: no active items to benchmark against")
+        raise SystemExit(1)
+
+    if gemini.backend() == 'local':
+        gemini.local_model.reset()
+    report = run(items, args.kind, args.requests, args.concurrency, args.prompt_items, args.seed)
+
+    latency = report['latency_ms']
+    print(f"{report['requests']} {report['kind']} requests ({report['backend']} backend, "
+          f"concurrency {report['concurrency']}) in {report['elapsed_s']}s: {report['throughput_rps']} req/s")
+    print(f"Latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"Fallbacks: {report['fallbacks']}  retries: {report['gemini'].get('retries', 0)}  "
+          f"breaker: {report['breaker_state']}")
+    if 'local_model' in report:
+        print(f"Local model: {report['local_model']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
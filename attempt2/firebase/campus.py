@@ -0,0 +1,191 @@
+# campus.py - Campus partitioning of users and listings
+#
+# Users and items carry a 'campus' partition key. With CAMPUS_PARTITIONING=1
+# the catalog and everything built from it (typeahead, similar items,
+# duplicate detection, matching) is kept per campus, and queries only see the
+# caller's campus unless they explicitly ask for ALL_CAMPUSES.
+#
+# Documents written before partitioning have no campus; stamp them first:
+#   python -m firebase.campus backfill
+import argparse
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+from .firebase_config import db
+
+CAMPUS_FIELD = 'campus'
+# Partition value meaning "every campus" (cross-partition mode)
+ALL_CAMPUSES = '*'
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+_NON_SLUG = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_campus(value) -> str:
+    """
+    Canonical partition key for a campus name, e.g. "North Campus" -> "north_campus"
+
+    Args:
+        value (str): Campus name or key; empty values mean DEFAULT_CAMPUS
+
+    Returns:
+        str: Partition key
+    """
+    if value == ALL_CAMPUSES:
+        return ALL_CAMPUSES
+    slug = _NON_SLUG.sub('_', str(value or '').lower()).strip('_')
+    return slug or DEFAULT_CAMPUS
+
+
+DEFAULT_CAMPUS = _NON_SLUG.sub('_', os.getenv('DEFAULT_CAMPUS', 'main').lower()).strip('_') or 'main'
+# Campuses offered at registration, comma separated
+CAMPUSES = [normalize_campus(c) for c in os.getenv('CAMPUSES', DEFAULT_CAMPUS).split(',') if c.strip()]
+# Scope catalogs, indexes and matching to the caller's campus
+CAMPUS_PARTITIONING = os.getenv('CAMPUS_PARTITIONING', '0') == '1'
+
+
+def campus_of(document: Dict) -> str:
+    """Partition key stored on a user or item document"""
+    return normalize_campus(document.get(CAMPUS_FIELD))
+
+
+def partition_key(campus: Optional[str] = None) -> str:
+    """
+    Partition a query should read
+
+    Args:
+        campus (str): Caller's campus, None for DEFAULT_CAMPUS, or ALL_CAMPUSES
+
+    Returns:
+        str: Campus partition key, or ALL_CAMPUSES when partitioning is off
+    """
+    if not CAMPUS_PARTITIONING:
+        return ALL_CAMPUSES
+    return normalize_campus(campus)
+
+
+def item_partitions(item: Dict) -> Tuple[str, ...]:
+    """Partitions whose indexes include an item: its campus and the cross-campus view"""
+    key = partition_key(campus_of(item))
+    return (key,) if key == ALL_CAMPUSES else (key, ALL_CAMPUSES)
+
+
+def scoped(query, campus: Optional[str] = None):
+    """
+    Restrict a Firestore collection or query to a campus partition
+
+    Args:
+        query: CollectionReference or Query
+        campus (str): Caller's campus, None for DEFAULT_CAMPUS, or ALL_CAMPUSES
+
+    Returns:
+        The query, filtered on the partition key unless reading every campus
+    """
+    key = partition_key(campus)
+    if key == ALL_CAMPUSES:
+        return query
+    return query.where(CAMPUS_FIELD, '==', key)
+
+
+_user_campuses: Dict[str, str] = {}
+_user_campuses_lock = threading.Lock()
+
+
+def get_user_campus(user_id: Optional[str]) -> str:
+    """
+    A user's campus, read once from their profile and then cached
+
+    Args:
+        user_id (str): User's ID
+
+    Returns:
+        str: Partition key; DEFAULT_CAMPUS for unknown users or on errors
+    """
+    if not user_id:
+        return DEFAULT_CAMPUS
+    with _user_campuses_lock:
+        campus = _user_campuses.get(user_id)
+    if campus is not None:
+        return campus
+    try:
+        doc = db.collection('users').document(user_id).get()
+        campus = campus_of(doc.to_dict() or {}) if doc.exists else DEFAULT_CAMPUS
+    except Exception as e:
+        print(f"Error reading campus for user {user_id}: {str(e)}")
+        return DEFAULT_CAMPUS
+    set_user_campus(user_id, campus)
+    return campus
+
+
+def set_user_campus(user_id: str, campus: str):
+    """Record a user's campus after it is written to their profile"""
+    with _user_campuses_lock:
+        _user_campuses[user_id] = normalize_campus(campus)
+
+
+def backfill(dry_run: bool = False) -> Dict[str, int]:
+    """
+    Stamp users and items that have no campus
+
+    Users get DEFAULT_CAMPUS; items get their owner's campus.
+
+    Args:
+        dry_run (bool): Count documents without writing
+
+    Returns:
+        dict: Documents updated per collection
+    """
+    updated = {'users': 0, 'items': 0}
+    campuses = {}
+    batch = db.batch()
+    pending = 0
+
+    def stage(ref, campus):
+        nonlocal batch, pending
+        if dry_run:
+            return
+        batch.update(ref, {CAMPUS_FIELD: campus})
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    for doc in db.collection('users').stream():
+        data = doc.to_dict()
+        campuses[doc.id] = campus_of(data)
+        if not data.get(CAMPUS_FIELD):
+            stage(doc.reference, DEFAULT_CAMPUS)
+            updated['users'] += 1
+
+    for doc in db.collection('items').stream():
+        data = doc.to_dict()
+        if not data.get(CAMPUS_FIELD):
+            stage(doc.reference, campuses.get(data.get('user_id'), DEFAULT_CAMPUS))
+            updated['items'] += 1
+
+    if pending:
+        batch.commit()
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Campus partition maintenance")
+    commands = parser.add_subparsers(dest='command', required=True)
+    backfill_parser = commands.add_parser('backfill', help="stamp users and items that have no campus")
+    backfill_parser.add_argument('--dry-run', action='store_true', help="count documents without writing")
+    args = parser.parse_args()
+
+    if db is None:
+        print("Error: Firestore is not initialized")
+        raise SystemExit(1)
+    updated = backfill(dry_run=args.dry_run)
+    verb = "Would update" if args.dry_run else "Updated"
+    print(f"{verb} {updated['users']} users and {updated['items']} items")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+# catalog.py - Columnar in-memory view of the items collection for browse filtering and sorting
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .firebase_config import db
+from .campus import ALL_CAMPUSES, campus_of, partition_key, scoped
+from .facets import FacetIndex
+from .geo import SpatialIndex, item_coordinates
+from .pagination import clamp_limit, decode_cursor, encode_cursor, query_key
+from .records import ItemRecord
+from .replica import DELETED_FIELD, get_replica
+from .schema import is_active
+from .snapshot import load_snapshot
+
+# Seconds before the shared catalog is reloaded from Firestore
+CATALOG_TTL = float(os.getenv('CATALOG_TTL', '60'))
+# Snapshot directory (see snapshot.py) to serve the catalog from instead of Firestore
+CATALOG_SNAPSHOT = os.getenv('CATALOG_SNAPSHOT')
+# Refresh from a local replica that only reads items changed since the last load
+CATALOG_DELTA_SYNC = os.getenv('CATALOG_DELTA_SYNC', '1') == '1'
+
+CONDITIONS = ["New", "Like New", "Good", "Fair", "Poor"]
+# Stored conditions are free text ('new', 'like_new'); matched case-insensitively
+_CONDITION_BY_KEY = {condition.lower(): condition for condition in CONDITIONS}
+
+SORT_OPTIONS = {
+    'newest': 'Newest first',
+    'oldest': 'Oldest first',
+    'price_asc': 'Price: low to high',
+    'price_desc': 'Price: high to low',
+    'condition': 'Condition: best first'
+}
+
+# Number of recent query masks kept per catalog (Streamlit reruns repeat queries)
+_QUERY_CACHE_SIZE = 16
+
+
+def _price(value) -> float:
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def normalize_condition(value) -> Optional[str]:
+    """The CONDITIONS spelling of a stored condition, or the value unchanged if it isn't one"""
+    if not isinstance(value, str):
+        return value
+    return _CONDITION_BY_KEY.get(' '.join(value.replace('_', ' ').replace('-', ' ').split()).lower(), value)
+
+
+def _timestamp(value) -> float:
+    try:
+        return value.timestamp() if value is not None else np.nan
+    except (AttributeError, ValueError, OSError):
+        return np.nan
+
+
+class Catalog:
+    """
+    Immutable columnar snapshot of the items collection
+
+    Each column is a NumPy array aligned with self.items, so combined filters
+    are boolean masks and sorts are argsorts over the matching rows.
+    """
+
+    def __init__(self, items: List[Dict], campus: str = ALL_CAMPUSES):
+        items = [ItemRecord.of(item) for item in items]
+        self.items = items
+        self.campus = campus
+        self.ids = np.array([item.get('id') for item in items], dtype=object)
+        self.row_of = {item_id: row for row, item_id in enumerate(self.ids)}
+
+        self.category = pd.Categorical([item.get('category') or 'Other' for item in items])
+        self.category_codes = np.asarray(self.category.codes)
+        self.condition = pd.Categorical([normalize_condition(item.get('condition')) for item in items],
+                                        categories=CONDITIONS, ordered=True)
+        self.condition_codes = np.asarray(self.condition.codes)
+
+        self.price = np.array([_price(item.get('price')) for item in items], dtype=np.float64)
+        self.created_at = np.array([_timestamp(item.get('created_at')) for item in items],
+                                   dtype=np.float64)
+        self.active = np.array([is_active(item) for item in items], dtype=bool)
+        self.for_sale = np.array(
+            [bool(item.get('for_sale', _price(item.get('price')) > 0)) for item in items],
+            dtype=bool
+        )
+        self.for_trade = np.array(
+            [bool(item.get('for_trade', item.get('trade_categories') or item.get('looking_for')))
+             for item in items],
+            dtype=bool
+        )
+
+        coordinates = [item_coordinates(item) for item in items]
+        self.lat = np.array([c[0] if c else np.nan for c in coordinates], dtype=np.float64)
+        self.lon = np.array([c[1] if c else np.nan for c in coordinates], dtype=np.float64)
+
+        self.search_text = pd.Series(
+            [f"{item.get('name', '')} {item.get('description', '')} {item.get('category', '')}".lower()
+             for item in items],
+            dtype=object
+        )
+        self._query_masks = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.loaded_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _query_mask(self, query: str) -> np.ndarray:
+        query = query.lower()
+        with self._query_lock:
+            mask = self._query_masks.get(query)
+            if mask is not None:
+                self._query_masks.move_to_end(query)
+                return mask
+
+        mask = self.search_text.str.contains(query, regex=False).to_numpy(dtype=bool)
+        with self._query_lock:
+            self._query_masks[query] = mask
+            if len(self._query_masks) > _QUERY_CACHE_SIZE:
+                self._query_masks.popitem(last=False)
+        return mask
+
+    def _codes_for(self, categorical: pd.Categorical, values: Union[str, Sequence[str]]) -> List[int]:
+        if isinstance(values, str):
+            values = [values]
+        categories = categorical.categories
+        return [categories.get_loc(value) for value in values if value in categories]
+
+    def masks(self, query: Optional[str] = None, category: Union[str, Sequence[str], None] = None,
+              condition: Union[str, Sequence[str], None] = None, min_price: Optional[float] = None,
+              max_price: Optional[float] = None, for_trade: Optional[bool] = None,
+              for_sale: Optional[bool] = None, active_only: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Build one boolean mask per active filter
+
+        Args:
+            query (str): Case-insensitive substring of name, description or category
+            category (str or list): Category name(s), 'All' or None for any
+            condition (str or list): Condition name(s)
+            min_price (float): Inclusive lower price bound
+            max_price (float): Inclusive upper price bound
+            for_trade (bool): Require (or exclude) trade availability
+            for_sale (bool): Require (or exclude) sale availability
+            active_only (bool): Skip inactive listings
+
+        Returns:
+            dict: Filter name to boolean mask aligned with self.items
+        """
+        masks = {}
+        if active_only:
+            masks['active'] = self.active
+        if category and category != 'All':
+            masks['category'] = np.isin(self.category_codes, self._codes_for(self.category, category))
+        if condition:
+            masks['condition'] = np.isin(self.condition_codes, self._codes_for(self.condition, condition))
+        if min_price is not None or max_price is not None:
+            low = -np.inf if min_price is None else min_price
+            high = np.inf if max_price is None else max_price
+            with np.errstate(invalid='ignore'):
+                masks['price'] = (self.price >= low) & (self.price <= high)
+        if for_trade is not None:
+            masks['for_trade'] = self.for_trade == for_trade
+        if for_sale is not None:
+            masks['for_sale'] = self.for_sale == for_sale
+        if query and query.strip():
+            masks['query'] = self._query_mask(query.strip())
+        return masks
+
+    def combine(self, masks: Dict[str, np.ndarray], exclude: Sequence[str] = ()) -> np.ndarray:
+        """
+        AND together masks, optionally leaving some filters out
+
+        Args:
+            masks (dict): Output of masks()
+            exclude (list): Filter names to ignore
+
+        Returns:
+            np.ndarray: Combined boolean mask
+        """
+        combined = np.ones(len(self.items), dtype=bool)
+        for name, mask in masks.items():
+            if name not in exclude:
+                combined &= mask
+        return combined
+
+    def _sort_keys(self, rows: np.ndarray, sort: str) -> Optional[np.ndarray]:
+        if sort == 'newest':
+            return np.nan_to_num(-self.created_at[rows], nan=np.inf)
+        if sort == 'oldest':
+            return np.nan_to_num(self.created_at[rows], nan=np.inf)
+        if sort == 'price_asc':
+            return np.nan_to_num(self.price[rows], nan=np.inf)
+        if sort == 'price_desc':
+            return np.nan_to_num(-self.price[rows], nan=np.inf)
+        if sort == 'condition':
+            codes = self.condition_codes[rows]
+            return np.where(codes < 0, len(CONDITIONS), codes)
+        return None
+
+    def sort_rows(self, rows: np.ndarray, sort: str = 'newest') -> np.ndarray:
+        """
+        Order row indices; missing prices, dates and conditions sort last
+
+        Args:
+            rows (np.ndarray): Row indices to order
+            sort (str): One of SORT_OPTIONS
+
+        Returns:
+            np.ndarray: Reordered row indices
+        """
+        keys = self._sort_keys(rows, sort)
+        if keys is None:
+            return rows
+        return rows[np.argsort(keys, kind='stable')]
+
+    def top_rows(self, rows: np.ndarray, k: int, sort: str = 'newest') -> np.ndarray:
+        """
+        The first k rows of sort_rows(rows, sort), without sorting the rest
+
+        A partition finds the k-th key, then only rows at or before it are
+        sorted; ties at the boundary keep row order, so pages never overlap.
+
+        Args:
+            rows (np.ndarray): Row indices in ascending order
+            k (int): Rows wanted
+            sort (str): One of SORT_OPTIONS
+
+        Returns:
+            np.ndarray: Up to k row indices in display order
+        """
+        keys = self._sort_keys(rows, sort)
+        if keys is None:
+            return rows[:k]
+        if k >= len(rows):
+            return rows[np.argsort(keys, kind='stable')]
+        if k <= 0:
+            return rows[:0]
+        kth = np.partition(keys, k - 1)[k - 1]
+        selected = np.flatnonzero(keys <= kth)
+        order = np.argsort(keys[selected], kind='stable')[:k]
+        return rows[selected[order]]
+
+    def filter(self, sort: str = 'newest', **filters) -> np.ndarray:
+        """
+        Apply filters and sort
+
+        Args:
+            sort (str): One of SORT_OPTIONS
+            **filters: Keyword arguments accepted by masks()
+
+        Returns:
+            np.ndarray: Matching row indices in display order
+        """
+        rows = np.flatnonzero(self.combine(self.masks(**filters)))
+        return self.sort_rows(rows, sort)
+
+    def page(self, limit: Optional[int] = None, cursor: Optional[str] = None, sort: str = 'newest',
+             **filters) -> Tuple[np.ndarray, Optional[str], int]:
+        """
+        One page of filtered, sorted rows
+
+        Args:
+            limit (int): Page size; defaults to SEARCH_PAGE_SIZE
+            cursor (str): Cursor from the previous page, or None for the first
+            sort (str): One of SORT_OPTIONS
+            **filters: Keyword arguments accepted by masks()
+
+        Returns:
+            tuple: (row indices, next cursor or None, total matching rows)
+
+        Raises:
+            CursorError: If the cursor is invalid or from an older catalog
+        """
+        limit = clamp_limit(limit)
+        key = query_key(self.loaded_at, sort, sorted(filters.items(), key=lambda f: f[0]))
+        offset = decode_cursor(cursor, key)
+        rows = np.flatnonzero(self.combine(self.masks(**filters)))
+        page = self.top_rows(rows, offset + limit, sort)[offset:]
+        next_offset = offset + len(page)
+        next_cursor = encode_cursor(key, next_offset) if next_offset < len(rows) else None
+        return page, next_cursor, len(rows)
+
+    @functools.cached_property
+    def facet_index(self) -> FacetIndex:
+        """Bitmaps per facet value, built on first use"""
+        return FacetIndex(self)
+
+    def facet_counts(self, **filters) -> Dict[str, Dict[str, int]]:
+        """
+        Count results per category, condition, price bucket and availability
+
+        Args:
+            **filters: Keyword arguments accepted by masks()
+
+        Returns:
+            dict: Facet name to {value: count}, plus 'total'
+        """
+        return self.facet_index.counts(self.masks(**filters))
+
+    @functools.cached_property
+    def spatial_index(self) -> SpatialIndex:
+        """Ball tree over item coordinates, built on first use"""
+        return SpatialIndex(self.lat, self.lon)
+
+    def nearby(self, lat: float, lon: float, radius_km: Optional[float] = None,
+               k: Optional[int] = None, sort: str = 'distance',
+               **filters) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filtered items near a point
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+            radius_km (float): Only items within this distance
+            k (int): At most this many items (nearest first); defaults to 20
+                when no radius is given
+            sort (str): 'distance' or one of SORT_OPTIONS
+            **filters: Keyword arguments accepted by masks()
+
+        Returns:
+            tuple: (row indices, distances in km) in display order
+        """
+        mask = self.combine(self.masks(**filters))
+        if radius_km is not None:
+            rows, distances = self.spatial_index.within_radius(lat, lon, radius_km, mask)
+            if k is not None:
+                rows, distances = rows[:k], distances[:k]
+        else:
+            rows, distances = self.spatial_index.nearest(lat, lon, k or 20, mask)
+
+        if sort != 'distance':
+            distance_of = dict(zip(rows.tolist(), distances.tolist()))
+            rows = self.sort_rows(rows, sort)
+            distances = np.array([distance_of[row] for row in rows.tolist()])
+        return rows, distances
+
+    def get_items(self, rows: Sequence[int]) -> List[Dict]:
+        """Resolve row indices to item dicts"""
+        return [self.items[row] for row in rows]
+
+    def get_item(self, item_id: str) -> Optional[Dict]:
+        """Look up an item by ID"""
+        row = self.row_of.get(item_id)
+        return self.items[row] if row is not None else None
+
+
+# One catalog per campus partition (ALL_CAMPUSES for the cross-campus view)
+_catalogs: Dict[str, Catalog] = {}
+_catalog_lock = threading.Lock()
+
+
+def load_items(campus: str = ALL_CAMPUSES) -> List[Dict]:
+    """
+    Read item documents from Firestore, or from CATALOG_SNAPSHOT when set
+
+    With CATALOG_DELTA_SYNC the campus's replica (see replica.py) is synced
+    instead of re-reading the whole collection.
+
+    Args:
+        campus (str): Campus partition key, or ALL_CAMPUSES for every item
+
+    Returns:
+        list: ItemRecords including 'id'
+    """
+    if CATALOG_SNAPSHOT:
+        items = load_snapshot(CATALOG_SNAPSHOT, 'items')
+        if campus != ALL_CAMPUSES:
+            items = [item for item in items if campus_of(item) == campus]
+        return [ItemRecord(item) for item in items]
+    if CATALOG_DELTA_SYNC:
+        replica = get_replica(campus)
+        replica.sync()
+        return replica.items()
+    query = db.collection('items') if campus == ALL_CAMPUSES else scoped(db.collection('items'), campus)
+    items = [ItemRecord(doc.to_dict(), doc.id) for doc in query.stream()]
+    return [item for item in items if not item.get(DELETED_FIELD)]
+
+
+def get_catalog(max_age: Optional[float] = None, campus: Optional[str] = None) -> Catalog:
+    """
+    Get the process-wide catalog for a campus, reloading it once it is older than max_age
+
+    Each campus has its own catalog, so its size (and the cost of filtering,
+    sorting and the indexes built from it) depends only on that campus.
+
+    Args:
+        max_age (float): Seconds before a reload; defaults to CATALOG_TTL
+        campus (str): Caller's campus, None for DEFAULT_CAMPUS, or ALL_CAMPUSES
+            for the cross-campus view; ignored unless CAMPUS_PARTITIONING is on
+
+    Returns:
+        Catalog: Shared, read-only catalog snapshot
+    """
+    max_age = CATALOG_TTL if max_age is None else max_age
+    key = partition_key(campus)
+
+    catalog = _catalogs.get(key)
+    if catalog is not None and time.time() - catalog.loaded_at < max_age:
+        return catalog
+
+    with _catalog_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None or time.time() - catalog.loaded_at >= max_age:
+            catalog = Catalog(load_items(key), campus=key)
+            _catalogs[key] = catalog
+        return catalog
+
+
+def invalidate_catalog(campus: Optional[str] = None):
+    """
+    Force the next get_catalog() call to reload from Firestore
+
+    With CATALOG_DELTA_SYNC the reload is a delta read of what changed.
+
+    Args:
+        campus (str): Only reload this campus (and the cross-campus view);
+            None reloads every partition
+    """
+    with _catalog_lock:
+        if campus is None:
+            _catalogs.clear()
+        else:
+            _catalogs.pop(partition_key(campus), None)
+            _catalogs.pop(ALL_CAMPUSES, None)
@@ -0,0 +1,368 @@
+# dedup.py - Near-duplicate listing detection with MinHash signatures and LSH banding
+import argparse
+import json
+import os
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from .campus import campus_of, item_partitions, partition_key
+from .catalog import Catalog, get_catalog, load_items
+
+# 16 bands of 4 rows: listings with Jaccard similarity s collide in at least
+# one band with probability 1 - (1 - s^4)^16 (about 0.65 at s=0.5, 0.99 at 0.7)
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+# Estimated Jaccard similarity at which two listings are reported as duplicates
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', '0.6'))
+# Character shingle length
+SHINGLE_SIZE = 5
+
+_PRIME = (1 << 31) - 1
+# Fixed seed so signatures agree across processes
+_rng = np.random.RandomState(20240229)
+_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def shingles(item: Dict) -> Set[str]:
+    """
+    Character shingles of a listing's name and description, plus its image hashes
+
+    Args:
+        item (dict): Item with 'name', 'description' and optional 'image_hashes'
+
+    Returns:
+        set: Shingle strings
+    """
+    text = _NON_WORD.sub(' ', f"{item.get('name', '')} {item.get('description', '')}".lower()).strip()
+    result = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))} if text else set()
+    # Each image hash counts as several shingles so a reused photo weighs
+    # about as much as a short matching phrase
+    for image_hash in item.get('image_hashes') or []:
+        result.update(f"img:{image_hash}:{i}" for i in range(4))
+    return result
+
+
+def signature(item: Dict) -> Optional[np.ndarray]:
+    """
+    MinHash signature of a listing
+
+    Args:
+        item (dict): Item dict
+
+    Returns:
+        np.ndarray: NUM_PERM uint64 values, or None for a listing without text or images
+    """
+    values = shingles(item)
+    if not values:
+        return None
+    hashes = np.fromiter((zlib.crc32(value.encode('utf-8')) for value in values),
+                         dtype=np.uint64, count=len(values))
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0)
+
+
+def similarity(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(signature_a == signature_b))
+
+
+class DuplicateIndex:
+    """
+    LSH index of MinHash signatures
+
+    Each signature is split into BANDS bands, and each band is a hash bucket;
+    listings sharing any bucket are duplicate candidates. A lookup touches
+    BANDS buckets regardless of catalog size.
+    """
+
+    def __init__(self):
+        self.buckets: List[Dict[bytes, Set[str]]] = [defaultdict(set) for _ in range(BANDS)]
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.owners: Dict[str, Optional[str]] = {}
+        self.fingerprints: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _bands(self, sig: np.ndarray) -> Iterable[bytes]:
+        for band in range(BANDS):
+            yield sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+
+    def add(self, item_id: str, item: Dict):
+        """
+        Index a listing, replacing any earlier version of it
+
+        Args:
+            item_id (str): Item ID
+            item (dict): Item dict
+        """
+        self.remove(item_id)
+        sig = signature(item)
+        if sig is None:
+            return
+        with self.lock:
+            self.signatures[item_id] = sig
+            self.owners[item_id] = item.get('user_id')
+            self.fingerprints[item_id] = _fingerprint(item)
+            for band, key in enumerate(self._bands(sig)):
+                self.buckets[band][key].add(item_id)
+
+    def remove(self, item_id: str):
+        """Drop a listing from the index"""
+        with self.lock:
+            sig = self.signatures.pop(item_id, None)
+            if sig is None:
+                return
+            self.owners.pop(item_id, None)
+            self.fingerprints.pop(item_id, None)
+            for band, key in enumerate(self._bands(sig)):
+                bucket = self.buckets[band].get(key)
+                if bucket is not None:
+                    bucket.discard(item_id)
+                    if not bucket:
+                        del self.buckets[band][key]
+
+    def candidates(self, sig: np.ndarray) -> Set[str]:
+        """IDs of listings sharing at least one band with a signature"""
+        found = set()
+        with self.lock:
+            for band, key in enumerate(self._bands(sig)):
+                found.update(self.buckets[band].get(key, ()))
+        return found
+
+    def find_duplicates(self, item: Dict, exclude_id: Optional[str] = None,
+                        threshold: float = DUPLICATE_THRESHOLD) -> List[Dict]:
+        """
+        Indexed listings that look like copies of an item
+
+        Args:
+            item (dict): Listing being created or edited
+            exclude_id (str): The listing's own ID, if it is already indexed
+            threshold (float): Minimum estimated Jaccard similarity
+
+        Returns:
+            list: {'item_id', 'user_id', 'similarity', 'same_user'} dicts, most similar first
+        """
+        sig = signature(item)
+        if sig is None:
+            return []
+
+        duplicates = []
+        for item_id in self.candidates(sig):
+            if item_id == exclude_id:
+                continue
+            other = self.signatures.get(item_id)
+            if other is None:
+                continue
+            score = similarity(sig, other)
+            if score >= threshold:
+                owner = self.owners.get(item_id)
+                duplicates.append({
+                    'item_id': item_id,
+                    'user_id': owner,
+                    'similarity': score,
+                    'same_user': owner is not None and owner == item.get('user_id')
+                })
+        duplicates.sort(key=lambda d: d['similarity'], reverse=True)
+        return duplicates
+
+    def sync(self, catalog):
+        """
+        Bring the index in line with a catalog's active listings
+
+        Only listings that are new, edited or gone are touched.
+
+        Args:
+            catalog (Catalog): Current catalog snapshot
+        """
+        active = {}
+        for row in np.flatnonzero(catalog.active):
+            item = catalog.items[row]
+            active[item['id']] = item
+
+        for item_id in [i for i in self.signatures if i not in active]:
+            self.remove(item_id)
+        for item_id, item in active.items():
+            if self.fingerprints.get(item_id) != _fingerprint(item):
+                self.add(item_id, item)
+
+    def groups(self, threshold: float = DUPLICATE_THRESHOLD) -> List[List[str]]:
+        """
+        Cluster indexed listings into groups of near-duplicates
+
+        Candidate pairs come from the LSH buckets; pairs at or above threshold
+        are merged with union-find, so A~B and B~C land in one group.
+
+        Args:
+            threshold (float): Minimum estimated Jaccard similarity
+
+        Returns:
+            list: Groups of two or more item IDs, largest first
+        """
+        parent: Dict[str, str] = {}
+
+        def find(item_id):
+            root = item_id
+            while parent.setdefault(root, root) != root:
+                root = parent[root]
+            while item_id != root:
+                parent[item_id], item_id = root, parent[item_id]
+            return root
+
+        with self.lock:
+            buckets = [list(bucket) for band in self.buckets for bucket in band.values() if len(bucket) > 1]
+        for bucket in buckets:
+            # Compare every pair in the bucket at once, in row blocks to bound memory
+            signatures = np.stack([self.signatures[item_id] for item_id in bucket])
+            for start in range(0, len(bucket), 256):
+                block = signatures[start:start + 256]
+                scores = (block[:, None, :] == signatures[None, :, :]).mean(axis=2)
+                for i, j in zip(*np.nonzero(scores >= threshold)):
+                    if start + i < j:
+                        root_a, root_b = find(bucket[start + i]), find(bucket[j])
+                        if root_a != root_b:
+                            parent[root_b] = root_a
+
+        members = defaultdict(list)
+        for item_id in parent:
+            members[find(item_id)].append(item_id)
+        return sorted((sorted(group) for group in members.values()), key=len, reverse=True)
+
+
+def _fingerprint(item: Dict) -> int:
+    text = f"{item.get('name', '')}\x1f{item.get('description', '')}\x1f{item.get('image_hashes') or ''}"
+    return zlib.crc32(text.encode('utf-8'))
+
+
+# One index per campus partition, plus the catalog each was last synced with
+_indexes: Dict[str, DuplicateIndex] = {}
+_synced_with: Dict[str, object] = {}
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index(catalog) -> DuplicateIndex:
+    """
+    Get the index for a catalog's campus, synced with the catalog
+
+    Args:
+        catalog (Catalog): Current catalog snapshot
+
+    Returns:
+        DuplicateIndex: Shared index for the campus
+    """
+    campus = catalog.campus
+    if _synced_with.get(campus) is not catalog:
+        with _index_lock:
+            index = _indexes.setdefault(campus, DuplicateIndex())
+            if _synced_with.get(campus) is not catalog:
+                index.sync(catalog)
+                _synced_with[campus] = catalog
+    return _indexes[campus]
+
+
+def check_duplicate(item: Dict, item_id: Optional[str] = None) -> List[Dict]:
+    """
+    Flag probable duplicates of a listing about to be written
+
+    Only listings on the same campus are compared. Checks run against the
+    campus's live index, which index_signature() and remove_signature() keep
+    current between catalog reloads; the catalog is only loaded to build the
+    index the first time.
+
+    Args:
+        item (dict): Listing with at least name and description
+        item_id (str): The listing's ID when it is being edited
+
+    Returns:
+        list: Matches from find_duplicates(); empty if the check fails
+    """
+    try:
+        index = _indexes.get(partition_key(campus_of(item)))
+        if index is None:
+            index = get_duplicate_index(get_catalog(campus=campus_of(item)))
+        return index.find_duplicates(item, exclude_id=item_id)
+    except Exception as e:
+        print(f"Error checking for duplicate listings: {str(e)}")
+        return []
+
+
+def index_signature(item_id: str, item: Dict):
+    """Add a newly written listing so later reposts are caught before the next catalog reload"""
+    for campus in item_partitions(item):
+        index = _indexes.get(campus)
+        if index is not None:
+            index.add(item_id, item)
+
+
+def remove_signature(item_id: str, item: Dict):
+    """Drop a deleted listing so it isn't reported as a duplicate before the next catalog reload"""
+    for campus in item_partitions(item):
+        index = _indexes.get(campus)
+        if index is not None:
+            index.remove(item_id)
+
+
+def dedup_report(catalog, threshold: float = DUPLICATE_THRESHOLD) -> Dict:
+    """
+    Near-duplicate groups across the catalog
+
+    Args:
+        catalog (Catalog): Catalog to scan
+        threshold (float): Minimum estimated Jaccard similarity
+
+    Returns:
+        dict: 'groups' (each with items, owners and whether several users posted it)
+            plus totals
+    """
+    index = DuplicateIndex()
+    index.sync(catalog)
+
+    groups = []
+    for group in index.groups(threshold):
+        items = [catalog.get_item(item_id) for item_id in group]
+        owners = sorted({item.get('user_id') for item in items if item.get('user_id')})
+        groups.append({
+            'item_ids': group,
+            'names': [item.get('name') for item in items],
+            'user_ids': owners,
+            'cross_user': len(owners) > 1
+        })
+    return {
+        'listings_scanned': len(index),
+        'duplicate_groups': len(groups),
+        'redundant_listings': sum(len(group['item_ids']) - 1 for group in groups),
+        'groups': groups
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report near-duplicate listings in the items collection")
+    parser.add_argument('--threshold', type=float, default=DUPLICATE_THRESHOLD,
+                        help="minimum estimated Jaccard similarity (default %(default)s)")
+    parser.add_argument('--output', help="write the full report as JSON to this path")
+    args = parser.parse_args()
+
+    report = dedup_report(Catalog(load_items()), args.threshold)
+    print(f"Scanned {report['listings_scanned']} listings: {report['duplicate_groups']} duplicate groups, "
+          f"{report['redundant_listings']} redundant listings")
+    for group in report['groups'][:20]:
+        owners = "several users" if group['cross_user'] else "one user"
+        print(f"  {len(group['item_ids'])} x {group['names'][0]!r} ({owners})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# facets.py - Facet counts for search and browse from precomputed bitmaps
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# (label, inclusive lower bound, exclusive upper bound)
+PRICE_BUCKETS: List[Tuple[str, float, float]] = [
+    ("Under $10", 0, 10),
+    ("$10 - $25", 10, 25),
+    ("$25 - $50", 25, 50),
+    ("$50 - $100", 50, 100),
+    ("$100 - $250", 100, 250),
+    ("$250 - $500", 250, 500),
+    ("$500+", 500, np.inf),
+]
+NO_PRICE = "No price"
+
+AVAILABILITY = ["For Trade", "For Sale"]
+
+# Filters ignored when counting each facet, so a selected category still
+# shows how many results the other categories would give
+FACET_FILTERS = {
+    'category': ('category',),
+    'condition': ('condition',),
+    'price': ('price',),
+    'availability': ('for_trade', 'for_sale'),
+}
+
+# Set bits per byte value, for counting packed bitmaps
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint32)
+
+
+def _pack(mask: np.ndarray) -> np.ndarray:
+    return np.packbits(mask)
+
+
+def _count(packed: np.ndarray) -> int:
+    return int(_POPCOUNT[packed].sum())
+
+
+class FacetIndex:
+    """
+    One packed bitmap per facet value of a catalog
+
+    Counting a facet value is a bitwise AND with the packed result mask and a
+    popcount, so every facet can be refreshed on each rerun without scanning
+    item dicts or reading from Firestore.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.bitmaps: Dict[str, Dict[str, np.ndarray]] = {
+            'category': {},
+            'condition': {},
+            'price': {},
+            'availability': {},
+        }
+
+        for code, value in enumerate(catalog.category.categories):
+            self.bitmaps['category'][value] = _pack(catalog.category_codes == code)
+
+        for code, value in enumerate(catalog.condition.categories):
+            self.bitmaps['condition'][value] = _pack(catalog.condition_codes == code)
+
+        price = catalog.price
+        with np.errstate(invalid='ignore'):
+            for label, low, high in PRICE_BUCKETS:
+                self.bitmaps['price'][label] = _pack((price >= low) & (price < high))
+        self.bitmaps['price'][NO_PRICE] = _pack(np.isnan(price))
+
+        self.bitmaps['availability']["For Trade"] = _pack(catalog.for_trade)
+        self.bitmaps['availability']["For Sale"] = _pack(catalog.for_sale)
+
+    def counts(self, masks: Dict[str, np.ndarray]) -> Dict[str, Dict[str, int]]:
+        """
+        Count results per facet value
+
+        Args:
+            masks (dict): Filter masks from Catalog.masks()
+
+        Returns:
+            dict: Facet name to {value: count}, each facet ignoring its own filter
+        """
+        counts = {}
+        for facet, values in self.bitmaps.items():
+            base = _pack(self.catalog.combine(masks, exclude=FACET_FILTERS[facet]))
+            counts[facet] = {value: _count(bitmap & base) for value, bitmap in values.items()}
+        counts['total'] = int(np.count_nonzero(self.catalog.combine(masks)))
+        return counts
@@ -34,6 +34,8 @@ from . import auth_service
 from . import user_service
 from . import item_service
 from . import search_service
+from .campus import get_user_campus
+from .projections import CARD_FIELDS
 
 # Initialize session state for user auth
 if 'user_id' not in st.session_state:
@@ -370,13 +372,20 @@ def search_page():
     search_query = st.text_input("Search for items")
     
     if search_query:
-        result = search_service.search_items(search_query)
+        # Cursors for each page seen so far; a new query starts over at page one
+        if st.session_state.get('search_query') != search_query:
+            st.session_state.search_query = search_query
+            st.session_state.search_cursors = [None]
+        cursors = st.session_state.search_cursors
+        result = search_service.search_items(search_query, cursor=cursors[-1],
+                                             campus=get_user_campus(st.session_state.user_id),
+                                             fields=CARD_FIELDS)
         
         if result['success']:
             if not result['items']:
                 st.info(f"No items found matching '{search_query}'.")
             else:
-                st.write(f"Found {len(result['items'])} items matching '{search_query}':")
+                st.write(f"Found {result['total_hits']} items matching '{search_query}' (page {len(cursors)}):")
                 
                 for item in result['items']:
                     with st.expander(f"{item['name']} ({item['condition']})"):
@@ -403,52 +412,73 @@ def search_page():
                             owner = auth_service.get_user(item['user_id'])
                             if owner['success']:
                                 st.write(f"**Listed by:** {owner['user'].display_name}")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    if len(cursors) > 1 and st.button("Previous page"):
+                        cursors.pop()
+                        st.experimental_rerun()
+                with col2:
+                    if result['next_cursor'] and st.button("Next page"):
+                        cursors.append(result['next_cursor'])
+                        st.experimental_rerun()
         else:
+            # An expired cursor (the catalog reloaded) restarts the search
+            st.session_state.search_cursors = [None]
             st.error(f"Error searching items: {result['error']}")
 
 def matches_page():
     st.header("Potential Matches")
     
+    # Matches precomputed by the offline job load instantly; the button recomputes live
+    result = search_service.get_precomputed_matches(st.session_state.user_id)
+    if result['success']:
+        generated_at = result['generated_at']
+        refreshed = generated_at.strftime('%b %d, %Y %H:%M UTC') if generated_at else "unknown"
+        st.caption(f"Last refreshed: {refreshed}")
+    else:
+        st.caption("Matches haven't been precomputed for you yet.")
+    
     if st.button("Find Matches"):
         result = search_service.find_potential_matches(st.session_state.user_id)
-        
-        if result['success']:
-            if not result['matches']:
-                st.info("No potential matches found for your wishlist items.")
-            else:
-                st.write(f"Found {len(result['matches'])} potential matches!")
+    
+    if result['success']:
+        if not result['matches']:
+            st.info("No potential matches found for your wishlist items.")
+        else:
+            st.write(f"Found {len(result['matches'])} potential matches!")
+            
+            for match in result['matches']:
+                wishlist_item = match['wishlist_item']
+                matched_item = match['matched_item']
                 
-                for match in result['matches']:
-                    wishlist_item = match['wishlist_item']
-                    matched_item = match['matched_item']
+                with st.expander(f"Match for '{wishlist_item['item_name']}'"):
+                    st.write("### What you're looking for:")
+                    st.write(f"**Item:** {wishlist_item['item_name']}")
+                    st.write(f"**Description:** {wishlist_item.get('description', 'No description')}")
                     
-                    with st.expander(f"Match for '{wishlist_item['item_name']}'"):
-                        st.write("### What you're looking for:")
-                        st.write(f"**Item:** {wishlist_item['item_name']}")
-                        st.write(f"**Description:** {wishlist_item.get('description', 'No description')}")
+                    st.write("### Matched Item:")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if 'images' in matched_item and matched_item['images']:
+                            st.image(matched_item['images'][0], width=150)
+                        else:
+                            st.image("https://via.placeholder.com/150", width=150)
+                    with col2:
+                        st.write(f"**Description:** {matched_item['description']}")
                         
-                        st.write("### Matched Item:")
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            if 'images' in matched_item and matched_item['images']:
-                                st.image(matched_item['images'][0], width=150)
-                            else:
-                                st.image("https://via.placeholder.com/150", width=150)
-                        with col2:
-                            st.write(f"**Description:** {matched_item['description']}")
-                            
-                            if matched_item.get('for_sale', False):
-                                st.write(f"**Price:** ${matched_item['price']}")
-                            
-                            if matched_item.get('for_trade', False):
-                                st.write("**Looking to trade for:**")
-                                for trade_item in matched_item.get('looking_for', []):
-                                    st.write(f"- {trade_item}")
-                            
-                            # Get the owner username
-                            owner = auth_service.get_user(matched_item['user_id'])
-                            if owner['success']:
-                                st.write(f"**Listed by:** {owner['user'].display_name}")
+                        if matched_item.get('for_sale', False):
+                            st.write(f"**Price:** ${matched_item['price']}")
+                        
+                        if matched_item.get('for_trade', False):
+                            st.write("**Looking to trade for:**")
+                            for trade_item in matched_item.get('looking_for', []):
+                                st.write(f"- {trade_item}")
+                        
+                        # Get the owner username
+                        owner = auth_service.get_user(matched_item['user_id'])
+                        if owner['success']:
+                            st.write(f"**Listed by:** {owner['user'].display_name}")
 
 def initialize_firebase():
     """Initialize Firebase client"""
@@ -4,6 +4,7 @@ from pathlib import Path
 import firebase_admin
 from firebase_admin import credentials, firestore, auth, storage
 from dotenv import load_dotenv
+from .firestore_tracker import track_client
 
 # Load environment variables
 load_dotenv()
@@ -31,7 +32,7 @@ try:
             firebase_app = firebase_admin.initialize_app(cred)
         else:
             firebase_app = firebase_admin.get_app()
-        db = firestore.client()
+        db = track_client(firestore.client())
         auth = auth
         storage = storage
     else:
@@ -0,0 +1,412 @@
+# firestore_tracker.py - Firestore read/write accounting and per-request read budgets
+import atexit
+import contextvars
+import functools
+import inspect
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Tracking wraps the Firestore client in a counting proxy; with it disabled
+# the real client is used directly
+FIRESTORE_TRACKING = os.getenv('FIRESTORE_TRACKING', '0') == '1'
+# Reads allowed per page render (0 = unlimited)
+FIRESTORE_READ_BUDGET = int(os.getenv('FIRESTORE_READ_BUDGET', '0'))
+# 'raise' fails the request once the budget is spent, 'degrade' truncates further streams
+FIRESTORE_BUDGET_MODE = os.getenv('FIRESTORE_BUDGET_MODE', 'raise')
+# Requests reading more than this many documents are logged with a breakdown
+FIRESTORE_READ_WARN = int(os.getenv('FIRESTORE_READ_WARN', '500'))
+
+UNSCOPED = '<unscoped>'
+
+
+class ReadBudgetExceeded(BaseException):
+    """
+    Raised when a request reads more documents than its budget allows
+
+    Derives from BaseException so the services' "except Exception" handlers
+    don't turn it into an empty result and let the render carry on reading;
+    whoever opens the request_scope() must catch it (app.main does).
+    """
+
+
+class _Scope:
+    """Usage accumulated while a request or service call is running"""
+
+    def __init__(self, name: str, read_budget: Optional[int] = None, mode: str = 'raise'):
+        self.name = name
+        self.read_budget = read_budget or None
+        self.mode = mode
+        self.exhausted = False
+        self.usage = _new_usage()
+        self.by_function: Dict[str, Dict] = {}
+
+
+def _new_usage() -> Dict:
+    return {'reads': 0, 'writes': 0, 'queries': 0}
+
+
+_lock = threading.Lock()
+_totals: Dict[str, Dict] = {}
+_stack: contextvars.ContextVar[Tuple[_Scope, ...]] = contextvars.ContextVar(
+    'firestore_tracker_stack', default=()
+)
+
+
+def _record(reads: int = 0, writes: int = 0, queries: int = 1):
+    """Attribute usage to the innermost scope and every enclosing one"""
+    scopes = _stack.get()
+    name = scopes[-1].name if scopes else UNSCOPED
+
+    with _lock:
+        total = _totals.setdefault(name, _new_usage())
+        total['reads'] += reads
+        total['writes'] += writes
+        total['queries'] += queries
+
+    for scope in scopes:
+        scope.usage['reads'] += reads
+        scope.usage['writes'] += writes
+        scope.usage['queries'] += queries
+        usage = scope.by_function.setdefault(name, _new_usage())
+        usage['reads'] += reads
+        usage['writes'] += writes
+        usage['queries'] += queries
+
+    if reads:
+        _check_budgets(scopes)
+
+
+def _check_budgets(scopes: Tuple[_Scope, ...]):
+    for scope in scopes:
+        if scope.read_budget is None or scope.usage['reads'] <= scope.read_budget:
+            continue
+        if scope.mode == 'raise':
+            raise ReadBudgetExceeded(
+                f"{scope.name} read {scope.usage['reads']} documents "
+                f"(budget {scope.read_budget})"
+            )
+        if not scope.exhausted:
+            scope.exhausted = True
+            print(f"Firestore read budget exhausted in {scope.name}: "
+                  f"{scope.usage['reads']} reads (budget {scope.read_budget})")
+
+
+def budget_exhausted() -> bool:
+    """
+    Check whether the current request has spent its read budget
+
+    Returns:
+        bool: True once any enclosing scope in 'degrade' mode is over budget
+    """
+    return any(scope.exhausted for scope in _stack.get())
+
+
+def current_usage() -> Dict:
+    """
+    Get usage for the outermost active scope (normally the page render)
+
+    Returns:
+        dict: reads, writes and queries so far, or zeros outside a request
+    """
+    scopes = _stack.get()
+    return dict(scopes[0].usage) if scopes else _new_usage()
+
+
+@contextmanager
+def scope(name: str, read_budget: Optional[int] = None, mode: str = 'raise'):
+    """
+    Attribute Firestore usage inside the block to name
+
+    Args:
+        name (str): Scope name, e.g. 'item_service.search_items'
+        read_budget (int): Optional maximum documents read inside the block
+        mode (str): 'raise' or 'degrade' once the budget is spent
+    """
+    if not FIRESTORE_TRACKING:
+        yield None
+        return
+
+    current = _Scope(name, read_budget, mode)
+    token = _stack.set(_stack.get() + (current,))
+    try:
+        yield current
+    finally:
+        _stack.reset(token)
+
+
+@contextmanager
+def request_scope(name: str, read_budget: Optional[int] = None, mode: Optional[str] = None):
+    """
+    Track one page render, enforcing the read budget and logging heavy requests
+
+    Args:
+        name (str): Request name, e.g. 'page.Browse'
+        read_budget (int): Maximum documents read; defaults to FIRESTORE_READ_BUDGET
+        mode (str): 'raise' or 'degrade'; defaults to FIRESTORE_BUDGET_MODE
+    """
+    budget = FIRESTORE_READ_BUDGET if read_budget is None else read_budget
+    with scope(name, budget, mode or FIRESTORE_BUDGET_MODE) as current:
+        try:
+            yield current
+        finally:
+            if current is not None and current.usage['reads'] > FIRESTORE_READ_WARN:
+                _log_heavy_request(current)
+
+
+def _log_heavy_request(current: _Scope):
+    usage = current.usage
+    print(f"Firestore heavy request {current.name}: {usage['reads']} reads, "
+          f"{usage['writes']} writes, {usage['queries']} round-trips")
+    ranked = sorted(current.by_function.items(), key=lambda kv: kv[1]['reads'], reverse=True)
+    for name, function_usage in ranked[:5]:
+        print(f"  {name}: {function_usage['reads']} reads, {function_usage['queries']} round-trips")
+
+
+def tracked(name: str):
+    """
+    Decorator attributing a function's Firestore usage to name
+
+    Args:
+        name (str): Scope name
+
+    Returns:
+        Callable: Decorator returning the function unchanged when tracking is disabled
+    """
+    def decorator(func):
+        if not FIRESTORE_TRACKING:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with scope(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def track_module(module_name: str):
+    """
+    Attribute Firestore usage for every public function defined in a module
+
+    Args:
+        module_name (str): Fully qualified module name
+    """
+    if not FIRESTORE_TRACKING:
+        return
+
+    module = sys.modules[module_name]
+    prefix = module_name.rsplit('.', 1)[-1]
+    for attr, value in list(vars(module).items()):
+        if attr.startswith('_') or not inspect.isfunction(value):
+            continue
+        if getattr(value, '__module__', None) != module_name:
+            continue
+        setattr(module, attr, tracked(f"{prefix}.{attr}")(value))
+
+
+def top_offenders(limit: int = 10) -> List[Tuple[str, Dict]]:
+    """
+    Get the functions that have read the most documents
+
+    Args:
+        limit (int): Number of entries to return
+
+    Returns:
+        list: (name, usage) pairs sorted by reads
+    """
+    with _lock:
+        totals = [(name, dict(usage)) for name, usage in _totals.items()]
+    totals.sort(key=lambda kv: kv[1]['reads'], reverse=True)
+    return totals[:limit]
+
+
+def report_top_offenders(limit: int = 10):
+    """Print the functions that have read the most documents"""
+    offenders = top_offenders(limit)
+    if not offenders:
+        return
+    print("Firestore usage by function (reads / writes / round-trips):")
+    for name, usage in offenders:
+        print(f"  {name}: {usage['reads']} / {usage['writes']} / {usage['queries']}")
+
+
+# ---- CLIENT PROXY ----
+
+# Methods returning another reference or query that should stay tracked
+_BUILDERS = {
+    'collection', 'collection_group', 'document', 'where', 'order_by', 'limit',
+    'limit_to_last', 'offset', 'select', 'start_at', 'start_after', 'end_at',
+    'end_before', 'parent'
+}
+_WRITES = {'set', 'update', 'delete', 'create'}
+
+
+def _unwrap(value):
+    return value._target if isinstance(value, _Tracked) else value
+
+
+def _unwrap_args(args, kwargs):
+    return [_unwrap(a) for a in args], {k: _unwrap(v) for k, v in kwargs.items()}
+
+
+class _Tracked:
+    """Proxy counting reads and writes made through a Firestore client, reference or query"""
+
+    __slots__ = ('_target',)
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        if name in _BUILDERS:
+            def build(*args, **kwargs):
+                args, kwargs = _unwrap_args(args, kwargs)
+                return _Tracked(attr(*args, **kwargs))
+            return build
+
+        if name == 'get':
+            def get(*args, **kwargs):
+                result = attr(*args, **kwargs)
+                # An empty query result is still billed as one read
+                reads = max(1, len(result)) if isinstance(result, list) else 1
+                _record(reads=reads)
+                return result
+            return get
+
+        if name == 'stream':
+            def stream(*args, **kwargs):
+                return _tracked_stream(attr(*args, **kwargs))
+            return stream
+
+        if name == 'get_all':
+            def get_all(references, *args, **kwargs):
+                return _tracked_stream(attr([_unwrap(r) for r in references], *args, **kwargs))
+            return get_all
+
+        if name in _WRITES:
+            def write(*args, **kwargs):
+                args, kwargs = _unwrap_args(args, kwargs)
+                result = attr(*args, **kwargs)
+                _record(writes=1)
+                return result
+            return write
+
+        if name == 'add':
+            def add(*args, **kwargs):
+                timestamp, reference = attr(*args, **kwargs)
+                _record(writes=1)
+                return timestamp, _Tracked(reference)
+            return add
+
+        if name == 'batch':
+            def batch(*args, **kwargs):
+                return _TrackedBatch(attr(*args, **kwargs))
+            return batch
+
+        if name == 'on_snapshot':
+            def on_snapshot(callback, *args, **kwargs):
+                return attr(_tracked_listener(callback), *args, **kwargs)
+            return on_snapshot
+
+        return attr
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"Tracked({self._target!r})"
+
+
+class _TrackedBatch:
+    """Proxy for a WriteBatch counting each queued write when it commits"""
+
+    __slots__ = ('_target', '_pending')
+
+    def __init__(self, target):
+        self._target = target
+        self._pending = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in _WRITES:
+            def queue(*args, **kwargs):
+                args, kwargs = _unwrap_args(args, kwargs)
+                self._pending += 1
+                return attr(*args, **kwargs)
+            return queue
+        if name == 'commit':
+            def commit(*args, **kwargs):
+                result = attr(*args, **kwargs)
+                _record(writes=self._pending)
+                self._pending = 0
+                return result
+            return commit
+        return attr
+
+
+def _tracked_listener(callback):
+    """
+    Wrap a snapshot listener callback so each delivered change counts as a read
+
+    Callbacks run on the listener's own thread, outside any request, so usage
+    is attributed to the scope that registered the listener.
+    """
+    scopes = _stack.get()
+    name = f"{scopes[-1].name}.listener" if scopes else 'on_snapshot'
+
+    def listener(documents, changes, read_time):
+        with scope(name):
+            if not listener.delivered:
+                # The initial snapshot of an empty query is still billed as one read
+                _record(reads=max(1, len(changes)))
+            elif changes:
+                _record(reads=len(changes), queries=0)
+        listener.delivered = True
+        return callback(documents, changes, read_time)
+
+    listener.delivered = False
+    return listener
+
+
+def _tracked_stream(documents):
+    _record(queries=1)
+    count = 0
+    for document in documents:
+        count += 1
+        _record(reads=1, queries=0)
+        yield document
+        if budget_exhausted():
+            print("Firestore stream truncated: read budget exhausted")
+            break
+    if count == 0:
+        _record(reads=1, queries=0)
+
+
+def track_client(client):
+    """
+    Wrap a Firestore client so its reads and writes are counted
+
+    Args:
+        client: firestore.Client, or None when Firebase isn't initialized
+
+    Returns:
+        The tracked client, or the client unchanged when tracking is disabled
+    """
+    if client is None or not FIRESTORE_TRACKING:
+        return client
+    return _Tracked(client)
+
+
+if FIRESTORE_TRACKING:
+    atexit.register(report_top_offenders)
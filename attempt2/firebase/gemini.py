@@ -1,28 +1,333 @@
 from google import genai
+from google.genai import types, errors
 import os
+import random
+import threading
+import time
+from collections import deque
+from .metrics import instrument_module
 
-# Initialize Gemini client
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    raise ValueError("GEMINI_API_KEY environment variable is not set")
-client = genai.Client(api_key=api_key)
+# 'api' calls Gemini; 'local' answers with the deterministic stand-in in
+# local_model.py, for load tests and benchmarks without an API key. Read on
+# first use rather than at import, so tools such as bench_search can choose
+# the backend after the firebase package (which imports this module) loads.
+GEMINI_BACKEND = None
+client = None
+local_model = None
+_backend_lock = threading.Lock()
 
-def generate_content(prompt):
+MODEL_NAME = "gemini-2.0-flash"
+
+# Fallback returned whenever the model can't be reached; callers treat a
+# response without "matches" as a signal to use their local ranking
+FALLBACK_RESPONSE = "{}"
+
+# Resilience settings (seconds unless noted)
+CALL_DEADLINE = float(os.getenv('GEMINI_DEADLINE', '20'))
+ATTEMPT_TIMEOUT = float(os.getenv('GEMINI_ATTEMPT_TIMEOUT', '8'))
+MAX_ATTEMPTS = int(os.getenv('GEMINI_MAX_ATTEMPTS', '3'))
+BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', '4'))
+RETRY_BUDGET_RATIO = float(os.getenv('GEMINI_RETRY_BUDGET_RATIO', '0.2'))
+RETRY_BUDGET_MIN = float(os.getenv('GEMINI_RETRY_BUDGET_MIN', '10'))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('GEMINI_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.getenv('GEMINI_BREAKER_COOLDOWN', '30'))
+MAX_CONCURRENT_REQUESTS = int(os.getenv('GEMINI_MAX_CONCURRENT', '4'))
+
+
+class _RetryBudget:
+    """
+    Token bucket shared by every caller in the process. Each first attempt
+    deposits RETRY_BUDGET_RATIO tokens and each retry spends one, so retries
+    can never add more than that fraction of extra load on the model.
+    """
+
+    def __init__(self, ratio: float, minimum: float):
+        self.ratio = ratio
+        self.maximum = max(minimum, 1.0)
+        self.tokens = self.maximum
+        self.lock = threading.Lock()
+
+    def record_request(self):
+        with self.lock:
+            self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self.lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class _CircuitBreaker:
+    """
+    Opens after BREAKER_FAILURE_THRESHOLD consecutive failures and rejects
+    calls for BREAKER_COOLDOWN seconds, then lets a single probe through.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return (self.state == self.OPEN and
+                    time.monotonic() - self.opened_at < self.cooldown)
+
+    def release_probe(self):
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Gemini circuit opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+
+class _FairSemaphore:
+    """
+    Concurrency limit that hands freed slots to waiters in arrival order.
+    threading.Semaphore lets new callers take a slot ahead of ones already
+    waiting, which starves some requests for seconds under load.
+    """
+
+    def __init__(self, value: int):
+        self.value = value
+        self.waiters = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        with self.lock:
+            if self.value > 0 and not self.waiters:
+                self.value -= 1
+                return True
+            waiter = threading.Event()
+            self.waiters.append(waiter)
+        if waiter.wait(timeout):
+            return True
+        with self.lock:
+            # A slot may have been handed over just as the wait timed out
+            if waiter.is_set():
+                return True
+            self.waiters.remove(waiter)
+            return False
+
+    def release(self):
+        with self.lock:
+            if self.waiters:
+                self.waiters.popleft().set()
+            else:
+                self.value += 1
+
+
+_retry_budget = _RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN)
+_breaker = _CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+_semaphore = _FairSemaphore(MAX_CONCURRENT_REQUESTS)
+_stats_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'attempts': 0,
+    'successes': 0,
+    'failures': 0,
+    'retries': 0,
+    'retries_denied': 0,
+    'short_circuited': 0,
+    'concurrency_rejected': 0,
+    'deadline_exceeded': 0,
+}
+
+
+def _count(stat: str):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Server errors, throttling and transport failures are worth retrying"""
+    if isinstance(error, errors.ServerError):
+        return True
+    if isinstance(error, errors.ClientError):
+        return error.code in (408, 429)
+    return True
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def backend() -> str:
+    """
+    Select the backend from GEMINI_BACKEND on first use, creating the Gemini client for 'api'
+
+    Returns:
+        str: 'api' or 'local'
+    """
+    global GEMINI_BACKEND, client, local_model
+    if GEMINI_BACKEND is None:
+        with _backend_lock:
+            if GEMINI_BACKEND is None:
+                selected = os.getenv('GEMINI_BACKEND', 'api')
+                if selected == 'local':
+                    from . import local_model as model
+                    local_model = model
+                else:
+                    api_key = os.getenv('GEMINI_API_KEY')
+                    if not api_key:
+                        raise ValueError("GEMINI_API_KEY environment variable is not set")
+                    client = genai.Client(api_key=api_key)
+                GEMINI_BACKEND = selected
+    return GEMINI_BACKEND
+
+
+def _call_model(prompt, timeout: float) -> str:
+    if client is None:
+        return local_model.generate(prompt, timeout)
+    response = client.models.generate_content(
+        model=MODEL_NAME,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            http_options=types.HttpOptions(timeout=int(timeout * 1000))
+        )
+    )
+    return response.text
+
+
+def is_available() -> bool:
+    """
+    Check whether Gemini calls are currently being attempted
+
+    Returns:
+        bool: False while the circuit breaker is open
+    """
+    return not _breaker.is_open()
+
+
+def get_client_stats() -> dict:
+    """
+    Get counters describing the resilience layer's behaviour
+
+    Returns:
+        dict: Request/retry/breaker counters and current breaker state
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['breaker_state'] = _breaker.state
+    stats['retry_tokens'] = round(_retry_budget.tokens, 2)
+    return stats
+
+
+def generate_content(prompt, deadline=None):
     """
     Generate content using Gemini AI
-    
+
+    Each call is bounded by a deadline and retried with exponential backoff
+    while the shared retry budget allows it. While the circuit breaker is open,
+    or when no concurrency slot frees up before the deadline, the fallback
+    response is returned immediately so callers can rank locally.
+
     Args:
         prompt (str): The prompt to generate content for
-        
+        deadline (float): Total seconds allowed for this call, retries included
+
     Returns:
         str: Generated content
     """
+    if GEMINI_BACKEND is None:
+        backend()
+    deadline = CALL_DEADLINE if deadline is None else deadline
+    expires_at = time.monotonic() + deadline
+    _count('requests')
+    _retry_budget.record_request()
+
+    if _breaker.is_open():
+        _count('short_circuited')
+        return FALLBACK_RESPONSE
+
+    if not _semaphore.acquire(timeout=max(0.0, deadline)):
+        _count('concurrency_rejected')
+        print("Error generating content: too many concurrent Gemini requests")
+        return FALLBACK_RESPONSE
+
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
-        return response.text
-    except Exception as e:
-        print(f"Error generating content: {str(e)}")
-        return "{}"  # Return empty JSON object as fallback
\ No newline at end of file
+        if not _breaker.allow_request():
+            _count('short_circuited')
+            return FALLBACK_RESPONSE
+
+        attempt = 0
+        retryable = True
+        while True:
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                _count('deadline_exceeded')
+                if attempt:
+                    _breaker.record_failure()
+                else:
+                    _breaker.release_probe()
+                return FALLBACK_RESPONSE
+
+            _count('attempts')
+            try:
+                text = _call_model(prompt, min(ATTEMPT_TIMEOUT, remaining))
+                _breaker.record_success()
+                _count('successes')
+                return text
+            except Exception as e:
+                print(f"Error generating content: {str(e)}")
+                attempt += 1
+                retryable = _is_retryable(e)
+                delay = _backoff_delay(attempt)
+                if (not retryable or attempt >= MAX_ATTEMPTS or
+                        time.monotonic() + delay >= expires_at):
+                    break
+                if not _retry_budget.try_spend():
+                    _count('retries_denied')
+                    break
+                _count('retries')
+                time.sleep(delay)
+
+        _count('failures')
+        if retryable:
+            _breaker.record_failure()
+        else:
+            # The request was rejected but the upstream answered, so it is healthy
+            _breaker.record_success()
+        return FALLBACK_RESPONSE  # Return empty JSON object as fallback
+    finally:
+        _semaphore.release()
+
+
+instrument_module(__name__)
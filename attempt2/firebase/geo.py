@@ -0,0 +1,189 @@
+# geo.py - Item geocoding and spatial index for proximity search
+import json
+import os
+import re
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Pickup zones listings can be placed in: code -> (label, lat, lon).
+# Override with a JSON file of the same shape via CAMPUS_ZONES_PATH.
+CAMPUS_ZONES: Dict[str, Tuple[str, float, float]] = {
+    'library': ("Main Library", 40.1047, -88.2292),
+    'union': ("Student Union", 40.1092, -88.2272),
+    'quad': ("Main Quad", 40.1075, -88.2272),
+    'engineering': ("Engineering Quad", 40.1125, -88.2270),
+    'north_dorms': ("North Residence Halls", 40.1140, -88.2240),
+    'south_dorms': ("South Residence Halls", 40.1010, -88.2200),
+    'stadium': ("Stadium & Athletics", 40.0992, -88.2360),
+    'downtown': ("Downtown", 40.1164, -88.2434),
+}
+
+_zones_path = os.getenv('CAMPUS_ZONES_PATH')
+if _zones_path and os.path.exists(_zones_path):
+    with open(_zones_path) as f:
+        CAMPUS_ZONES = {code: tuple(zone) for code, zone in json.load(f).items()}
+
+_ZONE_LOOKUP = {}
+for _code, (_label, _lat, _lon) in CAMPUS_ZONES.items():
+    _ZONE_LOOKUP[_code.lower()] = (_lat, _lon)
+    _ZONE_LOOKUP[_label.lower()] = (_lat, _lon)
+
+_LAT_LON = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def geocode(location) -> Optional[Tuple[float, float]]:
+    """
+    Resolve a location to coordinates
+
+    Args:
+        location: {'lat': .., 'lon': ..} dict, "lat, lon" string, or a campus
+            zone code or label
+
+    Returns:
+        tuple: (lat, lon), or None if the location can't be resolved
+    """
+    if not location:
+        return None
+    if isinstance(location, dict):
+        try:
+            return float(location['lat']), float(location['lon'])
+        except (KeyError, TypeError, ValueError):
+            return None
+    if not isinstance(location, str):
+        return None
+
+    match = _LAT_LON.match(location)
+    if match:
+        lat, lon = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return lat, lon
+        return None
+    return _ZONE_LOOKUP.get(location.strip().lower())
+
+
+def item_coordinates(item: Dict) -> Optional[Tuple[float, float]]:
+    """Coordinates stored on an item ('geo'), falling back to geocoding its 'location'"""
+    return geocode(item.get('geo')) or geocode(item.get('location'))
+
+
+def location_fields(location) -> Dict:
+    """
+    Fields to store on an item document for a location
+
+    Args:
+        location: Anything geocode() accepts
+
+    Returns:
+        dict: 'location' plus 'geo' when the location resolves
+    """
+    fields = {'location': location}
+    if isinstance(location, str) and location.lower() in CAMPUS_ZONES:
+        fields['location'] = CAMPUS_ZONES[location.lower()][0]
+    coordinates = geocode(location)
+    if coordinates:
+        fields['geo'] = {'lat': coordinates[0], 'lon': coordinates[1]}
+    return fields
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km from one point to arrays of points"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class SpatialIndex:
+    """
+    Ball tree over the catalog rows that have coordinates
+
+    Rows without coordinates are simply absent from the index, so proximity
+    queries never return them.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray):
+        located = ~(np.isnan(lat) | np.isnan(lon))
+        self.rows = np.flatnonzero(located)
+        self.size = len(lat)
+        self.tree = None
+        if len(self.rows):
+            points = np.radians(np.column_stack([lat[self.rows], lon[self.rows]]))
+            self.tree = BallTree(points, metric='haversine')
+
+    def _point(self, lat: float, lon: float) -> np.ndarray:
+        return np.radians([[lat, lon]])
+
+    def within_radius(self, lat: float, lon: float, radius_km: float,
+                      mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows within radius_km of a point, nearest first
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+            radius_km (float): Search radius
+            mask (np.ndarray): Optional boolean filter aligned with catalog rows
+
+        Returns:
+            tuple: (row indices, distances in km)
+        """
+        if self.tree is None:
+            return np.array([], dtype=np.int64), np.array([])
+        indices, distances = self.tree.query_radius(
+            self._point(lat, lon), r=radius_km / EARTH_RADIUS_KM,
+            return_distance=True, sort_results=True
+        )
+        rows = self.rows[indices[0]]
+        distances = distances[0] * EARTH_RADIUS_KM
+        if mask is not None:
+            keep = mask[rows]
+            rows, distances = rows[keep], distances[keep]
+        return rows, distances
+
+    def nearest(self, lat: float, lon: float, k: int,
+                mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The k nearest rows passing an optional filter
+
+        Candidates are fetched in growing batches until k of them pass the
+        mask, so selective filters don't force a full scan.
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+            k (int): Number of rows
+            mask (np.ndarray): Optional boolean filter aligned with catalog rows
+
+        Returns:
+            tuple: (row indices, distances in km)
+        """
+        if self.tree is None or k <= 0:
+            return np.array([], dtype=np.int64), np.array([])
+
+        total = len(self.rows)
+        fetch = min(total, k if mask is None else k * 4)
+        while True:
+            distances, indices = self.tree.query(self._point(lat, lon), k=fetch)
+            rows = self.rows[indices[0]]
+            distances = distances[0] * EARTH_RADIUS_KM
+            if mask is not None:
+                keep = mask[rows]
+                rows, distances = rows[keep], distances[keep]
+            if len(rows) >= k or fetch == total:
+                return rows[:k], distances[:k]
+            fetch = min(total, fetch * 4)
+
+
+def zone_options() -> Sequence[str]:
+    """Zone codes in display order"""
+    return list(CAMPUS_ZONES.keys())
+
+
+def zone_label(code: str) -> str:
+    """Display label for a zone code"""
+    return CAMPUS_ZONES[code][0] if code in CAMPUS_ZONES else code
@@ -0,0 +1,275 @@
+# inbox_service.py - Live trade proposal inbox backed by Firestore snapshot listeners
+#
+# Each logged-in user gets one listener on trade_proposals where
+# item_owner_id == user. The listener keeps an ordered, in-memory copy of the
+# user's proposals up to date, so rendering the inbox (and its badge count)
+# never queries Firestore; only documents that actually change are read.
+# Listeners for users who haven't looked at their inbox for INBOX_IDLE_TTL
+# seconds are closed and restarted on their next visit.
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from .firebase_config import db
+from .metrics import instrument_module, set_gauge
+from .firestore_tracker import track_module
+from .records import TradeProposalRecord
+
+# Use snapshot listeners; 0 queries the collection on every render instead
+INBOX_LIVE = os.getenv('INBOX_LIVE', '1') == '1'
+# Seconds without a visit after which a user's listener is closed
+INBOX_IDLE_TTL = float(os.getenv('INBOX_IDLE_TTL', '900'))
+# Seconds to wait for a new listener's first snapshot before rendering
+INBOX_INITIAL_WAIT = float(os.getenv('INBOX_INITIAL_WAIT', '5'))
+# Seconds between inbox refreshes on the Trade Proposals page (Streamlit fragments)
+INBOX_REFRESH = float(os.getenv('INBOX_REFRESH', '5'))
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _created(proposal) -> datetime:
+    value = proposal.get('created_at')
+    if not isinstance(value, datetime):
+        return _EPOCH
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+class Inbox:
+    """
+    In-memory trade proposals received by one user, kept current by a snapshot listener
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.proposals: Dict[str, TradeProposalRecord] = {}
+        # Proposals that arrived after the first snapshot and haven't been seen yet
+        self.unseen: List[str] = []
+        self.version = 0
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.watch = None
+        self.last_access = time.time()
+
+    def start(self):
+        """Attach the snapshot listener"""
+        query = db.collection('trade_proposals').where('item_owner_id', '==', self.user_id)
+        self.watch = query.on_snapshot(self._on_snapshot)
+
+    def close(self):
+        if self.watch is not None:
+            try:
+                self.watch.unsubscribe()
+            except Exception as e:
+                print(f"Error closing inbox listener for {self.user_id}: {str(e)}")
+            self.watch = None
+
+    def alive(self) -> bool:
+        """Whether the listener is still attached; it stops for good after a stream error"""
+        if self.watch is None:
+            return False
+        return getattr(self.watch, 'is_active', True) is not False
+
+    def _on_snapshot(self, documents, changes, read_time):
+        # Runs on the listener's thread
+        initial = not self.ready.is_set()
+        try:
+            with self.lock:
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == 'REMOVED':
+                        self.proposals.pop(doc.id, None)
+                        continue
+                    self.proposals[doc.id] = TradeProposalRecord(doc.to_dict(), doc.id)
+                    if change.type.name == 'ADDED' and not initial:
+                        self.unseen.append(doc.id)
+                self.unseen = [proposal_id for proposal_id in self.unseen if proposal_id in self.proposals]
+                if changes or initial:
+                    self.version += 1
+        except Exception as e:
+            print(f"Error applying inbox snapshot for {self.user_id}: {str(e)}")
+        self.ready.set()
+
+    def load(self):
+        """Fill the inbox with a single query, for when listeners are disabled"""
+        docs = db.collection('trade_proposals').where('item_owner_id', '==', self.user_id).get()
+        with self.lock:
+            self.proposals = {doc.id: TradeProposalRecord(doc.to_dict(), doc.id) for doc in docs}
+            self.version += 1
+        self.ready.set()
+
+    def apply(self, proposal_id: str, fields: Dict):
+        """Apply a local write immediately; the listener's copy replaces it when it arrives"""
+        with self.lock:
+            current = self.proposals.get(proposal_id)
+            if current is None:
+                return
+            self.proposals[proposal_id] = TradeProposalRecord({**current, **fields})
+            self.version += 1
+
+    def listing(self) -> List[TradeProposalRecord]:
+        """Proposals, newest first"""
+        with self.lock:
+            proposals = list(self.proposals.values())
+        proposals.sort(key=_created, reverse=True)
+        return proposals
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            pending = sum(1 for proposal in self.proposals.values() if proposal.get('status') == 'pending')
+            return {'total': len(self.proposals), 'pending': pending, 'new': len(self.unseen)}
+
+    def take_unseen(self) -> List[TradeProposalRecord]:
+        """Proposals that arrived since the last call, oldest first"""
+        with self.lock:
+            unseen = [self.proposals[proposal_id] for proposal_id in self.unseen]
+            self.unseen = []
+        return unseen
+
+
+_inboxes: Dict[str, Inbox] = {}
+_inboxes_lock = threading.Lock()
+
+
+def _close_idle(now: float):
+    stale = [user_id for user_id, inbox in _inboxes.items() if now - inbox.last_access > INBOX_IDLE_TTL]
+    for user_id in stale:
+        _inboxes.pop(user_id).close()
+
+
+def get_inbox(user_id: str) -> Inbox:
+    """
+    Get a user's inbox, starting its listener on first use
+
+    Args:
+        user_id (str): ID of the user whose received proposals to watch
+
+    Returns:
+        Inbox: Live inbox; waits up to INBOX_INITIAL_WAIT for its first snapshot
+    """
+    now = time.time()
+    with _inboxes_lock:
+        _close_idle(now)
+        inbox = _inboxes.get(user_id)
+        if inbox is None or (INBOX_LIVE and not inbox.alive()):
+            if inbox is not None:
+                inbox.close()
+            inbox = _inboxes[user_id] = Inbox(user_id)
+            if INBOX_LIVE:
+                inbox.start()
+        inbox.last_access = now
+        set_gauge('inbox_listeners', len(_inboxes) if INBOX_LIVE else 0)
+
+    if not INBOX_LIVE:
+        inbox.load()
+    elif not inbox.ready.wait(INBOX_INITIAL_WAIT):
+        print(f"Inbox for {user_id} has not received its first snapshot yet")
+    return inbox
+
+
+def get_received_proposals(user_id: str) -> List[TradeProposalRecord]:
+    """
+    Trade proposals for a user's items, newest first, from their live inbox
+
+    Args:
+        user_id (str): ID of the item owner
+
+    Returns:
+        list: TradeProposalRecords including 'id'
+    """
+    return get_inbox(user_id).listing()
+
+
+def inbox_counts(user_id: str) -> Dict[str, int]:
+    """
+    Proposal counts for a badge, without querying Firestore once the inbox is live
+
+    Args:
+        user_id (str): ID of the item owner
+
+    Returns:
+        dict: 'total', 'pending' and 'new' (arrived since last shown)
+    """
+    try:
+        return get_inbox(user_id).counts()
+    except Exception as e:
+        print(f"Error reading inbox counts: {str(e)}")
+        return {'total': 0, 'pending': 0, 'new': 0}
+
+
+def update_proposal_status(user_id: str, proposal_id: str, status: str) -> Dict:
+    """
+    Accept or reject a received proposal and reflect it in the inbox right away
+
+    The proposal must be addressed to user_id. It is checked against the
+    user's live inbox when one is open, otherwise against the document.
+
+    Args:
+        user_id (str): ID of the item owner
+        proposal_id (str): Trade proposal document ID
+        status (str): 'accepted' or 'rejected'
+
+    Returns:
+        dict: Result with success status or error message
+    """
+    try:
+        proposal_ref = db.collection('trade_proposals').document(proposal_id)
+        with _inboxes_lock:
+            inbox = _inboxes.get(user_id)
+        proposal = None
+        if inbox is not None:
+            with inbox.lock:
+                proposal = inbox.proposals.get(proposal_id)
+        if proposal is None:
+            doc = proposal_ref.get()
+            if not doc.exists:
+                return {
+                    'success': False,
+                    'error': 'Trade proposal not found'
+                }
+            proposal = doc.to_dict()
+        if proposal.get('item_owner_id') != user_id:
+            return {
+                'success': False,
+                'error': 'Unauthorized to update this trade proposal'
+            }
+
+        now = datetime.now(timezone.utc)
+        fields = {'status': status, f'{status}_at': now, 'updated_at': now}
+        proposal_ref.update(fields)
+        if inbox is not None:
+            inbox.apply(proposal_id, fields)
+        return {
+            'success': True
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def stop_inbox(user_id: str):
+    """Close a user's listener, e.g. on logout"""
+    with _inboxes_lock:
+        inbox = _inboxes.pop(user_id, None)
+        set_gauge('inbox_listeners', len(_inboxes) if INBOX_LIVE else 0)
+    if inbox is not None:
+        inbox.close()
+
+
+def _close_all():
+    with _inboxes_lock:
+        inboxes = list(_inboxes.values())
+        _inboxes.clear()
+    for inbox in inboxes:
+        inbox.close()
+
+
+atexit.register(_close_all)
+
+
+instrument_module(__name__)
+track_module(__name__)
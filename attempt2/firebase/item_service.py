@@ -1,7 +1,23 @@
 # item_service.py - Functions for handling item operations
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, List, Optional
+
+from firebase_admin import firestore
+
 from .firebase_config import db, storage
+from .geo import location_fields
+from .typeahead import index_listing, remove_listing
+from .dedup import check_duplicate, index_signature, remove_signature
+from .percolator import notify_matches
+from .campus import get_user_campus, normalize_campus
+from .catalog import get_catalog
+from .projections import delete_summary, fetch, project, sync_summary
+from .replica import record_deletion
+from .archive_service import get_archived
+from .write_buffer import defer_increment, discard
+from .schema import ACTIVE, ITEM_SCHEMA_VERSION, SCHEMA_VERSION_FIELD, STATUS_FIELD, item_status
+from .metrics import instrument_module
+from .firestore_tracker import track_module
 
 def add_item(user_id: str, item_data: Dict) -> Dict:
     """
@@ -9,30 +25,50 @@ def add_item(user_id: str, item_data: Dict) -> Dict:
     
     Args:
         user_id (str): ID of the user adding the item
-        item_data (dict): Item details including name, description, category, etc.
+        item_data (dict): Item details including name, description, category,
+            location (campus zone or "lat, lon"), optional image_hashes, etc.
         
     Returns:
-        dict: Result with success status and item ID or error message
+        dict: Result with success status, item ID and possible_duplicates
+            (see dedup.check_duplicate), or error message
     """
     try:
         # Create item document
-        item_ref = db.collection('items').document()
-        item_ref.set({
+        item_doc = {
             'user_id': user_id,
             'name': item_data['name'],
             'description': item_data['description'],
             'category': item_data['category'],
-            'condition': item_data.get('condition', 'new'),
+            'condition': item_data.get('condition', 'New'),
             'price': item_data.get('price', 0),
             'images': item_data.get('images', []),
-            'created_at': datetime.now(),
-            'updated_at': datetime.now(),
-            'status': 'active'
-        })
+            'image_hashes': item_data.get('image_hashes', []),
+            'created_at': datetime.now(timezone.utc),
+            'updated_at': datetime.now(timezone.utc),
+            STATUS_FIELD: ACTIVE,
+            SCHEMA_VERSION_FIELD: ITEM_SCHEMA_VERSION,
+            'campus': normalize_campus(item_data.get('campus') or get_user_campus(user_id))
+        }
+        
+        # Store coordinates alongside the location so proximity search needn't geocode
+        if item_data.get('location'):
+            item_doc.update(location_fields(item_data['location']))
+        
+        # Flag probable reposts without blocking the write
+        duplicates = check_duplicate(item_doc)
+        
+        item_ref = db.collection('items').document()
+        item_ref.set(item_doc)
+        sync_summary(item_ref.id, item_doc)
+        index_listing(item_doc)
+        index_signature(item_ref.id, item_doc)
+        # Alert users whose wishlists this listing satisfies
+        notify_matches(item_ref.id, item_doc)
         
         return {
             'success': True,
-            'item_id': item_ref.id
+            'item_id': item_ref.id,
+            'possible_duplicates': duplicates
         }
     except Exception as e:
         return {
@@ -40,21 +76,30 @@ def add_item(user_id: str, item_data: Dict) -> Dict:
             'error': str(e)
         }
 
-def get_item(item_id: str) -> Dict:
+def get_item(item_id: str, include_archived: bool = False) -> Dict:
     """
     Get item details by ID.
     
     Args:
         item_id (str): ID of the item
+        include_archived (bool): Fall back to the archive (see archive_service)
+            for items no longer in the items collection
         
     Returns:
-        dict: Result with success status and item data or error message
+        dict: Result with success status and item data (with 'archived': True
+            for archived items) or error message
     """
     try:
         item_ref = db.collection('items').document(item_id)
         item = item_ref.get()
         
         if not item.exists:
+            archived = get_archived('items', item_id) if include_archived else None
+            if archived is not None:
+                return {
+                    'success': True,
+                    'item': {**archived, 'archived': True}
+                }
             return {
                 'success': False,
                 'error': 'Item not found'
@@ -94,7 +139,8 @@ def update_item(item_id: str, user_id: str, item_data: Dict) -> Dict:
                 'error': 'Item not found'
             }
         
-        if item.to_dict()['user_id'] != user_id:
+        current = item.to_dict()
+        if current['user_id'] != user_id:
             return {
                 'success': False,
                 'error': 'Unauthorized to update this item'
@@ -102,13 +148,27 @@ def update_item(item_id: str, user_id: str, item_data: Dict) -> Dict:
         
         # Update only provided fields
         update_data = {
-            'updated_at': datetime.now()
+            'updated_at': datetime.now(timezone.utc)
         }
         for key, value in item_data.items():
             if value is not None:
                 update_data[key] = value
+        if item_data.get('location'):
+            update_data.update(location_fields(item_data['location']))
+            if 'geo' not in update_data:
+                # The old coordinates belong to the old location
+                update_data['geo'] = firestore.DELETE_FIELD
         
         item_ref.update(update_data)
+        updated = {**current, **update_data}
+        if updated.get('geo') is firestore.DELETE_FIELD:
+            del updated['geo']
+        sync_summary(item_id, updated)
+        remove_listing(current)
+        index_listing(updated)
+        remove_signature(item_id, current)
+        if item_status(updated) == ACTIVE:
+            index_signature(item_id, updated)
         
         return {
             'success': True
@@ -140,13 +200,19 @@ def delete_item(item_id: str, user_id: str) -> Dict:
                 'error': 'Item not found'
             }
         
-        if item.to_dict()['user_id'] != user_id:
+        current = item.to_dict()
+        if current['user_id'] != user_id:
             return {
                 'success': False,
                 'error': 'Unauthorized to delete this item'
             }
         
+        discard('items', item_id)
         item_ref.delete()
+        record_deletion(item_id, current)
+        delete_summary(item_id)
+        remove_listing(current)
+        remove_signature(item_id, current)
         
         return {
             'success': True
@@ -157,35 +223,42 @@ def delete_item(item_id: str, user_id: str) -> Dict:
             'error': str(e)
         }
 
-def search_items(query: str) -> Dict:
+def record_view(item_id: str):
+    """
+    Count a view of an item without waiting for the write
+    
+    Args:
+        item_id (str): ID of the viewed item
+    """
+    defer_increment('items', item_id, 'view_count')
+
+def search_items(query: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                 sort: str = 'newest', campus: Optional[str] = None,
+                 fields: Optional[List[str]] = None) -> Dict:
     """
     Search items by name, description, or category.
     
     Args:
         query (str): Search query string
+        limit (int): Results per page; defaults to SEARCH_PAGE_SIZE
+        cursor (str): next_cursor from the previous page, or None for the first page
+        sort (str): One of catalog.SORT_OPTIONS
+        campus (str): Searcher's campus, or ALL_CAMPUSES to search every campus
+        fields (list): Only return these item fields (e.g. projections.CARD_FIELDS)
         
     Returns:
-        dict: Result with success status and list of matching items or error message
+        dict: Result with success status, matching items, next_cursor (None on
+            the last page) and total_hits, or error message
     """
     try:
-        items_ref = db.collection('items')
-        items = []
-        
-        # Get all active items
-        query_ref = items_ref.where('status', '==', 'active').get()
-        
-        for item in query_ref:
-            item_data = item.to_dict()
-            item_data['id'] = item.id
-            
-            # Simple text search
-            search_text = f"{item_data['name']} {item_data['description']} {item_data['category']}".lower()
-            if query.lower() in search_text:
-                items.append(item_data)
+        catalog = get_catalog(campus=campus)
+        rows, next_cursor, total_hits = catalog.page(limit, cursor, sort, query=query)
         
         return {
             'success': True,
-            'items': items
+            'items': [project(item, fields) for item in catalog.get_items(rows)],
+            'next_cursor': next_cursor,
+            'total_hits': total_hits
         }
     except Exception as e:
         return {
@@ -193,24 +266,25 @@ def search_items(query: str) -> Dict:
             'error': str(e)
         }
 
-def get_user_items(user_id: str) -> Dict:
+def get_user_items(user_id: str, fields: Optional[List[str]] = None,
+                   status: Optional[str] = None) -> Dict:
     """
     Get all items listed by a user.
     
     Args:
         user_id (str): ID of the user
+        fields (list): Only fetch these fields (a Firestore field mask); None
+            fetches whole documents
+        status (str): Only items with this status (see schema.ITEM_STATUSES)
         
     Returns:
         dict: Result with success status and list of items or error message
     """
     try:
-        items_ref = db.collection('items').where('user_id', '==', user_id).get()
-        items = []
-        
-        for item in items_ref:
-            item_data = item.to_dict()
-            item_data['id'] = item.id
-            items.append(item_data)
+        query = db.collection('items').where('user_id', '==', user_id)
+        if status:
+            query = query.where(STATUS_FIELD, '==', status)
+        items = fetch(query, fields)
         
         return {
             'success': True,
@@ -250,7 +324,7 @@ def add_to_wishlist(user_id: str, item_id: str) -> Dict:
             wishlist.append(item_id)
             user_ref.update({
                 'wishlist': wishlist,
-                'updated_at': datetime.now()
+                'updated_at': datetime.now(timezone.utc)
             })
         
         return {
@@ -290,7 +364,7 @@ def remove_from_wishlist(user_id: str, item_id: str) -> Dict:
             wishlist.remove(item_id)
             user_ref.update({
                 'wishlist': wishlist,
-                'updated_at': datetime.now()
+                'updated_at': datetime.now(timezone.utc)
             })
         
         return {
@@ -364,23 +438,24 @@ def find_potential_matches(user_id: str) -> Dict:
                 'items': []
             }
         
-        # Get all active items
-        items_ref = db.collection('items').where('status', '==', 'active').get()
+        # Get active items in the wishlist's categories (status + category index);
+        # 'in' takes at most 30 values per query
+        categories = sorted({item['category'] for item in wishlist_items if item.get('category')})
         matches = []
         
-        for item in items_ref:
-            item_data = item.to_dict()
-            item_data['id'] = item.id
-            
-            # Skip user's own items
-            if item_data['user_id'] == user_id:
-                continue
-            
-            # Check if item matches any wishlist item's category
-            for wishlist_item in wishlist_items:
-                if item_data['category'] == wishlist_item['category']:
-                    matches.append(item_data)
-                    break
+        for start in range(0, len(categories), 30):
+            items_ref = (db.collection('items')
+                         .where(STATUS_FIELD, '==', ACTIVE)
+                         .where('category', 'in', categories[start:start + 30])
+                         .get())
+            for item in items_ref:
+                item_data = item.to_dict()
+                item_data['id'] = item.id
+                
+                # Skip user's own items
+                if item_data['user_id'] == user_id:
+                    continue
+                matches.append(item_data)
         
         return {
             'success': True,
@@ -390,4 +465,7 @@ def find_potential_matches(user_id: str) -> Dict:
         return {
             'success': False,
             'error': str(e)
-        }
\ No newline at end of file
+        }
+
+instrument_module(__name__)
+track_module(__name__)
@@ -0,0 +1,261 @@
+# local_model.py - Deterministic offline stand-in for Gemini used by load tests and benchmarks
+#
+# Selected with GEMINI_BACKEND=local. Answers the search, wishlist and trade
+# prompts built in search_service.py with JSON in the formats they request,
+# ranked by lexical similarity, after an injected latency. Configurable error
+# and malformed-output rates exercise the retry, breaker and fallback paths.
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Latency per call: "fixed:MS", "uniform:LOW_MS,HIGH_MS" or "lognormal:MEDIAN_MS,SIGMA"
+LOCAL_MODEL_LATENCY = os.getenv('LOCAL_MODEL_LATENCY', 'lognormal:400,0.5')
+# Fraction of calls that raise LocalModelError (retryable, like a 503)
+LOCAL_MODEL_ERROR_RATE = float(os.getenv('LOCAL_MODEL_ERROR_RATE', '0'))
+# Fraction of successful calls that return text which isn't valid JSON
+LOCAL_MODEL_MALFORMED_RATE = float(os.getenv('LOCAL_MODEL_MALFORMED_RATE', '0'))
+# Seed for latency, error and malformed-output draws
+LOCAL_MODEL_SEED = int(os.getenv('LOCAL_MODEL_SEED', '42'))
+# Matches returned per prompt
+LOCAL_MODEL_MAX_MATCHES = int(os.getenv('LOCAL_MODEL_MAX_MATCHES', '20'))
+
+_WORD = re.compile(r'[a-z0-9]+')
+_STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+    'of', 'on', 'or', 'the', 'to', 'with', 'this', 'that', 'new', 'used'
+}
+_TEXT_FIELDS = ('name', 'item_name', 'brand', 'category', 'description', 'looking_for', 'trade_categories')
+
+
+class LocalModelError(Exception):
+    """Injected failure, treated by gemini.py like a retryable server error"""
+
+
+def _parse_latency(spec: str):
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v.strip()]
+    if kind == 'fixed':
+        return lambda rng: values[0] / 1000
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == 'lognormal':
+        median, sigma = values[0], values[1] if len(values) > 1 else 0.5
+        return lambda rng: rng.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError(f"Unknown LOCAL_MODEL_LATENCY {spec!r}")
+
+
+_latency = _parse_latency(LOCAL_MODEL_LATENCY)
+_rng = random.Random(LOCAL_MODEL_SEED)
+_lock = threading.Lock()
+_stats = {'calls': 0, 'errors': 0, 'timeouts': 0, 'malformed': 0, 'unrecognized': 0}
+
+
+def _count(stat: str):
+    with _lock:
+        _stats[stat] += 1
+
+
+def get_stats() -> Dict:
+    """
+    Get counters for injected behaviour
+
+    Returns:
+        dict: calls, errors, timeouts, malformed and unrecognized prompts
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def reset(seed: Optional[int] = None):
+    """Reset counters and reseed the draws, so benchmark runs are repeatable"""
+    with _lock:
+        _rng.seed(LOCAL_MODEL_SEED if seed is None else seed)
+        for stat in _stats:
+            _stats[stat] = 0
+
+
+# ---- PROMPT PARSING ----
+
+_DECODER = json.JSONDecoder()
+_JSON_START = re.compile(r'[\[{]')
+
+
+def _json_after(prompt: str, label: str, start: int = 0) -> Tuple[Optional[object], int]:
+    """Decode the JSON value following a label in a prompt"""
+    position = prompt.find(label, start)
+    if position < 0:
+        return None, start
+    position += len(label)
+    match = _JSON_START.search(prompt, position)
+    if match is None:
+        return None, position
+    try:
+        value, end = _DECODER.raw_decode(prompt, match.start())
+        return value, end
+    except ValueError:
+        return None, position
+
+
+def _line_after(prompt: str, label: str) -> Optional[str]:
+    position = prompt.find(label)
+    if position < 0:
+        return None
+    return prompt[position + len(label):].split('\n', 1)[0].strip()
+
+
+def _terms(value) -> Counter:
+    if isinstance(value, dict):
+        text = ' '.join(str(value.get(field, '')) for field in _TEXT_FIELDS)
+    elif isinstance(value, list):
+        text = ' '.join(str(v) for v in value)
+    else:
+        text = str(value or '')
+    return Counter(word for word in _WORD.findall(text.lower()) if word not in _STOP_WORDS)
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[term] for term, count in a.items() if term in b)
+    if not dot:
+        return 0.0
+    return dot / (math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values())))
+
+
+def _rank(query: Counter, items: List[Dict]) -> List[Tuple[float, Dict]]:
+    scored = []
+    for item in items:
+        score = _cosine(query, _terms(item))
+        if score > 0:
+            scored.append((round(score, 3), item))
+    scored.sort(key=lambda pair: (-pair[0], str(pair[1].get('id'))))
+    return scored[:LOCAL_MODEL_MAX_MATCHES]
+
+
+def _shared_terms(a: Counter, b: Counter) -> str:
+    shared = sorted(set(a) & set(b))[:5]
+    return ', '.join(shared) if shared else 'related details'
+
+
+def _answer_search(prompt: str) -> Optional[Dict]:
+    query = _line_after(prompt, 'Search Query:')
+    items, _ = _json_after(prompt, 'Items:')
+    if query is None or not isinstance(items, list):
+        return None
+    terms = _terms(query)
+    return {'matches': [
+        {
+            'item_id': item.get('id'),
+            'relevance_score': score,
+            'explanation': f"Shares terms with the query: {_shared_terms(terms, _terms(item))}"
+        }
+        for score, item in _rank(terms, items)
+    ]}
+
+
+def _answer_wishlist(prompt: str) -> Optional[Dict]:
+    wish_item, end = _json_after(prompt, 'Wishlist Item:')
+    items, _ = _json_after(prompt, 'Available Items:', end)
+    if not isinstance(wish_item, dict) or not isinstance(items, list):
+        return None
+    terms = _terms(wish_item)
+    return {'matches': [
+        {
+            'item_id': item.get('id'),
+            'match_score': score,
+            'explanation': f"Matches the wishlist on: {_shared_terms(terms, _terms(item))}",
+            'trade_details': "Offer an item from your listings in exchange"
+        }
+        for score, item in _rank(terms, items)
+    ]}
+
+
+def _answer_trade(prompt: str) -> Optional[Dict]:
+    current_wishlist, end = _json_after(prompt, 'Wishlist:')
+    current_items, end = _json_after(prompt, 'Listed Items:', end)
+    other_wishlist, end = _json_after(prompt, 'Wishlist:', end)
+    other_items, _ = _json_after(prompt, 'Listed Items:', end)
+    if not all(isinstance(v, list) for v in (current_wishlist, current_items, other_wishlist, other_items)):
+        return None
+
+    # Items each side has that the other side's wishlist asks for
+    offered = _rank(sum((_terms(wish) for wish in other_wishlist), Counter()), current_items)
+    wanted = _rank(sum((_terms(wish) for wish in current_wishlist), Counter()), other_items)
+    if not offered or not wanted:
+        return {'matches': []}
+    return {'matches': [{
+        'current_user_items': [item.get('id') for _, item in offered[:3]],
+        'other_user_items': [item.get('id') for _, item in wanted[:3]],
+        'match_score': round((offered[0][0] + wanted[0][0]) / 2, 3),
+        'explanation': "Each side lists something the other has on their wishlist"
+    }]}
+
+
+def answer(prompt: str) -> str:
+    """
+    Deterministic JSON answer to a search_service prompt, without injected faults
+
+    Args:
+        prompt (str): Prompt text
+
+    Returns:
+        str: JSON text, "{}" for prompts it doesn't recognise
+    """
+    if 'Search Query:' in prompt:
+        result = _answer_search(prompt)
+    elif 'Wishlist Item:' in prompt:
+        result = _answer_wishlist(prompt)
+    elif 'Current User:' in prompt and 'Other User:' in prompt:
+        result = _answer_trade(prompt)
+    else:
+        result = None
+
+    if result is None:
+        _count('unrecognized')
+        return "{}"
+    return json.dumps(result)
+
+
+def generate(prompt, timeout: Optional[float] = None) -> str:
+    """
+    Answer a prompt the way the Gemini API would, including latency and faults
+
+    Args:
+        prompt (str): Prompt text
+        timeout (float): Per-attempt timeout in seconds
+
+    Returns:
+        str: Model output text
+
+    Raises:
+        LocalModelError: For an injected error
+        TimeoutError: When the drawn latency exceeds the timeout
+    """
+    with _lock:
+        _stats['calls'] += 1
+        latency = _latency(_rng)
+        fail = _rng.random() < LOCAL_MODEL_ERROR_RATE
+        malformed = _rng.random() < LOCAL_MODEL_MALFORMED_RATE
+
+    if timeout is not None and latency > timeout:
+        time.sleep(timeout)
+        _count('timeouts')
+        raise TimeoutError(f"Local model timed out after {timeout:.2f}s")
+    time.sleep(latency)
+
+    if fail:
+        _count('errors')
+        raise LocalModelError("503 UNAVAILABLE (injected)")
+
+    text = answer(str(prompt))
+    if malformed:
+        _count('malformed')
+        # Prose around truncated JSON, the usual way a real model breaks the format
+        return f"Here are the best matches I found:\n{text[:max(1, len(text) // 2)]}"
+    return text
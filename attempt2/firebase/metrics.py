@@ -0,0 +1,302 @@
+# metrics.py - Latency, call count and error instrumentation for services and pages
+import atexit
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+# Instrumentation is decided when a function is wrapped, so with metrics
+# disabled the original functions are left in place and cost nothing extra
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_DUMP_PATH = os.getenv('METRICS_DUMP_PATH')
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Streamlit signals reruns by raising these; they aren't failures
+_CONTROL_FLOW_EXCEPTIONS = ('RerunException', 'StopException')
+
+_lock = threading.Lock()
+_series: Dict[str, Dict] = {}
+_gauges: Dict[str, float] = {}
+_server = None
+
+
+def _new_series(kind: str) -> Dict:
+    return {
+        'kind': kind,
+        'calls': 0,
+        'errors': 0,
+        'sum': 0.0,
+        'max': 0.0,
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1)
+    }
+
+
+def record(name: str, seconds: float, error: bool = False, kind: str = 'service'):
+    """
+    Record one timed call
+
+    Args:
+        name (str): Metric name, e.g. 'item_service.add_item'
+        seconds (float): Call duration
+        error (bool): Whether the call failed
+        kind (str): 'service' or 'page'
+    """
+    index = len(LATENCY_BUCKETS)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            index = i
+            break
+
+    with _lock:
+        series = _series.get(name)
+        if series is None:
+            series = _series[name] = _new_series(kind)
+        series['calls'] += 1
+        series['sum'] += seconds
+        series['max'] = max(series['max'], seconds)
+        series['buckets'][index] += 1
+        if error:
+            series['errors'] += 1
+
+
+def set_gauge(name: str, value: float):
+    """
+    Set a point-in-time value such as a queue depth
+
+    Args:
+        name (str): Gauge name
+        value (float): Current value
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def _is_error_result(result) -> bool:
+    """Service functions report failures as {'success': False, 'error': ...}"""
+    return isinstance(result, dict) and result.get('success') is False
+
+
+def instrument(name: str, kind: str = 'service') -> Callable:
+    """
+    Decorator recording latency, calls and errors for a function
+
+    Args:
+        name (str): Metric name
+        kind (str): 'service' or 'page'
+
+    Returns:
+        Callable: Decorator returning the function unchanged when metrics are disabled
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                failed = type(e).__name__ not in _CONTROL_FLOW_EXCEPTIONS
+                record(name, time.perf_counter() - start, failed, kind)
+                raise
+            record(name, time.perf_counter() - start, _is_error_result(result), kind)
+            return result
+
+        return wrapper
+    return decorator
+
+
+def timed_page(func: Callable) -> Callable:
+    """Decorator timing a Streamlit page render"""
+    return instrument(f"page.{func.__name__}", kind='page')(func)
+
+
+def instrument_module(module_name: str):
+    """
+    Wrap every public function defined in a module
+
+    Call this at the bottom of a service module with __name__. Functions
+    calling each other inside the module go through the wrapped versions,
+    as do callers importing them afterwards.
+
+    Args:
+        module_name (str): Fully qualified module name
+    """
+    if not METRICS_ENABLED:
+        return
+
+    module = sys.modules[module_name]
+    prefix = module_name.rsplit('.', 1)[-1]
+    for attr, value in list(vars(module).items()):
+        if attr.startswith('_') or not inspect.isfunction(value):
+            continue
+        if value.__module__ != module_name:
+            continue
+        setattr(module, attr, instrument(f"{prefix}.{attr}")(value))
+
+
+def snapshot() -> Dict:
+    """
+    Get a copy of all recorded metrics
+
+    Returns:
+        dict: Per-name call/error counts, latency sums and histogram buckets,
+            plus gauges
+    """
+    with _lock:
+        series = {name: {**data, 'buckets': list(data['buckets'])}
+                  for name, data in _series.items()}
+        gauges = dict(_gauges)
+
+    for data in series.values():
+        data['mean'] = data['sum'] / data['calls'] if data['calls'] else 0.0
+        data['p50'] = _quantile(data, 0.5)
+        data['p95'] = _quantile(data, 0.95)
+        data['p99'] = _quantile(data, 0.99)
+
+    return {
+        'enabled': METRICS_ENABLED,
+        'bucket_bounds': list(LATENCY_BUCKETS),
+        'series': series,
+        'gauges': gauges
+    }
+
+
+def _quantile(data: Dict, q: float) -> float:
+    """Estimate a quantile as the upper bound of the bucket containing it"""
+    if not data['calls']:
+        return 0.0
+    target = q * data['calls']
+    cumulative = 0
+    for i, count in enumerate(data['buckets']):
+        cumulative += count
+        if cumulative >= target:
+            return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else data['max']
+    return data['max']
+
+
+def render_json() -> str:
+    """Render the metrics snapshot as JSON"""
+    return json.dumps(snapshot(), indent=2)
+
+
+def render_prometheus() -> str:
+    """
+    Render the metrics snapshot in the Prometheus text exposition format
+
+    Returns:
+        str: Exposition text
+    """
+    snap = snapshot()
+    families = {
+        'service': 'nextgen_service_call',
+        'page': 'nextgen_page_render'
+    }
+    lines = []
+
+    for kind, family in families.items():
+        series = {name: data for name, data in snap['series'].items() if data['kind'] == kind}
+        if not series:
+            continue
+
+        lines.append(f"# HELP {family}_seconds Latency of {kind} calls")
+        lines.append(f"# TYPE {family}_seconds histogram")
+        for name, data in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, data['buckets']):
+                cumulative += count
+                lines.append(f'{family}_seconds_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{family}_seconds_bucket{{name="{name}",le="+Inf"}} {data["calls"]}')
+            lines.append(f'{family}_seconds_sum{{name="{name}"}} {data["sum"]:.6f}')
+            lines.append(f'{family}_seconds_count{{name="{name}"}} {data["calls"]}')
+
+        lines.append(f"# HELP {family}_errors_total Failed {kind} calls")
+        lines.append(f"# TYPE {family}_errors_total counter")
+        for name, data in sorted(series.items()):
+            lines.append(f'{family}_errors_total{{name="{name}"}} {data["errors"]}')
+
+    if snap['gauges']:
+        lines.append("# HELP nextgen_gauge Point-in-time values")
+        lines.append("# TYPE nextgen_gauge gauge")
+        for name, value in sorted(snap['gauges'].items()):
+            lines.append(f'nextgen_gauge{{name="{name}"}} {value}')
+
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics(path: str) -> Dict:
+    """
+    Write the metrics snapshot to a file, as JSON unless the path ends in .prom
+
+    Args:
+        path (str): Destination file
+
+    Returns:
+        dict: Result with success status or error
+    """
+    try:
+        content = render_prometheus() if path.endswith('.prom') else render_json()
+        with open(path, 'w') as f:
+            f.write(content)
+        return {'success': True}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body, content_type = render_json(), 'application/json'
+        elif self.path.startswith('/metrics'):
+            body, content_type = render_prometheus(), 'text/plain; version=0.0.4'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve /metrics (text format) and /metrics.json from a daemon thread
+
+    Args:
+        port (int): Port to listen on
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if it couldn't start
+    """
+    global _server
+    if _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
+    except Exception as e:
+        print(f"Error starting metrics server: {str(e)}")
+        return None
+
+
+if METRICS_ENABLED and METRICS_PORT:
+    start_metrics_server(int(METRICS_PORT))
+
+if METRICS_ENABLED and METRICS_DUMP_PATH:
+    atexit.register(dump_metrics, METRICS_DUMP_PATH)
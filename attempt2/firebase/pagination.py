@@ -0,0 +1,107 @@
+# pagination.py - Opaque cursors and heap-based top-k selection for paged search results
+import base64
+import heapq
+import json
+import os
+import zlib
+from typing import Callable, Iterable, List, Optional, Tuple, TypeVar
+
+# Results per page when a caller doesn't pass a limit
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+# Largest page a caller may ask for
+MAX_PAGE_SIZE = 100
+
+T = TypeVar('T')
+
+
+class CursorError(ValueError):
+    """Raised for a cursor that is malformed or belongs to a different query"""
+
+
+def query_key(*parts) -> str:
+    """Short stable key identifying a query and the data version it ran against"""
+    text = '\x1f'.join(str(part) for part in parts)
+    return format(zlib.crc32(text.encode('utf-8')), '08x')
+
+
+def encode_cursor(key: str, offset: int) -> str:
+    """
+    Cursor for the page starting at offset
+
+    Args:
+        key (str): query_key() of the query being paged
+        offset (int): Index of the first result on the next page
+
+    Returns:
+        str: URL-safe opaque cursor
+    """
+    payload = json.dumps({'k': key, 'o': offset}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], key: str) -> int:
+    """
+    Offset a cursor points at
+
+    Args:
+        cursor (str): Cursor from encode_cursor(), or None for the first page
+        key (str): query_key() of the query being paged
+
+    Returns:
+        int: Offset of the first result to return
+
+    Raises:
+        CursorError: If the cursor can't be read or was issued for another query
+            or an older version of the data
+    """
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        offset = int(payload['o'])
+    except (ValueError, KeyError, TypeError):
+        raise CursorError("Invalid cursor")
+    if payload.get('k') != key or offset < 0:
+        raise CursorError("Cursor has expired; start the search again")
+    return offset
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Page size between 1 and MAX_PAGE_SIZE, defaulting to SEARCH_PAGE_SIZE"""
+    if limit is None:
+        return SEARCH_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def top_k(values: Iterable[T], k: int, key: Callable[[T], object]) -> List[T]:
+    """
+    The k largest values by key, largest first
+
+    Uses a bounded heap, so selecting a page from n results costs O(n log k)
+    rather than a full sort. Ties keep their input order, as sorted() would.
+    """
+    return heapq.nlargest(k, values, key=key)
+
+
+def paginate(values: List[T], limit: Optional[int], cursor: Optional[str], key: str,
+             score: Callable[[T], object]) -> Tuple[List[T], Optional[str], int]:
+    """
+    One page of values in descending score order
+
+    Args:
+        values (list): Every result of the query, unordered
+        limit (int): Page size
+        cursor (str): Cursor from a previous page, or None for the first page
+        key (str): query_key() of the query
+        score (callable): Ranking key; higher ranks first
+
+    Returns:
+        tuple: (page of values, cursor for the next page or None, total hits)
+    """
+    limit = clamp_limit(limit)
+    offset = decode_cursor(cursor, key)
+    page = top_k(values, offset + limit, score)[offset:]
+    next_offset = offset + len(page)
+    next_cursor = encode_cursor(key, next_offset) if next_offset < len(values) else None
+    return page, next_cursor, len(values)
@@ -0,0 +1,338 @@
+# percolator.py - Wishlist entries as standing queries, matched against each new listing
+#
+# Every wishlist entry is registered as a query: the terms of its item_name,
+# brand and model must all appear in a listing, its category (if any) must
+# equal the listing's, and the listing's price must be within its max_price.
+# Each query is filed in an inverted index under one anchor key (whichever of
+# its terms and category has the fewest queries), so percolating a listing only
+# looks at the postings of the listing's own terms and category and then
+# verifies those candidates, instead of evaluating every wishlist. Matched
+# users get one notification per listing in the notifications collection.
+#
+#   python -m firebase.percolator stats
+#   python -m firebase.percolator percolate ITEM_ID --dry-run
+import argparse
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from firebase_admin import firestore
+
+from .firebase_config import db
+from .campus import ALL_CAMPUSES, campus_of, partition_key
+from .metrics import set_gauge
+
+# Seconds between full rebuilds from the users collection; wishlist edits made
+# through user_service are applied immediately in between
+PERCOLATOR_REFRESH = float(os.getenv('PERCOLATOR_REFRESH', '3600'))
+NOTIFICATIONS_COLLECTION = 'notifications'
+WISHLIST_MATCH = 'wishlist_match'
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 500
+
+_WORD = re.compile(r'[a-z0-9]+')
+_STOP_WORDS = {
+    'a', 'an', 'and', 'any', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with',
+    'new', 'used', 'good', 'condition'
+}
+# Listing fields searched for a query's terms
+_ITEM_TEXT_FIELDS = ('name', 'description', 'brand', 'model', 'tags')
+
+
+def _term(word: str) -> str:
+    # Fold simple plurals so "bikes" satisfies "bike"
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def terms(text) -> Set[str]:
+    """Normalized search terms of a string, or of a list of strings"""
+    if isinstance(text, (list, tuple)):
+        text = ' '.join(str(value) for value in text)
+    return {_term(word) for word in _WORD.findall(str(text or '').lower()) if word not in _STOP_WORDS}
+
+
+def _category_key(category) -> Optional[str]:
+    category = str(category or '').strip().lower()
+    return f"category:{category}" if category else None
+
+
+def _price(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+class WishlistQuery:
+    """One wishlist entry compiled into a standing query"""
+
+    __slots__ = ('user_id', 'index', 'item_name', 'terms', 'category', 'max_price', 'campus')
+
+    def __init__(self, user_id: str, index: int, entry: Dict, campus: str):
+        self.user_id = user_id
+        self.index = index
+        self.item_name = entry.get('item_name', '')
+        self.terms = frozenset(
+            terms(entry.get('item_name')) | terms(entry.get('brand')) | terms(entry.get('model'))
+        )
+        self.category = _category_key(entry.get('category'))
+        self.max_price = _price(entry.get('max_price'))
+        self.campus = campus
+
+    def keys(self) -> Set[str]:
+        """Index keys this query can be anchored under"""
+        return set(self.terms) | ({self.category} if self.category else set())
+
+    def matches(self, item_terms: Set[str], category: Optional[str], price: Optional[float]) -> bool:
+        if not self.terms <= item_terms:
+            return False
+        if self.category is not None and self.category != category:
+            return False
+        if self.max_price is not None and price is not None and price > self.max_price:
+            return False
+        return True
+
+
+class Percolator:
+    """
+    Inverted index from terms and categories to the wishlist queries anchored on them
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, List[WishlistQuery]] = defaultdict(list)
+        self.by_user: Dict[str, List[Tuple[str, WishlistQuery]]] = {}
+        self.lock = threading.Lock()
+        self.built_at = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(queries) for queries in self.by_user.values())
+
+    def _remove_user(self, user_id: str):
+        for key, query in self.by_user.pop(user_id, ()):
+            posting = self.postings.get(key)
+            if posting is None:
+                continue
+            posting[:] = [other for other in posting if other is not query]
+            if not posting:
+                del self.postings[key]
+
+    def register(self, user_id: str, wishlist: List[Dict], campus: Optional[str] = None):
+        """
+        Replace a user's registered queries with their current wishlist
+
+        Entries without any terms or category match too broadly to alert on
+        and are skipped.
+
+        Args:
+            user_id (str): Wishlist owner
+            wishlist (list): Wishlist entries
+            campus (str): Owner's campus; listings from other partitions don't match
+        """
+        partition = partition_key(campus)
+        with self.lock:
+            self._remove_user(user_id)
+            registered = []
+            for index, entry in enumerate(wishlist or []):
+                if not isinstance(entry, Mapping):
+                    continue
+                query = WishlistQuery(user_id, index, entry, partition)
+                keys = query.keys()
+                if not keys:
+                    continue
+                # Anchor on the key with the fewest queries so far: a listing
+                # must contain all of a query's keys, so any one of them finds it
+                anchor = min(keys, key=lambda key: (len(self.postings.get(key, ())), -len(key), key))
+                self.postings[anchor].append(query)
+                registered.append((anchor, query))
+            if registered:
+                self.by_user[user_id] = registered
+
+    def unregister(self, user_id: str):
+        with self.lock:
+            self._remove_user(user_id)
+
+    def percolate(self, item: Dict) -> List[WishlistQuery]:
+        """
+        Wishlist queries a listing satisfies
+
+        Args:
+            item (dict): Listing with name, description, category, price, campus, user_id
+
+        Returns:
+            list: Matching queries, excluding the listing owner's own wishlist
+        """
+        item_terms = set()
+        for field in _ITEM_TEXT_FIELDS:
+            item_terms |= terms(item.get(field))
+        category = _category_key(item.get('category'))
+        price = _price(item.get('price'))
+        partition = partition_key(campus_of(item))
+        owner = item.get('user_id')
+
+        keys = item_terms | ({category} if category else set())
+        matched = []
+        with self.lock:
+            for key in keys:
+                for query in self.postings.get(key, ()):
+                    if query.user_id == owner:
+                        continue
+                    if partition != ALL_CAMPUSES and query.campus != partition:
+                        continue
+                    if query.matches(item_terms, category, price):
+                        matched.append(query)
+        return matched
+
+    def stats(self) -> Dict:
+        with self.lock:
+            sizes = [len(posting) for posting in self.postings.values()]
+            return {
+                'users': len(self.by_user),
+                'queries': sum(sizes),
+                'keys': len(sizes),
+                'largest_posting': max(sizes) if sizes else 0
+            }
+
+
+_percolator = Percolator()
+_build_lock = threading.Lock()
+
+
+def _build(percolator: Percolator):
+    fresh = Percolator()
+    for doc in db.collection('users').select(['wishlist', 'campus']).stream():
+        profile = doc.to_dict()
+        fresh.register(doc.id, profile.get('wishlist') or [], campus_of(profile))
+    with percolator.lock:
+        percolator.postings, percolator.by_user = fresh.postings, fresh.by_user
+        percolator.built_at = time.time()
+    set_gauge('percolator_queries', len(percolator))
+
+
+def get_percolator() -> Percolator:
+    """
+    Get the shared percolator, loading every wishlist on first use and every PERCOLATOR_REFRESH seconds
+
+    Returns:
+        Percolator: Shared index
+    """
+    if time.time() - _percolator.built_at > PERCOLATOR_REFRESH:
+        with _build_lock:
+            if time.time() - _percolator.built_at > PERCOLATOR_REFRESH:
+                _build(_percolator)
+    return _percolator
+
+
+def update_wishlist(user_id: str, wishlist: List[Dict], campus: Optional[str] = None):
+    """Re-register a user's wishlist after it changes, if the percolator is loaded"""
+    if _percolator.built_at:
+        _percolator.register(user_id, wishlist, campus)
+
+
+def notify_matches(item_id: str, item: Dict, dry_run: bool = False) -> Dict[str, List[str]]:
+    """
+    Percolate a new listing and notify every user whose wishlist it satisfies
+
+    Each matched user gets one notification per listing, however many of
+    their wishlist entries it matches. Failures are logged and never block
+    the listing.
+
+    Args:
+        item_id (str): ID of the new listing
+        item (dict): The listing as written
+        dry_run (bool): Find matches without writing notifications
+
+    Returns:
+        dict: Matched user ID to the wishlist item names the listing matched
+    """
+    try:
+        matched: Dict[str, List[str]] = defaultdict(list)
+        for query in get_percolator().percolate(item):
+            matched[query.user_id].append(query.item_name)
+        if dry_run or not matched:
+            return dict(matched)
+
+        now = datetime.now(timezone.utc)
+        users = list(matched.items())
+        for start in range(0, len(users), BATCH_SIZE):
+            batch = db.batch()
+            for user_id, wishlist_names in users[start:start + BATCH_SIZE]:
+                # One document per user and listing, so a retry doesn't notify twice
+                reference = db.collection(NOTIFICATIONS_COLLECTION).document(f"{user_id}_{item_id}")
+                batch.set(reference, {
+                    'user_id': user_id,
+                    'type': WISHLIST_MATCH,
+                    'item_id': item_id,
+                    'item_name': item.get('name', ''),
+                    'price': item.get('price', 0),
+                    'wishlist_items': wishlist_names,
+                    'read': False,
+                    'created_at': now
+                })
+            batch.commit()
+        return dict(matched)
+    except Exception as e:
+        print(f"Error notifying wishlist matches: {str(e)}")
+        return {}
+
+
+def get_notifications(user_id: str, limit: int = 20) -> List[Dict]:
+    """
+    A user's most recent notifications
+
+    Args:
+        user_id (str): ID of the user
+        limit (int): Maximum notifications to return
+
+    Returns:
+        list: Notification dicts including 'id', newest first
+    """
+    try:
+        query = (db.collection(NOTIFICATIONS_COLLECTION)
+                 .where('user_id', '==', user_id)
+                 .order_by('created_at', direction=firestore.Query.DESCENDING)
+                 .limit(limit))
+        return [{**doc.to_dict(), 'id': doc.id} for doc in query.stream()]
+    except Exception as e:
+        print(f"Error getting notifications: {str(e)}")
+        return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wishlist percolator")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="load every wishlist and print index statistics")
+    percolate_parser = commands.add_parser('percolate', help="notify users whose wishlists match an item")
+    percolate_parser.add_argument('item_id')
+    percolate_parser.add_argument('--dry-run', action='store_true', help="print matches without notifying")
+    args = parser.parse_args()
+
+    if db is None:
+        print("Error: Firestore is not initialized")
+        raise SystemExit(1)
+
+    if args.command == 'stats':
+        stats = get_percolator().stats()
+        print(f"{stats['queries']} wishlist queries from {stats['users']} users under {stats['keys']} keys "
+              f"(largest posting {stats['largest_posting']})")
+        return
+
+    doc = db.collection('items').document(args.item_id).get()
+    if not doc.exists:
+        print(f"No item {args.item_id}")
+        raise SystemExit(1)
+    matched = notify_matches(doc.id, doc.to_dict(), dry_run=args.dry_run)
+    verb = "Would notify" if args.dry_run else "Notified"
+    print(f"{verb} {len(matched)} users")
+    for user_id, wishlist_names in matched.items():
+        print(f"  {user_id}: {', '.join(wishlist_names)}")
+
+
+if __name__ == "__main__":
+    main()
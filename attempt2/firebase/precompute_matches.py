@@ -0,0 +1,288 @@
+# precompute_matches.py - Offline job computing wishlist and trade matches for every user
+#
+# Run from the attempt2 directory, e.g. every 30 minutes from cron:
+#   python -m firebase.precompute_matches --workers 4
+# An interrupted run resumes from its checkpoint file on the next start.
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .firebase_config import db
+from .campus import campus_of, partition_key
+from .catalog import is_active, load_items
+from .records import UserRecord, to_document
+from .search_service import match_wishlist, find_item_matches
+from .semantic_index import SemanticIndex, build_index
+
+DEFAULT_CHECKPOINT = 'precompute_matches.checkpoint.json'
+# Matches kept per user, so documents stay well under Firestore's size limit
+MAX_MATCHES = 50
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+# Fields copied from a listing into a match document
+MATCH_ITEM_FIELDS = (
+    'id', 'name', 'description', 'category', 'condition', 'price', 'for_sale',
+    'for_trade', 'looking_for', 'trade_categories', 'user_id', 'username', 'location'
+)
+
+# Worker process state, set once per process by _init_worker
+_items_by_campus: Dict[str, List[Dict]] = {}
+_items_by_owner: Dict[str, List[Dict]] = {}
+_users: Dict[str, Dict] = {}
+_users_by_campus: Dict[str, List[str]] = {}
+_semantic_by_campus: Dict[str, SemanticIndex] = {}
+_use_gemini = False
+
+
+def _slim(item: Dict) -> Dict:
+    slim = {field: item[field] for field in MATCH_ITEM_FIELDS if field in item}
+    if item.get('images'):
+        slim['images'] = item['images'][:1]
+    return slim
+
+
+def _init_worker(items: List[Dict], users: Dict[str, Dict], use_gemini: bool):
+    global _items_by_campus, _items_by_owner, _users, _users_by_campus, _use_gemini, _semantic_by_campus
+    _users = users
+    _semantic_by_campus = {}
+    _use_gemini = use_gemini
+    # Users are only matched against listings and traders on their own campus
+    _items_by_campus = {}
+    _items_by_owner = {}
+    for item in items:
+        _items_by_campus.setdefault(partition_key(campus_of(item)), []).append(item)
+        _items_by_owner.setdefault(item.get('user_id'), []).append(item)
+    _users_by_campus = {}
+    for user_id, user in users.items():
+        _users_by_campus.setdefault(partition_key(user['campus']), []).append(user_id)
+
+
+def _semantic_index(campus: str) -> SemanticIndex:
+    """Semantic index over a campus's listings, built once per worker on first use"""
+    index = _semantic_by_campus.get(campus)
+    if index is None:
+        index = _semantic_by_campus[campus] = build_index(_items_by_campus.get(campus, []))
+    return index
+
+
+def _trade_matches(user_id: str, user: Dict) -> List[Dict]:
+    """Users who list something this user wants and want something this user lists"""
+    wishlist = user.get('wishlist') or []
+    user_items = _items_by_owner.get(user_id, [])
+    if not wishlist or not user_items:
+        return []
+
+    trade_matches = []
+    for other_id in _users_by_campus.get(partition_key(user['campus']), []):
+        other = _users[other_id]
+        if other_id == user_id or not other.get('wishlist'):
+            continue
+        other_items = _items_by_owner.get(other_id, [])
+        if not other_items:
+            continue
+
+        offered = find_item_matches(user_items, other['wishlist'])
+        wanted = find_item_matches(other_items, wishlist)
+        if offered and wanted:
+            offered_ids = {match['item_id'] for match in offered}
+            wanted_ids = {match['item_id'] for match in wanted}
+            trade_matches.append({
+                'current_user': {
+                    'id': user_id,
+                    'username': user.get('username', ''),
+                    'offered_items': [_slim(item) for item in user_items if item['id'] in offered_ids]
+                },
+                'other_user': {
+                    'id': other_id,
+                    'username': other.get('username', ''),
+                    'offered_items': [_slim(item) for item in other_items if item['id'] in wanted_ids]
+                },
+                'match_score': 0.5,
+                'explanation': "Basic trade match based on text matching"
+            })
+    return trade_matches[:MAX_MATCHES]
+
+
+def _match_partition(index: int, user_ids: List[str]) -> tuple:
+    """
+    Compute match documents for one partition of users (runs in a worker process)
+
+    Returns:
+        tuple: (partition index, {user_id: match document fields}, failed user IDs)
+    """
+    results = {}
+    failed = []
+    for user_id in user_ids:
+        user = _users.get(user_id)
+        if user is None:
+            continue
+        try:
+            campus = partition_key(user['campus'])
+            campus_items = _items_by_campus.get(campus, [])
+            wishlist_matches = match_wishlist(user_id, user.get('wishlist') or [], campus_items,
+                                              use_gemini=_use_gemini, semantic=_semantic_index(campus))
+            results[user_id] = {
+                'matches': [
+                    {'wishlist_item': match['wishlist_item'],
+                     'matched_item': {
+                         **_slim(match['matched_item']),
+                         'match_score': match['matched_item']['match_score'],
+                         'match_explanation': match['matched_item']['match_explanation'],
+                         'trade_details': match['matched_item']['trade_details']
+                     }}
+                    for match in wishlist_matches[:MAX_MATCHES]
+                ],
+                'trade_matches': _trade_matches(user_id, user)
+            }
+        except Exception as e:
+            print(f"Error matching user {user_id}: {str(e)}")
+            failed.append(user_id)
+    return index, results, failed
+
+
+def _load_checkpoint(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    # Write-then-rename so a crash never leaves a truncated checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _write_matches(results: Dict[str, Dict], generation: str, generated_at: datetime):
+    batch = db.batch()
+    pending = 0
+    for user_id, fields in results.items():
+        batch.set(db.collection('matches').document(user_id), {
+            'user_id': user_id,
+            'generation': generation,
+            'generated_at': generated_at,
+            # Wishlist entries are WishlistEntry records, which Firestore can't encode
+            **to_document(fields)
+        })
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+
+def run(workers: int, partition_size: int, checkpoint_path: str, use_gemini: bool,
+        restart: bool = False) -> Dict:
+    """
+    Compute and store matches for every user, resuming an interrupted run
+
+    Args:
+        workers (int): Worker processes
+        partition_size (int): Users per partition (the unit of checkpointing)
+        checkpoint_path (str): Progress file; removed once the run completes
+        use_gemini (bool): Rank wishlist matches with Gemini instead of text matching
+        restart (bool): Ignore an existing checkpoint
+
+    Returns:
+        dict: Run summary
+    """
+    if db is None:
+        raise RuntimeError("Firestore is not initialized")
+
+    checkpoint = None if restart else _load_checkpoint(checkpoint_path)
+    users = {}
+    for doc in db.collection('users').stream():
+        profile = doc.to_dict()
+        users[doc.id] = UserRecord({
+            'username': profile.get('username', ''),
+            'wishlist': profile.get('wishlist') or [],
+            'campus': campus_of(profile)
+        })
+    items = [item for item in load_items() if is_active(item)]
+
+    if checkpoint is None:
+        # Ordered by campus so each partition touches as few campuses as possible
+        user_ids = sorted(users, key=lambda user_id: (users[user_id]['campus'], user_id))
+        now = datetime.now(timezone.utc)
+        checkpoint = {
+            'generation': now.strftime('%Y%m%dT%H%M%SZ'),
+            'started_at': now.isoformat(),
+            'partitions': [user_ids[i:i + partition_size] for i in range(0, len(user_ids), partition_size)],
+            'completed': [],
+            'failed_users': []
+        }
+        _save_checkpoint(checkpoint_path, checkpoint)
+    else:
+        print(f"Resuming generation {checkpoint['generation']}: "
+              f"{len(checkpoint['completed'])}/{len(checkpoint['partitions'])} partitions done")
+
+    generation = checkpoint['generation']
+    generated_at = datetime.fromisoformat(checkpoint['started_at'])
+    completed = set(checkpoint['completed'])
+    remaining = [i for i in range(len(checkpoint['partitions'])) if i not in completed]
+
+    # Spawned workers never inherit the parent's gRPC channels, which are not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(items, users, use_gemini)) as pool:
+        futures = [pool.submit(_match_partition, i, checkpoint['partitions'][i]) for i in remaining]
+        for future in as_completed(futures):
+            index, results, failed = future.result()
+            _write_matches(results, generation, generated_at)
+            checkpoint['completed'].append(index)
+            checkpoint['failed_users'].extend(failed)
+            _save_checkpoint(checkpoint_path, checkpoint)
+            print(f"Partition {index + 1}/{len(checkpoint['partitions'])}: {len(results)} users written")
+
+    summary = {
+        'generation': generation,
+        'started_at': generated_at,
+        'completed_at': datetime.now(timezone.utc),
+        'users': sum(len(partition) for partition in checkpoint['partitions']),
+        'failed_users': checkpoint['failed_users']
+    }
+    db.collection('match_runs').document(generation).set(summary)
+    os.remove(checkpoint_path)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute wishlist and trade matches for all users")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--partition-size', type=int, default=50,
+                        help="users per partition; progress is checkpointed per partition")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="checkpoint file path")
+    parser.add_argument('--restart', action='store_true', help="discard any checkpoint and start a new generation")
+    parser.add_argument('--no-gemini', action='store_true', help="use text matching only")
+    parser.add_argument('--every', type=float, default=0,
+                        help="keep running, starting a new generation every N minutes")
+    args = parser.parse_args()
+
+    while True:
+        started = time.time()
+        try:
+            summary = run(args.workers, args.partition_size, args.checkpoint,
+                          use_gemini=not args.no_gemini, restart=args.restart)
+            print(f"Generation {summary['generation']} complete: {summary['users']} users, "
+                  f"{len(summary['failed_users'])} failed, {time.time() - started:.1f}s")
+        except Exception as e:
+            print(f"Error precomputing matches: {str(e)}")
+        if not args.every:
+            break
+        # Only the first run may discard a checkpoint
+        args.restart = False
+        time.sleep(max(0, args.every * 60 - (time.time() - started)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# projections.py - Field-projected reads and slim item summaries for list views
+#
+# List pages render a handful of fields per item. Reads here use Firestore
+# field masks (select()) so only those fields cross the wire, and with
+# ITEM_SUMMARIES=1 a denormalized item_summaries collection is kept in sync
+# on writes for list pages to read instead of items.
+#
+# Fill item_summaries for existing items before turning it on:
+#   python -m firebase.projections backfill
+import argparse
+import os
+from typing import Dict, List, Optional, Sequence
+
+from .firebase_config import db
+from .campus import CAMPUS_FIELD, campus_of
+from .schema import ACTIVE, LEGACY_ACTIVE_FIELD, STATUS_FIELD, item_status
+
+# Keep item_summaries in sync on writes and read list views from it
+ITEM_SUMMARIES = os.getenv('ITEM_SUMMARIES', '0') == '1'
+SUMMARY_COLLECTION = 'item_summaries'
+# Description characters kept in a summary (cards show a teaser, not the full text)
+SUMMARY_DESCRIPTION_CHARS = 160
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+# Fields read by item cards in browse and search results
+CARD_FIELDS = (
+    'name', 'category', 'description', 'condition', 'location', 'image_url', 'images',
+    'price', 'for_sale', 'for_trade', 'looking_for', 'user_id'
+)
+# Fields shown on the My Listings page; editing loads the full document
+LISTING_FIELDS = (
+    'name', 'category', 'description', 'brand', 'model', 'year', 'size', 'color',
+    'for_sale', 'price', 'for_trade', 'looking_for', 'shipping', 'images', STATUS_FIELD,
+    LEGACY_ACTIVE_FIELD, CAMPUS_FIELD
+)
+
+# Item fields a summary is derived from, so summarize() can run on a projected read
+SUMMARY_SOURCE_FIELDS = (
+    'name', 'category', 'description', 'condition', 'location', 'images', 'price',
+    'for_sale', 'for_trade', 'trade_categories', 'looking_for', 'user_id', 'username',
+    STATUS_FIELD, LEGACY_ACTIVE_FIELD, 'created_at', 'updated_at', CAMPUS_FIELD
+)
+
+
+def project(item: Dict, fields: Optional[Sequence[str]]) -> Dict:
+    """
+    Copy of an item with only some fields (plus 'id')
+
+    Args:
+        item (dict): Item dict
+        fields (list): Fields to keep; None keeps everything
+
+    Returns:
+        dict: Projected item
+    """
+    if fields is None:
+        return item if isinstance(item, dict) else dict(item)
+    projected = {field: item[field] for field in fields if field in item}
+    if 'id' in item:
+        projected['id'] = item['id']
+    return projected
+
+
+def fetch(query, fields: Optional[Sequence[str]] = None) -> List[Dict]:
+    """
+    Stream a query with a field mask
+
+    Args:
+        query: Firestore CollectionReference or Query
+        fields (list): Fields to fetch; None fetches whole documents
+
+    Returns:
+        list: Documents as dicts with 'id' set from the document ID
+    """
+    if fields is not None:
+        query = query.select(list(fields))
+    return [{**doc.to_dict(), 'id': doc.id} for doc in query.stream()]
+
+
+def summarize(item: Dict, partial: bool = False) -> Dict:
+    """
+    Slim list-view representation of an item
+
+    Args:
+        item (dict): Item dict, or only the changed fields when partial
+        partial (bool): Derive just the summary fields the input covers, for
+            merging into an existing summary
+
+    Returns:
+        dict: Summary fields
+    """
+    summary = {}
+    for field in ('name', 'category', 'condition', 'location', 'price', 'user_id', 'username',
+                  'created_at', 'updated_at'):
+        if field in item or not partial:
+            summary[field] = item.get(field)
+    if 'description' in item or not partial:
+        summary['description'] = (item.get('description') or '')[:SUMMARY_DESCRIPTION_CHARS]
+    if 'images' in item or not partial:
+        images = item.get('images') or []
+        summary['image_url'] = images[0] if images else None
+        summary['image_count'] = len(images)
+    if 'for_sale' in item or 'price' in item or not partial:
+        summary['for_sale'] = bool(item.get('for_sale', (item.get('price') or 0) > 0))
+    if 'for_trade' in item or not partial:
+        summary['for_trade'] = bool(item.get('for_trade', item.get('trade_categories') or item.get('looking_for')))
+    if STATUS_FIELD in item or LEGACY_ACTIVE_FIELD in item or not partial:
+        summary[STATUS_FIELD] = item_status(item)
+    if CAMPUS_FIELD in item or not partial:
+        summary[CAMPUS_FIELD] = campus_of(item)
+    return summary
+
+
+def sync_summary(item_id: str, item: Dict, partial: bool = False, batch=None):
+    """
+    Write an item's summary after the item is created or changed
+
+    Args:
+        item_id (str): Item ID
+        item (dict): Full item, or only the changed fields when partial
+        partial (bool): Merge into the existing summary instead of replacing it
+        batch: Optional WriteBatch to add the write to
+    """
+    if not ITEM_SUMMARIES:
+        return
+    try:
+        ref = db.collection(SUMMARY_COLLECTION).document(item_id)
+        summary = summarize(item, partial)
+        if batch is not None:
+            batch.set(ref, summary, merge=partial)
+        else:
+            ref.set(summary, merge=partial)
+    except Exception as e:
+        print(f"Error syncing item summary {item_id}: {str(e)}")
+
+
+def delete_summary(item_id: str, batch=None):
+    """Remove a deleted item's summary, optionally as part of a WriteBatch"""
+    if not ITEM_SUMMARIES:
+        return
+    try:
+        ref = db.collection(SUMMARY_COLLECTION).document(item_id)
+        if batch is not None:
+            batch.delete(ref)
+        else:
+            ref.delete()
+    except Exception as e:
+        print(f"Error deleting item summary {item_id}: {str(e)}")
+
+
+def get_item_summaries(user_id: Optional[str] = None, active_only: bool = False) -> List[Dict]:
+    """
+    Summaries of a user's items, or of every item
+
+    Reads item_summaries when ITEM_SUMMARIES is on, otherwise the items
+    collection with a field mask.
+
+    Args:
+        user_id (str): Only this user's items
+        active_only (bool): Skip inactive items
+
+    Returns:
+        list: Summary dicts including 'id'
+    """
+    if ITEM_SUMMARIES:
+        query = db.collection(SUMMARY_COLLECTION)
+        if user_id:
+            query = query.where('user_id', '==', user_id)
+        if active_only:
+            query = query.where(STATUS_FIELD, '==', ACTIVE)
+        return fetch(query)
+
+    query = db.collection('items')
+    if user_id:
+        query = query.where('user_id', '==', user_id)
+    if active_only:
+        query = query.where(STATUS_FIELD, '==', ACTIVE)
+    return [{**summarize(item), 'id': item['id']} for item in fetch(query, SUMMARY_SOURCE_FIELDS)]
+
+
+def backfill() -> int:
+    """
+    Write a summary for every item and drop summaries of deleted items
+
+    Returns:
+        int: Summaries written
+    """
+    written = 0
+    item_ids = set()
+    batch = db.batch()
+    pending = 0
+    for item in fetch(db.collection('items'), SUMMARY_SOURCE_FIELDS):
+        item_ids.add(item['id'])
+        batch.set(db.collection(SUMMARY_COLLECTION).document(item['id']), summarize(item))
+        written += 1
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    for doc in db.collection(SUMMARY_COLLECTION).select([]).stream():
+        if doc.id not in item_ids:
+            batch.delete(doc.reference)
+            pending += 1
+            if pending >= BATCH_SIZE:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+    if pending:
+        batch.commit()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the item_summaries collection")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('backfill', help="rebuild item_summaries from the items collection")
+    args = parser.parse_args()
+
+    if db is None:
+        print("Error: Firestore is not initialized")
+        raise SystemExit(1)
+    if args.command == 'backfill':
+        print(f"Wrote {backfill()} item summaries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# records.py - Compact slotted record types for items, users, wishlist entries and trade proposals
+#
+# A plain dict per document costs a hash table per item on top of its values.
+# Records keep known fields in __slots__ (fields a document doesn't have are
+# simply unset), put anything unexpected in a small overflow dict, and intern
+# low-cardinality strings such as category and condition so every record
+# shares one copy. Records are read-only Mappings: item['name'], item.get(),
+# 'price' in item, {**item} and dict(item) all behave as they do for dicts.
+#
+# Convert once, where documents enter memory (replica, catalog loads,
+# precompute_matches); code handing data to callers outside the catalog
+# should pass dict(record), and anything written back to Firestore must go
+# through to_document() first.
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+
+# Shared stand-in for the many empty lists (images, tags, looking_for...)
+_EMPTY = ()
+
+
+class Record(Mapping):
+    """
+    Read-only Mapping view over slotted fields plus an overflow dict
+
+    Subclasses set FIELDS (also their __slots__) and INTERNED, the subset of
+    string fields to intern.
+    """
+
+    __slots__ = ('_extra',)
+    FIELDS: tuple = ()
+    INTERNED: frozenset = frozenset()
+    _FIELD_SET: frozenset = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        clashes = set(cls.FIELDS) & set(dir(Mapping))
+        if clashes:
+            raise TypeError(f"{cls.__name__} fields shadow Mapping methods: {sorted(clashes)}")
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    def __init__(self, data: Mapping, doc_id: Optional[str] = None):
+        extra = None
+        fields = self._FIELD_SET
+        interned = self.INTERNED
+        for key, value in data.items():
+            if type(value) is list and not value:
+                value = _EMPTY
+            if key in fields:
+                if key in interned and isinstance(value, str):
+                    value = sys.intern(value)
+                object.__setattr__(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[sys.intern(key) if isinstance(key, str) else key] = value
+        if doc_id is not None:
+            object.__setattr__(self, 'id', doc_id)
+        object.__setattr__(self, '_extra', extra)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._FIELD_SET:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __contains__(self, key) -> bool:
+        if key in self._FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        count = sum(1 for field in self.FIELDS if hasattr(self, field))
+        return count + (len(self._extra) if self._extra is not None else 0)
+
+    def to_dict(self) -> Dict:
+        """Plain dict copy of the record"""
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # Rebuild from a dict so records pickle into worker processes
+        return (type(self), (self.to_dict(),))
+
+    @classmethod
+    def of(cls, data: Mapping, doc_id: Optional[str] = None) -> 'Record':
+        """Convert a document dict, passing through values that are already this record type"""
+        if isinstance(data, cls) and doc_id is None:
+            return data
+        return cls(data, doc_id)
+
+
+class ItemRecord(Record):
+    """A listing from the items collection"""
+
+    FIELDS = (
+        'id', 'user_id', 'username', 'name', 'description', 'category', 'condition', 'price',
+        'status', 'schema_version', 'campus', 'location', 'geo', 'images', 'image_hashes',
+        'for_sale', 'for_trade', 'trade_categories', 'trade_conditions', 'looking_for',
+        'shipping', 'shipping_options', 'brand', 'model', 'year', 'size', 'color', 'tags',
+        'view_count', 'deleted', 'created_at', 'updated_at'
+    )
+    __slots__ = FIELDS
+    INTERNED = frozenset({'user_id', 'username', 'category', 'condition', 'status', 'campus', 'location'})
+
+
+class WishlistEntry(Record):
+    """One entry of a user's wishlist"""
+
+    FIELDS = ('item_name', 'item_type', 'category', 'description', 'condition', 'max_price',
+              'priority', 'added_at')
+    __slots__ = FIELDS
+    INTERNED = frozenset({'item_type', 'category', 'condition', 'priority'})
+
+
+class UserRecord(Record):
+    """A user profile; dict wishlist entries become WishlistEntry records"""
+
+    FIELDS = ('id', 'uid', 'email', 'username', 'campus', 'wishlist', 'is_active',
+              'created_at', 'updated_at', 'last_login', 'last_seen')
+    __slots__ = FIELDS
+    INTERNED = frozenset({'campus'})
+
+    def __init__(self, data: Mapping, doc_id: Optional[str] = None):
+        wishlist = data.get('wishlist')
+        if wishlist:
+            data = {**data, 'wishlist': tuple(
+                WishlistEntry.of(entry) if isinstance(entry, Mapping) else entry for entry in wishlist
+            )}
+        super().__init__(data, doc_id)
+
+
+class TradeProposalRecord(Record):
+    """A trade or trade proposal"""
+
+    FIELDS = (
+        'id', 'item_id', 'item_name', 'item_owner_id', 'proposer_id', 'proposer_name',
+        'proposed_item_id', 'proposed_item_name', 'proposed_item_category',
+        'proposed_item_condition', 'proposed_item_price', 'offered_items', 'message', 'status',
+        'created_at', 'updated_at', 'accepted_at', 'rejected_at'
+    )
+    __slots__ = FIELDS
+    INTERNED = frozenset({'item_owner_id', 'proposer_id', 'proposed_item_category',
+                          'proposed_item_condition', 'status'})
+
+
+def to_document(value):
+    """
+    Plain Firestore-encodable copy of a value that may contain records
+
+    Firestore only encodes real dicts and lists, so records and other
+    mappings become dicts and tuples (such as the shared empty one) lists,
+    recursively.
+    """
+    if isinstance(value, Mapping):
+        return {key: to_document(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_document(item) for item in value]
+    return value
+
+
+def json_default(value):
+    """json.dumps default= hook that serializes records as dicts and anything else as str"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    return str(value)
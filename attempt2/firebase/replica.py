@@ -0,0 +1,209 @@
+# replica.py - Local replica of the items collection kept current with updated_at delta syncs
+#
+# A warm replica only reads items whose updated_at is past its watermark,
+# plus tombstones for items deleted since then, so a refresh costs reads
+# proportional to churn instead of catalog size. A full scan still runs on
+# first use and every REPLICA_RECONCILE seconds to repair anything a delta
+# missed (writers with skewed clocks, documents written without updated_at).
+#
+# Tombstones past TOMBSTONE_TTL_DAYS can be dropped with:
+#   python -m firebase.replica purge-tombstones
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from .firebase_config import db
+from .campus import ALL_CAMPUSES, CAMPUS_FIELD, campus_of, scoped
+from .records import ItemRecord
+
+# Seconds between full reconciling scans
+REPLICA_RECONCILE = float(os.getenv('REPLICA_RECONCILE', '3600'))
+# Seconds subtracted from the watermark, so writes stamped by a slightly
+# slow clock are still picked up; re-reading them is harmless
+REPLICA_CLOCK_SKEW = float(os.getenv('REPLICA_CLOCK_SKEW', '5'))
+# Days tombstones are kept; replicas idle for longer fall back to a full scan
+TOMBSTONE_TTL_DAYS = float(os.getenv('TOMBSTONE_TTL_DAYS', '7'))
+
+TOMBSTONE_COLLECTION = 'item_tombstones'
+# Soft-delete marker: items with deleted=True are dropped from replicas
+DELETED_FIELD = 'deleted'
+
+
+def _utc(value) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def record_deletion(item_id: str, item: Optional[Dict] = None, batch=None):
+    """
+    Leave a tombstone for a hard-deleted item so replicas drop it on their next delta
+
+    Args:
+        item_id (str): Deleted item's ID
+        item (dict): The item as it was, for its campus
+        batch: Optional WriteBatch to add the write to
+    """
+    try:
+        ref = db.collection(TOMBSTONE_COLLECTION).document(item_id)
+        tombstone = {
+            'deleted_at': datetime.now(timezone.utc),
+            CAMPUS_FIELD: campus_of(item or {})
+        }
+        if batch is not None:
+            batch.set(ref, tombstone)
+        else:
+            ref.set(tombstone)
+    except Exception as e:
+        print(f"Error recording deletion of item {item_id}: {str(e)}")
+
+
+def purge_tombstones() -> int:
+    """
+    Delete tombstones older than TOMBSTONE_TTL_DAYS
+
+    Returns:
+        int: Tombstones deleted
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_TTL_DAYS)
+    purged = 0
+    for doc in db.collection(TOMBSTONE_COLLECTION).where('deleted_at', '<', cutoff).stream():
+        doc.reference.delete()
+        purged += 1
+    return purged
+
+
+class CatalogReplica:
+    """
+    In-memory copy of one campus partition of the items collection
+
+    sync() brings it up to date: a full scan the first time and every
+    REPLICA_RECONCILE seconds, otherwise a delta read of items changed and
+    tombstones written since the watermark.
+    """
+
+    def __init__(self, campus: str = ALL_CAMPUSES):
+        self.campus = campus
+        self.documents: Dict[str, ItemRecord] = {}
+        self.watermark: Optional[datetime] = None
+        self.reconciled_at = 0.0
+        self.lock = threading.Lock()
+        self.last_sync: Dict = {}
+
+    def _query(self, collection: str):
+        query = db.collection(collection)
+        return query if self.campus == ALL_CAMPUSES else scoped(query, self.campus)
+
+    def _advance(self, stamp):
+        stamp = _utc(stamp)
+        if stamp is not None and (self.watermark is None or stamp > self.watermark):
+            self.watermark = stamp
+
+    def _apply(self, item_id: str, data: Dict) -> bool:
+        """Upsert one document; returns False if it is soft-deleted and was dropped"""
+        self._advance(data.get('updated_at'))
+        if data.get(DELETED_FIELD):
+            self.documents.pop(item_id, None)
+            return False
+        self.documents[item_id] = ItemRecord(data, item_id)
+        return True
+
+    def _full_scan(self) -> Dict:
+        started = datetime.now(timezone.utc)
+        self.documents = {}
+        self.watermark = None
+        reads = 0
+        for doc in self._query('items').stream():
+            reads += 1
+            self._apply(doc.id, doc.to_dict())
+        # Everything stamped before the scan started has been read; anything
+        # written during it is re-read by the next delta
+        self.watermark = started
+        self.reconciled_at = time.time()
+        return {'mode': 'full', 'reads': reads, 'items': len(self.documents)}
+
+    def _delta(self) -> Dict:
+        since = self.watermark - timedelta(seconds=REPLICA_CLOCK_SKEW)
+        reads = changed = removed = 0
+
+        for doc in self._query('items').where('updated_at', '>', since).stream():
+            reads += 1
+            if self._apply(doc.id, doc.to_dict()):
+                changed += 1
+            else:
+                removed += 1
+
+        for doc in self._query(TOMBSTONE_COLLECTION).where('deleted_at', '>', since).stream():
+            reads += 1
+            self._advance(doc.to_dict().get('deleted_at'))
+            if self.documents.pop(doc.id, None) is not None:
+                removed += 1
+        return {'mode': 'delta', 'reads': reads, 'changed': changed, 'removed': removed,
+                'items': len(self.documents)}
+
+    def sync(self, full: bool = False) -> Dict:
+        """
+        Bring the replica up to date
+
+        Args:
+            full (bool): Force a reconciling full scan
+
+        Returns:
+            dict: 'mode' ('full' or 'delta'), documents read, changes applied
+                and the replica size
+        """
+        with self.lock:
+            stale = time.time() - self.reconciled_at >= REPLICA_RECONCILE
+            tombstones_expired = (self.watermark is not None and
+                                  datetime.now(timezone.utc) - self.watermark >= timedelta(days=TOMBSTONE_TTL_DAYS))
+            if full or self.watermark is None or stale or tombstones_expired:
+                self.last_sync = self._full_scan()
+            else:
+                self.last_sync = self._delta()
+            return self.last_sync
+
+    def items(self) -> List[ItemRecord]:
+        """Current documents as item records including 'id'"""
+        with self.lock:
+            return list(self.documents.values())
+
+
+_replicas: Dict[str, CatalogReplica] = {}
+_replicas_lock = threading.Lock()
+
+
+def get_replica(campus: str = ALL_CAMPUSES) -> CatalogReplica:
+    """
+    Get the process-wide replica for a campus partition
+
+    Args:
+        campus (str): Campus partition key, or ALL_CAMPUSES
+
+    Returns:
+        CatalogReplica: Shared replica (call sync() before reading)
+    """
+    with _replicas_lock:
+        replica = _replicas.get(campus)
+        if replica is None:
+            replica = _replicas[campus] = CatalogReplica(campus)
+        return replica
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog replica maintenance")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('purge-tombstones', help=f"delete tombstones older than {TOMBSTONE_TTL_DAYS:g} days")
+    args = parser.parse_args()
+
+    if db is None:
+        print("Error: Firestore is not initialized")
+        raise SystemExit(1)
+    if args.command == 'purge-tombstones':
+        print(f"Purged {purge_tombstones()} tombstones")
+
+
+if __name__ == "__main__":
+    main()
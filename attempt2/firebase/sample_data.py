@@ -66,7 +66,7 @@ SAMPLE_ITEMS = [
         "price": 750.00,
         "for_trade": True,
         "looking_for": ["PlayStation 5", "Apple Watch"],
-        "active": True,
+        "status": "active",
         "specs": {
             "frame_size": "M",
             "year": "2021",
@@ -85,7 +85,7 @@ SAMPLE_ITEMS = [
         "price": 1800.00,
         "for_trade": True,
         "looking_for": ["Apple Watch", "PlayStation 5"],
-        "active": True,
+        "status": "active",
         "specs": {
             "model": "M3",
             "year": "1954",
@@ -104,7 +104,7 @@ SAMPLE_ITEMS = [
         "price": 350.00,
         "for_trade": True,
         "looking_for": ["Trek Marlin 7", "Fender Stratocaster"],
-        "active": True,
+        "status": "active",
         "specs": {
             "model": "Series 7",
             "size": "45mm",
@@ -124,7 +124,7 @@ SAMPLE_ITEMS = [
         "price": 450.00,
         "for_trade": True,
         "looking_for": ["Trek Marlin 7", "Leica M3"],
-        "active": True,
+        "status": "active",
         "specs": {
             "model": "Digital Edition",
             "storage": "825GB SSD",
@@ -143,7 +143,7 @@ SAMPLE_ITEMS = [
         "price": 1400.00,
         "for_trade": True,
         "looking_for": ["Leica M3", "Antique Books"],
-        "active": True,
+        "status": "active",
         "specs": {
             "model": "American Professional II",
             "year": "2019",
@@ -163,7 +163,7 @@ SAMPLE_ITEMS = [
         "price": 2500.00,
         "for_trade": True,
         "looking_for": ["Fender Stratocaster", "Trek Marlin 7"],
-        "active": True,
+        "status": "active",
         "specs": {
             "notable_books": [
                 "A Tale of Two Cities (1859)",
@@ -0,0 +1,176 @@
+# schema.py - Canonical item schema and the migration that rewrites existing items into it
+#
+# Item availability lives in one field, status ('active', 'inactive' or
+# 'sold'). Older documents carry an active boolean instead (or as well);
+# item_status() reads either form, and the migration rewrites them so every
+# listing query can filter on status and hit a composite index declared in
+# firestore.indexes.json.
+#
+#   python -m firebase.schema migrate --dry-run
+#   python -m firebase.schema migrate            # resumes an interrupted run
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from firebase_admin import firestore
+
+from .firebase_config import db
+
+STATUS_FIELD = 'status'
+ACTIVE = 'active'
+INACTIVE = 'inactive'
+SOLD = 'sold'
+ITEM_STATUSES = (ACTIVE, INACTIVE, SOLD)
+# Legacy boolean replaced by status
+LEGACY_ACTIVE_FIELD = 'active'
+
+SCHEMA_VERSION_FIELD = 'schema_version'
+ITEM_SCHEMA_VERSION = 2
+
+DEFAULT_CHECKPOINT = 'schema_migration.checkpoint.json'
+# Documents read and rewritten per batch (Firestore allows 500 writes per batch)
+PAGE_SIZE = 400
+
+
+def item_status(item: Dict) -> str:
+    """
+    Canonical status of an item in either the current or the legacy schema
+
+    Args:
+        item (dict): Item dict
+
+    Returns:
+        str: One of ITEM_STATUSES
+    """
+    status = item.get(STATUS_FIELD)
+    if status in ITEM_STATUSES:
+        return status
+    if LEGACY_ACTIVE_FIELD in item:
+        return ACTIVE if item[LEGACY_ACTIVE_FIELD] else INACTIVE
+    return ACTIVE
+
+
+def is_active(item: Dict) -> bool:
+    """Whether an item is listed"""
+    return item_status(item) == ACTIVE
+
+
+def migration_updates(item: Dict) -> Dict:
+    """
+    Field updates that bring an item to ITEM_SCHEMA_VERSION
+
+    Args:
+        item (dict): Item dict as stored
+
+    Returns:
+        dict: Updates for DocumentReference.update(); empty if already current
+    """
+    if item.get(SCHEMA_VERSION_FIELD) == ITEM_SCHEMA_VERSION and LEGACY_ACTIVE_FIELD not in item:
+        return {}
+    updates = {
+        STATUS_FIELD: item_status(item),
+        SCHEMA_VERSION_FIELD: ITEM_SCHEMA_VERSION,
+        # Catalog replicas pick rewritten documents up by updated_at
+        'updated_at': datetime.now(timezone.utc)
+    }
+    if LEGACY_ACTIVE_FIELD in item:
+        updates[LEGACY_ACTIVE_FIELD] = firestore.DELETE_FIELD
+    if 'created_at' not in item:
+        updates['created_at'] = item.get('updated_at') or updates['updated_at']
+    return updates
+
+
+def _load_checkpoint(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    # Write-then-rename so a crash never leaves a truncated checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def migrate(dry_run: bool = False, checkpoint_path: str = DEFAULT_CHECKPOINT,
+            restart: bool = False, page_size: int = PAGE_SIZE) -> Dict[str, int]:
+    """
+    Rewrite items into the canonical schema, one batch per page of documents
+
+    Pages are read in document ID order and the last ID of every committed
+    page is checkpointed, so an interrupted migration resumes where it
+    stopped. Rerunning a finished migration only reads.
+
+    Args:
+        dry_run (bool): Count documents that need rewriting without writing
+        checkpoint_path (str): Progress file; removed once the migration completes
+        restart (bool): Ignore an existing checkpoint
+        page_size (int): Documents per page and batch
+
+    Returns:
+        dict: Documents 'scanned' and 'updated' (or due, on a dry run)
+    """
+    checkpoint = None if restart or dry_run else _load_checkpoint(checkpoint_path)
+    if checkpoint is None:
+        checkpoint = {'last_id': None, 'scanned': 0, 'updated': 0}
+    else:
+        print(f"Resuming after item {checkpoint['last_id']}: {checkpoint['scanned']} scanned, "
+              f"{checkpoint['updated']} updated")
+
+    while True:
+        query = db.collection('items').order_by('__name__').limit(page_size)
+        if checkpoint['last_id']:
+            query = query.start_after({'__name__': checkpoint['last_id']})
+        docs = list(query.stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        pending = 0
+        for doc in docs:
+            updates = migration_updates(doc.to_dict())
+            if updates:
+                pending += 1
+                if not dry_run:
+                    batch.update(doc.reference, updates)
+        if pending and not dry_run:
+            batch.commit()
+
+        checkpoint['last_id'] = docs[-1].id
+        checkpoint['scanned'] += len(docs)
+        checkpoint['updated'] += pending
+        if not dry_run:
+            _save_checkpoint(checkpoint_path, checkpoint)
+        if len(docs) < page_size:
+            break
+
+    if not dry_run and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return {'scanned': checkpoint['scanned'], 'updated': checkpoint['updated']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Item schema maintenance")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help=f"rewrite items to schema version {ITEM_SCHEMA_VERSION}")
+    migrate_parser.add_argument('--dry-run', action='store_true', help="count documents without writing")
+    migrate_parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="checkpoint file path")
+    migrate_parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+    migrate_parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help="documents per batch")
+    args = parser.parse_args()
+
+    if db is None:
+        print("Error: Firestore is not initialized")
+        raise SystemExit(1)
+    counts = migrate(args.dry_run, args.checkpoint, args.restart, min(args.page_size, 500))
+    verb = "need rewriting" if args.dry_run else "rewritten"
+    print(f"Scanned {counts['scanned']} items, {counts['updated']} {verb}")
+
+
+if __name__ == "__main__":
+    main()
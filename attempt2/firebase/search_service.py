@@ -1,176 +1,305 @@
 # search_service.py - Search and item discovery functionality
-from .firebase_app import db
+from .firebase_config import db
 from .user_service import get_user_profile
-from .gemini import generate_content
+from .gemini import generate_content, is_available
 import json
 import datetime
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Optional
+import numpy as np
+from .campus import campus_of, scoped
+from .catalog import get_catalog
+from .pagination import paginate, query_key, top_k
+from .projections import project
+from .records import json_default
+from .schema import is_active
+from .semantic_index import SEMANTIC_MIN_SCORE, SEMANTIC_SHORTLIST, get_semantic_index
+from .metrics import instrument_module
+from .firestore_tracker import track_module
 
-def search_items(search_query):
+# Recent Gemini rankings, so later pages of a search reuse the first page's call
+_RANKING_CACHE_SIZE = 32
+_rankings = OrderedDict()
+_rankings_lock = threading.Lock()
+
+def _relevance(match):
+    return match['relevance_score']
+
+def search_items(search_query, limit=None, cursor=None, campus=None, fields=None):
     """
     Search all active items using semantic search with Gemini
     
     Args:
         search_query (str): Search query
+        limit (int): Results per page; defaults to SEARCH_PAGE_SIZE
+        cursor (str): next_cursor from the previous page, or None for the first page
+        campus (str): Searcher's campus, or ALL_CAMPUSES to search every campus
+        fields (list): Only return these item fields (e.g. projections.CARD_FIELDS)
+        
+    Returns:
+        dict: Result with success status, items, next_cursor (None on the last
+            page) and total_hits, or error
+    """
+    try:
+        catalog = get_catalog(campus=campus)
+        key = query_key(catalog.campus, catalog.loaded_at, search_query.strip().lower())
+        
+        # Rank once per query and catalog version; paging through results reuses it
+        with _rankings_lock:
+            matches = _rankings.get(key)
+            if matches is not None:
+                _rankings.move_to_end(key)
+        if matches is None:
+            items = catalog.get_items(np.flatnonzero(catalog.active))
+            matches = score_search_matches(search_query, items)
+            with _rankings_lock:
+                _rankings[key] = matches
+                if len(_rankings) > _RANKING_CACHE_SIZE:
+                    _rankings.popitem(last=False)
+        
+        page, next_cursor, total_hits = paginate(matches, limit, cursor, key, _relevance)
+        items = [
+            {
+                **project(catalog.get_item(match['item_id']), fields),
+                'relevance_score': match['relevance_score'],
+                'match_explanation': match['explanation']
+            }
+            for match in page
+        ]
+        return {'success': True, 'items': items, 'next_cursor': next_cursor, 'total_hits': total_hits}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def score_search_matches(search_query, items, use_gemini=True):
+    """
+    Score already-loaded items against a search query
+    
+    Args:
+        search_query (str): Search query
+        items (list): Active item dicts including 'id'
+        use_gemini (bool): Ask Gemini to rank results; otherwise use text matching
+        
+    Returns:
+        list: {'item_id', 'relevance_score', 'explanation'} dicts, one per matching
+            item, in no particular order
+    """
+    # Use Gemini to analyze search query and items
+    prompt = f"""
+    Analyze this search query and list of items to find the best matches.
+    Consider semantic meaning, categories, and item details.
+    
+    Search Query: {search_query}
+    
+    Items:
+    {json.dumps(items, indent=2, default=json_default)}
+    
+    For each item, provide a relevance score (0-1) and explanation.
+    Return as JSON with format:
+    {{
+        "matches": [
+            {{
+                "item_id": "id",
+                "relevance_score": 0.95,
+                "explanation": "Why this is a good match"
+            }}
+        ]
+    }}
+    """
+    
+    # Get Gemini's analysis, skipping the call while the model is unhealthy
+    response = generate_content(prompt) if use_gemini and is_available() else ""
+    try:
+        analysis = json.loads(response)
+        if "matches" not in analysis:
+            raise ValueError("Gemini response has no matches")
+    except:
+        # Fallback to basic matching if Gemini response isn't valid JSON
+        analysis = {"matches": []}
+        for item in items:
+            if (search_query.lower() in item.get('name', '').lower() or 
+                search_query.lower() in item.get('description', '').lower()):
+                analysis["matches"].append({
+                    "item_id": item['id'],
+                    "relevance_score": 0.5,
+                    "explanation": "Basic text match"
+                })
+    
+    # Keep one well-formed match per known item; the model can repeat or invent IDs
+    known_ids = {item['id'] for item in items}
+    matches = {}
+    for match in analysis["matches"]:
+        if not isinstance(match, dict) or match.get('item_id') not in known_ids:
+            continue
+        try:
+            score = float(match.get('relevance_score', 0))
+        except (TypeError, ValueError):
+            continue
+        if match['item_id'] not in matches or score > matches[match['item_id']]['relevance_score']:
+            matches[match['item_id']] = {
+                'item_id': match['item_id'],
+                'relevance_score': score,
+                'explanation': match.get('explanation', '')
+            }
+    return list(matches.values())
+
+def rank_search_results(search_query, items, use_gemini=True, limit=None):
+    """
+    Rank already-loaded items against a search query
+    
+    Args:
+        search_query (str): Search query
+        items (list): Active item dicts including 'id'
+        use_gemini (bool): Ask Gemini to rank results; otherwise use text matching
+        limit (int): Return only the best this many
         
     Returns:
-        dict: Result with success status and items or error
+        list: Matching items with 'relevance_score' and 'match_explanation', best first
+    """
+    matches = score_search_matches(search_query, items, use_gemini)
+    matches = top_k(matches, len(matches) if limit is None else limit, _relevance)
+    
+    # Get full item details for matches
+    items_by_id = {item['id']: item for item in items}
+    return [
+        {
+            **items_by_id[match['item_id']],
+            'relevance_score': match['relevance_score'],
+            'match_explanation': match['explanation']
+        }
+        for match in matches
+    ]
+
+def find_potential_matches(user_id):
+    """
+    Find potential matches between user's wishlist and listed items using Gemini
+    
+    Args:
+        user_id (str): User's ID
+        
+    Returns:
+        dict: Result with success status and matches or error
     """
     try:
-        # Query for active items
-        items_ref = db.collection('items').where('active', '==', True)
-        docs = items_ref.stream()
+        # Get current user's wishlist
+        user_profile = get_user_profile(user_id)
+        if not user_profile['success']:
+            return {'success': False, 'error': user_profile['error']}
         
-        # Get all items
-        items = []
-        for doc in docs:
-            items.append({'id': doc.id, **doc.to_dict()})
+        user_wishlist = user_profile['data'].get('wishlist', [])
+        
+        # Active items on the user's campus, from the shared catalog and its semantic index
+        catalog = get_catalog(campus=campus_of(user_profile['data']))
+        all_items = catalog.get_items(np.flatnonzero(catalog.active))
+        semantic = get_semantic_index(catalog)
+        
+        return {'success': True, 'matches': match_wishlist(user_id, user_wishlist, all_items, semantic=semantic)}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def match_wishlist(user_id, wishlist, all_items, use_gemini=True, semantic=None):
+    """
+    Match wishlist items against already-loaded listings
+    
+    Args:
+        user_id (str): Owner of the wishlist; their own listings are skipped
+        wishlist (list): Wishlist entries with at least 'item_name'
+        all_items (list): Active item dicts including 'id'
+        use_gemini (bool): Ask Gemini to rank matches; otherwise use text matching
+        semantic (SemanticIndex): Index over all_items; Gemini then only sees each
+            entry's SEMANTIC_SHORTLIST closest listings, and text matching also
+            accepts listings above SEMANTIC_MIN_SCORE
+        
+    Returns:
+        list: {'wishlist_item', 'matched_item'} dicts
+    """
+    potential_matches = []
+    items_by_id = {item['id']: item for item in all_items}
+    
+    # Use Gemini to analyze matches
+    for wish_item in wishlist:
+        candidates = all_items
+        semantic_scores = {}
+        if semantic is not None:
+            semantic_scores = {
+                item_id: score for item_id, score in semantic.search_wishlist(wish_item, SEMANTIC_SHORTLIST * 2)
+                if item_id in items_by_id and items_by_id[item_id].get('user_id') != user_id
+            }
+            semantic_scores = dict(list(semantic_scores.items())[:SEMANTIC_SHORTLIST])
+            if semantic_scores:
+                candidates = [items_by_id[item_id] for item_id in semantic_scores]
         
-        # Use Gemini to analyze search query and items
         prompt = f"""
-        Analyze this search query and list of items to find the best matches.
-        Consider semantic meaning, categories, and item details.
+        Analyze this wishlist item and list of available items to find potential matches.
+        Consider all item details, categories, and trade preferences.
         
-        Search Query: {search_query}
+        Wishlist Item:
+        {json.dumps(wish_item, indent=2, default=json_default)}
         
-        Items:
-        {json.dumps(items, indent=2)}
+        Available Items:
+        {json.dumps(candidates, indent=2, default=json_default)}
         
-        For each item, provide a relevance score (0-1) and explanation.
+        For each potential match, provide a match score (0-1) and explanation.
         Return as JSON with format:
         {{
             "matches": [
                 {{
                     "item_id": "id",
-                    "relevance_score": 0.95,
-                    "explanation": "Why this is a good match"
+                    "match_score": 0.95,
+                    "explanation": "Why this is a good match",
+                    "trade_details": "What could be traded"
                 }}
             ]
         }}
         """
         
-        # Get Gemini's analysis
-        response = generate_content(prompt)
+        # Get Gemini's analysis, skipping the call while the model is unhealthy
+        response = generate_content(prompt) if use_gemini and is_available() else ""
         try:
             analysis = json.loads(response)
+            if "matches" not in analysis:
+                raise ValueError("Gemini response has no matches")
         except:
             # Fallback to basic matching if Gemini response isn't valid JSON
             analysis = {"matches": []}
-            for item in items:
-                if (search_query.lower() in item.get('name', '').lower() or 
-                    search_query.lower() in item.get('description', '').lower()):
+            for item in all_items:
+                if item.get('user_id') != user_id:  # Skip user's own items
+                    if (wish_item['item_name'].lower() in item.get('name', '').lower() or
+                        wish_item['item_name'].lower() in item.get('description', '').lower()):
+                        analysis["matches"].append({
+                            "item_id": item['id'],
+                            "match_score": 0.5,
+                            "explanation": "Basic text match",
+                            "trade_details": "Potential trade based on text match"
+                        })
+            matched_ids = {match['item_id'] for match in analysis["matches"]}
+            for item_id, score in semantic_scores.items():
+                if score >= SEMANTIC_MIN_SCORE and item_id not in matched_ids:
                     analysis["matches"].append({
-                        "item_id": item['id'],
-                        "relevance_score": 0.5,
-                        "explanation": "Basic text match"
+                        "item_id": item_id,
+                        "match_score": score,
+                        "explanation": "Semantic text match",
+                        "trade_details": "Potential trade based on similar descriptions"
                     })
         
-        # Sort matches by relevance score
-        matches = sorted(analysis["matches"], key=lambda x: x["relevance_score"], reverse=True)
+        # Sort matches by score
+        matches = sorted(analysis["matches"], key=lambda x: x["match_score"], reverse=True)
         
         # Get full item details for matches
-        matched_items = []
         for match in matches:
-            item = next((item for item in items if item['id'] == match['item_id']), None)
+            item = items_by_id.get(match['item_id'])
             if item:
-                item['relevance_score'] = match['relevance_score']
-                item['match_explanation'] = match['explanation']
-                matched_items.append(item)
-        
-        return {'success': True, 'items': matched_items}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
-
-def find_potential_matches(user_id):
-    """
-    Find potential matches between user's wishlist and listed items using Gemini
+                potential_matches.append({
+                    'wishlist_item': wish_item,
+                    'matched_item': {
+                        **item,
+                        'match_score': match['match_score'],
+                        'match_explanation': match['explanation'],
+                        'trade_details': match['trade_details']
+                    }
+                })
     
-    Args:
-        user_id (str): User's ID
-        
-    Returns:
-        dict: Result with success status and matches or error
-    """
-    try:
-        # Get current user's wishlist
-        user_profile = get_user_profile(user_id)
-        if not user_profile['success']:
-            return {'success': False, 'error': user_profile['error']}
-        
-        user_wishlist = user_profile['data'].get('wishlist', [])
-        potential_matches = []
-        
-        # Get all active items
-        items_ref = db.collection('items').where('active', '==', True)
-        docs = items_ref.stream()
-        all_items = []
-        for doc in docs:
-            all_items.append({'id': doc.id, **doc.to_dict()})
-        
-        # Use Gemini to analyze matches
-        for wish_item in user_wishlist:
-            prompt = f"""
-            Analyze this wishlist item and list of available items to find potential matches.
-            Consider all item details, categories, and trade preferences.
-            
-            Wishlist Item:
-            {json.dumps(wish_item, indent=2)}
-            
-            Available Items:
-            {json.dumps(all_items, indent=2)}
-            
-            For each potential match, provide a match score (0-1) and explanation.
-            Return as JSON with format:
-            {{
-                "matches": [
-                    {{
-                        "item_id": "id",
-                        "match_score": 0.95,
-                        "explanation": "Why this is a good match",
-                        "trade_details": "What could be traded"
-                    }}
-                ]
-            }}
-            """
-            
-            # Get Gemini's analysis
-            response = generate_content(prompt)
-            try:
-                analysis = json.loads(response)
-            except:
-                # Fallback to basic matching if Gemini response isn't valid JSON
-                analysis = {"matches": []}
-                for item in all_items:
-                    if item.get('user_id') != user_id:  # Skip user's own items
-                        if (wish_item['item_name'].lower() in item.get('name', '').lower() or
-                            wish_item['item_name'].lower() in item.get('description', '').lower()):
-                            analysis["matches"].append({
-                                "item_id": item['id'],
-                                "match_score": 0.5,
-                                "explanation": "Basic text match",
-                                "trade_details": "Potential trade based on text match"
-                            })
-            
-            # Sort matches by score
-            matches = sorted(analysis["matches"], key=lambda x: x["match_score"], reverse=True)
-            
-            # Get full item details for matches
-            for match in matches:
-                item = next((item for item in all_items if item['id'] == match['item_id']), None)
-                if item:
-                    potential_matches.append({
-                        'wishlist_item': wish_item,
-                        'matched_item': {
-                            **item,
-                            'match_score': match['match_score'],
-                            'match_explanation': match['explanation'],
-                            'trade_details': match['trade_details']
-                        }
-                    })
-        
-        return {'success': True, 'matches': potential_matches}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+    return potential_matches
 
 def find_trade_matches(user_id):
     """
@@ -205,8 +334,8 @@ def find_trade_matches(user_id):
         if not user_items:
             return {'success': True, 'matches': []}
         
-        # Get all other users
-        users_ref = db.collection('users')
+        # Get other users on the same campus
+        users_ref = scoped(db.collection('users'), campus_of(current_user))
         users_docs = users_ref.stream()
         
         trade_matches = []
@@ -243,12 +372,12 @@ def find_trade_matches(user_id):
             Consider all item details, categories, and trade preferences.
             
             Current User:
-            - Wishlist: {json.dumps(current_user.get('wishlist', []), indent=2)}
-            - Listed Items: {json.dumps(user_items, indent=2)}
+            - Wishlist: {json.dumps(current_user.get('wishlist', []), indent=2, default=json_default)}
+            - Listed Items: {json.dumps(user_items, indent=2, default=json_default)}
             
             Other User:
-            - Wishlist: {json.dumps(other_user.get('wishlist', []), indent=2)}
-            - Listed Items: {json.dumps(other_user_items, indent=2)}
+            - Wishlist: {json.dumps(other_user.get('wishlist', []), indent=2, default=json_default)}
+            - Listed Items: {json.dumps(other_user_items, indent=2, default=json_default)}
             
             Find potential trades where both users have items the other wants.
             Return as JSON with format:
@@ -264,10 +393,12 @@ def find_trade_matches(user_id):
             }}
             """
             
-            # Get Gemini's analysis
-            response = generate_content(prompt)
+            # Get Gemini's analysis, skipping the call while the model is unhealthy
+            response = generate_content(prompt) if is_available() else ""
             try:
                 analysis = json.loads(response)
+                if "matches" not in analysis:
+                    raise ValueError("Gemini response has no matches")
             except:
                 # Fallback to basic matching if Gemini response isn't valid JSON
                 analysis = {"matches": []}
@@ -326,7 +457,7 @@ def find_item_matches(listed_items, wishlist):
     # For each listed item, check if it matches any wishlist item
     for item in listed_items:
         # Skip inactive items
-        if not item.get('active', False):
+        if not is_active(item):
             continue
         
         # Only consider items marked for trade
@@ -421,4 +552,34 @@ def rate_trade_value(item1_id: str, item2_id: str) -> Dict:
             'item2_price': price2
         }
     except Exception as e:
-        return {'success': False, 'error': str(e)}
\ No newline at end of file
+        return {'success': False, 'error': str(e)}
+
+def get_precomputed_matches(user_id):
+    """
+    Read a user's matches written by the offline precompute_matches job
+    
+    Args:
+        user_id (str): User's ID
+        
+    Returns:
+        dict: Result with success status, matches, trade_matches, generation
+            and generated_at, or error if the job hasn't covered the user yet
+    """
+    try:
+        doc = db.collection('matches').document(user_id).get()
+        if not doc.exists:
+            return {'success': False, 'error': 'No precomputed matches yet'}
+        
+        data = doc.to_dict()
+        return {
+            'success': True,
+            'matches': data.get('matches', []),
+            'trade_matches': data.get('trade_matches', []),
+            'generation': data.get('generation'),
+            'generated_at': data.get('generated_at')
+        }
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+instrument_module(__name__)
+track_module(__name__)
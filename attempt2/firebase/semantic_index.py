@@ -0,0 +1,302 @@
+# semantic_index.py - Dense listing embeddings with an IVF nearest-neighbor index
+#
+# Listings are embedded with latent semantic analysis: TF-IDF over their text,
+# reduced to SEMANTIC_DIM dimensions with TruncatedSVD and L2-normalized, so
+# "mountain bike" and "trek bicycle" land near each other even without a
+# shared word. Vectors are stored as int8 codes with a per-row scale (or as
+# float32 with SEMANTIC_INT8=0) and grouped into clusters with k-means; a
+# query scores the cluster centroids and then only the listings in its
+# SEMANTIC_NPROBE closest clusters. Catalog reloads embed changed listings
+# with the existing model and file them under their nearest cluster; the
+# model and clusters are refit once SEMANTIC_REFIT of the listings changed.
+import copy
+import hashlib
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from .metrics import set_gauge
+
+# Embedding dimensions
+SEMANTIC_DIM = int(os.getenv('SEMANTIC_DIM', '128'))
+# Store vectors as int8 codes (4x smaller than float32)
+SEMANTIC_INT8 = os.getenv('SEMANTIC_INT8', '1') == '1'
+# Clusters in the IVF index; 0 picks about sqrt(listings)
+SEMANTIC_NLIST = int(os.getenv('SEMANTIC_NLIST', '0'))
+# Clusters scanned per query
+SEMANTIC_NPROBE = int(os.getenv('SEMANTIC_NPROBE', '8'))
+# Refit the model and clusters once this fraction of listings has changed
+SEMANTIC_REFIT = float(os.getenv('SEMANTIC_REFIT', '0.25'))
+# Larger catalogs get their first index built in the background
+SEMANTIC_INLINE = int(os.getenv('SEMANTIC_INLINE', '5000'))
+# Listings sent to Gemini per wishlist entry instead of the whole catalog
+SEMANTIC_SHORTLIST = int(os.getenv('SEMANTIC_SHORTLIST', '30'))
+# Cosine similarity at which a listing counts as a match without Gemini
+SEMANTIC_MIN_SCORE = float(os.getenv('SEMANTIC_MIN_SCORE', '0.5'))
+
+
+def _text(item: Dict) -> str:
+    tags = item.get('tags') or ()
+    return ' '.join(str(part) for part in (
+        item.get('name') or item.get('item_name') or '', item.get('brand') or '', item.get('model') or '',
+        item.get('category') or '', item.get('description') or '', ' '.join(map(str, tags))
+    ))
+
+
+def _fingerprint(item: Dict) -> str:
+    """Digest of the text that feeds an item's vector"""
+    return hashlib.md5(_text(item).encode('utf-8')).hexdigest()
+
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 codes and per-row scales, or the float32 vectors and unit scales"""
+    if not SEMANTIC_INT8:
+        return vectors.astype(np.float32), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class SemanticIndex:
+    """
+    LSA embeddings of listings in an IVF (inverted file) index
+
+    Rows are only ever appended; a changed or removed listing's old row is
+    marked dead and skipped until the next refit compacts the index.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.fingerprints: List[str] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.codes = np.zeros((0, 0), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.vectorizer: Optional[TfidfVectorizer] = None
+        self.svd: Optional[TruncatedSVD] = None
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.members: List[np.ndarray] = []
+        self.changed_since_fit = 0
+        self.built_from = None
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Unit-length float32 embeddings of texts; zero vectors for texts with no known words"""
+        if self.svd is None:
+            return np.zeros((len(texts), 0), dtype=np.float32)
+        return normalize(self.svd.transform(self.vectorizer.transform(texts))).astype(np.float32)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def _fit(self, items: List[Dict], fingerprints: List[str]):
+        texts = [_text(item) for item in items]
+        self.vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True, min_df=1)
+        try:
+            tfidf = self.vectorizer.fit_transform(texts)
+        except ValueError:
+            # No listings, or only stop words: an empty index
+            self.__init__()
+            return
+        dim = min(SEMANTIC_DIM, tfidf.shape[1] - 1, len(items) - 1)
+        if dim < 1:
+            self.__init__()
+            return
+        self.svd = TruncatedSVD(n_components=dim, random_state=0)
+        vectors = normalize(self.svd.fit_transform(tfidf)).astype(np.float32)
+
+        nlist = SEMANTIC_NLIST or int(np.sqrt(len(items)))
+        nlist = max(1, min(nlist, len(items)))
+        kmeans = MiniBatchKMeans(n_clusters=nlist, random_state=0, n_init=3, batch_size=1024)
+        kmeans.fit(vectors)
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+        assignments = self._assign(vectors)
+        self.members = [np.flatnonzero(assignments == cluster) for cluster in range(nlist)]
+
+        self.codes, self.scales = _quantize(vectors)
+        self.ids = [item['id'] for item in items]
+        self.row_of = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.fingerprints = fingerprints
+        self.alive = np.ones(len(items), dtype=bool)
+        self.changed_since_fit = 0
+
+    def refresh(self, items: List[Dict]):
+        """
+        Bring the index in line with the current listings
+
+        Args:
+            items (list): Listings including 'id'
+        """
+        fingerprints = [_fingerprint(item) for item in items]
+        current = {item['id'] for item in items}
+        removed = [item_id for item_id in self.row_of if item_id not in current]
+        changed = [
+            position for position, item in enumerate(items)
+            if self.row_of.get(item['id']) is None
+            or self.fingerprints[self.row_of[item['id']]] != fingerprints[position]
+        ]
+
+        if self.svd is None or \
+                self.changed_since_fit + len(changed) + len(removed) > SEMANTIC_REFIT * max(len(items), 1):
+            self._fit(items, fingerprints)
+            self._report()
+            return
+        if not changed and not removed:
+            return
+
+        # New arrays throughout, so a copy can be refreshed while this one serves
+        alive = self.alive.copy()
+        row_of = dict(self.row_of)
+        for item_id in removed:
+            alive[row_of.pop(item_id)] = False
+        for position in changed:
+            row = row_of.get(items[position]['id'])
+            if row is not None:
+                alive[row] = False
+
+        # Removal-only refreshes just mark rows dead; sklearn can't embed zero texts
+        if changed:
+            vectors = self.embed([_text(items[position]) for position in changed])
+            codes, scales = _quantize(vectors)
+            start = len(self.ids)
+            rows = start + np.arange(len(changed))
+            assignments = self._assign(vectors)
+            members = list(self.members)
+            for cluster in np.unique(assignments):
+                members[cluster] = np.concatenate([members[cluster], rows[assignments == cluster]])
+
+            ids = self.ids + [items[position]['id'] for position in changed]
+            fingerprints_by_row = self.fingerprints + [fingerprints[position] for position in changed]
+            for offset, position in enumerate(changed):
+                row_of[items[position]['id']] = start + offset
+
+            self.codes = np.concatenate([self.codes, codes])
+            self.scales = np.concatenate([self.scales, scales])
+            alive = np.concatenate([alive, np.ones(len(changed), dtype=bool)])
+            self.members = members
+            self.ids = ids
+            self.fingerprints = fingerprints_by_row
+        self.alive = alive
+        self.row_of = row_of
+        self.changed_since_fit += len(changed) + len(removed)
+        self._report()
+
+    def _report(self):
+        set_gauge('semantic_index_bytes', int(self.codes.nbytes + self.scales.nbytes + self.centroids.nbytes))
+        set_gauge('semantic_index_listings', len(self))
+
+    def search(self, vector: np.ndarray, k: int = 10, nprobe: int = SEMANTIC_NPROBE) -> List[Tuple[str, float]]:
+        """
+        Listings closest to a query embedding
+
+        Scans the nprobe clusters whose centroids are closest, widening the
+        probe until at least k live listings have been scored.
+
+        Args:
+            vector (np.ndarray): Unit-length query embedding from embed()
+            k (int): Listings to return
+            nprobe (int): Clusters to scan
+
+        Returns:
+            list: (item ID, cosine similarity) pairs, most similar first
+        """
+        if not len(self) or not vector.any():
+            return []
+        order = np.argsort(-(self.centroids @ vector))
+        nprobe = max(1, nprobe)
+        while True:
+            rows = np.concatenate([self.members[cluster] for cluster in order[:nprobe]])
+            rows = rows[self.alive[rows]]
+            if len(rows) >= k or nprobe >= len(order):
+                break
+            nprobe *= 2
+
+        scores = (self.codes[rows].astype(np.float32) @ vector) * self.scales[rows]
+        top = min(k, len(rows))
+        if top == 0:
+            return []
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(self.ids[rows[i]], float(scores[i])) for i in best]
+
+    def search_text(self, text: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Listings closest to free text, e.g. a wishlist description"""
+        if self.svd is None:
+            return []
+        return self.search(self.embed([text])[0], k)
+
+    def search_wishlist(self, entry: Dict, k: int = 10) -> List[Tuple[str, float]]:
+        """Listings closest to a wishlist entry's name, brand, model, category and description"""
+        return self.search_text(_text(entry), k)
+
+
+# One index per campus partition, plus the catalog each is being refreshed from
+_indexes: Dict[str, SemanticIndex] = {}
+_refreshing: Dict[str, object] = {}
+_index_lock = threading.Lock()
+
+
+def _refresh(catalog):
+    # refresh() only rebinds attributes, so the copy can be updated while
+    # the current index keeps answering queries
+    campus = catalog.campus
+    try:
+        index = copy.copy(_indexes.get(campus) or SemanticIndex())
+        index.refresh(catalog.get_items(np.flatnonzero(catalog.active)))
+        index.built_from = catalog
+        with _index_lock:
+            # A newer catalog's refresh may have started meanwhile; only its result is published
+            if _refreshing.get(campus) is catalog:
+                _indexes[campus] = index
+    except Exception as e:
+        print(f"Error refreshing semantic index: {str(e)}")
+        with _index_lock:
+            # Let the next get_semantic_index() call retry
+            if _refreshing.get(campus) is catalog:
+                del _refreshing[campus]
+
+
+def get_semantic_index(catalog) -> SemanticIndex:
+    """
+    Get the index for a catalog's campus, refreshing it when the catalog has been reloaded
+
+    Refreshes run in a background thread while the previous index keeps
+    serving. The first build runs inline for catalogs of up to
+    SEMANTIC_INLINE listings.
+
+    Args:
+        catalog (Catalog): Current catalog snapshot
+
+    Returns:
+        SemanticIndex: Shared index for the campus
+    """
+    campus = catalog.campus
+    with _index_lock:
+        index = _indexes.get(campus) or SemanticIndex()
+        stale = index.built_from is not catalog and _refreshing.get(campus) is not catalog
+        if stale:
+            _refreshing[campus] = catalog
+    if not stale:
+        return index
+
+    if index.built_from is None and len(catalog) <= SEMANTIC_INLINE:
+        _refresh(catalog)
+        return _indexes.get(campus, index)
+    threading.Thread(target=_refresh, args=(catalog,), daemon=True).start()
+    return index
+
+
+def build_index(items: List[Dict]) -> SemanticIndex:
+    """A standalone index over a list of listings, e.g. for a batch job"""
+    index = SemanticIndex()
+    index.refresh(items)
+    return index
@@ -0,0 +1,119 @@
+# session_memory.py - Per-session memory accounting for Streamlit session state
+#
+# Sessions should hold IDs, cursors and small form state, resolving items
+# against the shared catalog. memory_report() measures what a session
+# actually holds so regressions (a full item list parked in session state)
+# show up, and observe() keeps a process-wide total across live sessions.
+import os
+import sys
+import threading
+import time
+from typing import Dict, Mapping
+
+import numpy as np
+import pandas as pd
+
+from .metrics import set_gauge
+
+# Measure session state on every rerun and show the report in the sidebar
+SESSION_MEMORY_REPORT = os.getenv('SESSION_MEMORY_REPORT', '0') == '1'
+# Seconds after its last report that a session is treated as gone
+SESSION_REPORT_TTL = float(os.getenv('SESSION_REPORT_TTL', '1800'))
+
+# session ID -> (last report time, bytes)
+_sessions: Dict[str, tuple] = {}
+_sessions_lock = threading.Lock()
+
+
+def deep_sizeof(value, seen=None) -> int:
+    """
+    Approximate bytes held by a value and everything it references
+
+    Containers are walked recursively, numpy arrays and DataFrames report
+    their buffers, and shared objects are only counted once.
+
+    Args:
+        value: Object to measure
+
+    Returns:
+        int: Size in bytes
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (value.nbytes if value.base is None else 0)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in value)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        size += deep_sizeof(vars(value), seen)
+    return size
+
+
+def memory_report(state: Mapping) -> Dict:
+    """
+    Bytes held by each session state key
+
+    Args:
+        state (Mapping): st.session_state or any mapping
+
+    Returns:
+        dict: 'total_bytes' and 'keys', a list of (key, bytes) largest first
+    """
+    seen = set()
+    sizes = []
+    for key in list(state.keys()):
+        try:
+            sizes.append((str(key), deep_sizeof(state[key], seen)))
+        except Exception as e:
+            print(f"Error measuring session key {key}: {str(e)}")
+    sizes.sort(key=lambda entry: entry[1], reverse=True)
+    return {'total_bytes': sum(size for _, size in sizes), 'keys': sizes}
+
+
+def observe(session_id: str, state: Mapping) -> Dict:
+    """
+    Measure a session and update the process-wide session memory gauges
+
+    Sets session_state_bytes_total, session_state_bytes_max and
+    sessions_tracked over sessions reported within SESSION_REPORT_TTL.
+
+    Args:
+        session_id (str): Streamlit session ID
+        state (Mapping): That session's st.session_state
+
+    Returns:
+        dict: memory_report() for the session
+    """
+    report = memory_report(state)
+    now = time.time()
+    with _sessions_lock:
+        _sessions[session_id] = (now, report['total_bytes'])
+        for stale in [sid for sid, (seen_at, _) in _sessions.items() if now - seen_at > SESSION_REPORT_TTL]:
+            del _sessions[stale]
+        sizes = [size for _, size in _sessions.values()]
+    set_gauge('session_state_bytes_total', sum(sizes))
+    set_gauge('session_state_bytes_max', max(sizes))
+    set_gauge('sessions_tracked', len(sizes))
+    return report
+
+
+def sessions_summary() -> Dict:
+    """Sessions tracked by observe() and their total and largest footprint in bytes"""
+    with _sessions_lock:
+        sizes = [size for _, size in _sessions.values()]
+    return {
+        'sessions': len(sizes),
+        'total_bytes': sum(sizes),
+        'max_bytes': max(sizes) if sizes else 0
+    }
@@ -0,0 +1,348 @@
+# similar_items.py - Precomputed k-nearest-neighbor graph of similar listings
+import copy
+import hashlib
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+from .facets import PRICE_BUCKETS
+
+# Neighbors stored per item; more than the page shows so owner and
+# availability filters still leave enough
+SIMILAR_ITEMS_K = int(os.getenv('SIMILAR_ITEMS_K', '20'))
+# Refit the text vocabulary once this fraction of listings has changed
+SIMILAR_ITEMS_REFIT = float(os.getenv('SIMILAR_ITEMS_REFIT', '0.25'))
+# Larger catalogs get their first graph built in the background
+SIMILAR_ITEMS_INLINE = int(os.getenv('SIMILAR_ITEMS_INLINE', '5000'))
+# A trade is flagged fair when the cheaper item is worth at least this share of the other
+FAIR_TRADE_RATIO = float(os.getenv('FAIR_TRADE_RATIO', '0.8'))
+
+# Relative weight of each attribute against the item text
+ATTRIBUTE_WEIGHTS = {
+    'category': 0.6,
+    'condition': 0.2,
+    'price': 0.4,
+}
+
+# Similarity scores materialized at once when computing neighbors
+_BLOCK_CELLS = 4_000_000
+
+
+def _text(item: Dict) -> str:
+    return f"{item.get('name', '')} {item.get('brand', '')} {item.get('description', '')}"
+
+
+def _price_bucket(price) -> Optional[str]:
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    for label, low, high in PRICE_BUCKETS:
+        if low <= price < high:
+            return label
+    return None
+
+
+def _attributes(item: Dict) -> List[Tuple[str, float]]:
+    attributes = [(f"category={item.get('category') or 'Other'}", ATTRIBUTE_WEIGHTS['category'])]
+    if item.get('condition'):
+        attributes.append((f"condition={item['condition']}", ATTRIBUTE_WEIGHTS['condition']))
+    bucket = _price_bucket(item.get('price'))
+    if bucket:
+        attributes.append((f"price={bucket}", ATTRIBUTE_WEIGHTS['price']))
+    return attributes
+
+
+def _fingerprint(item: Dict) -> str:
+    """Digest of the fields that feed an item's vector"""
+    parts = [_text(item)] + [name for name, _ in _attributes(item)]
+    return hashlib.md5('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class SimilarItems:
+    """
+    k-nearest-neighbor graph over active listings
+
+    Each listing is an L2-normalized TF-IDF vector of its text joined with
+    hashed category, condition and price-bucket features, so the dot product
+    is the cosine similarity. refresh() only recomputes the rows whose
+    listings changed, plus rows that lost a neighbor to a deletion; other rows
+    merge in the changed listings' new scores. Words first seen after the last
+    refit are ignored until the next one.
+    """
+
+    def __init__(self, k: int = SIMILAR_ITEMS_K):
+        self.k = k
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.fingerprints: List[str] = []
+        self.vectorizer: Optional[TfidfVectorizer] = None
+        self.hasher = FeatureHasher(n_features=256, input_type='pair', alternate_sign=False)
+        self.vectors = None
+        self.neighbors = np.empty((0, k), dtype=np.int32)
+        self.scores = np.empty((0, k), dtype=np.float32)
+        self.built_from = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _vectorize(self, items: List[Dict]) -> sparse.csr_matrix:
+        text = self.vectorizer.transform([_text(item) for item in items])
+        attributes = self.hasher.transform([_attributes(item) for item in items])
+        return normalize(sparse.hstack([text, attributes], format='csr'))
+
+    def _top_k(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score rows against every listing and keep the best k"""
+        neighbors = np.full((len(rows), self.k), -1, dtype=np.int32)
+        scores = np.zeros((len(rows), self.k), dtype=np.float32)
+        k = min(self.k, len(self.ids) - 1)
+        if k <= 0:
+            return neighbors, scores
+
+        # Dense query blocks against the sparse matrix are several times
+        # faster than sparse-sparse products
+        block_size = max(1, _BLOCK_CELLS // max(self.vectors.shape))
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            similarity = cosine_similarity(self.vectors[block].toarray(), self.vectors)
+            similarity[np.arange(len(block)), block] = -np.inf
+            top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(similarity, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            neighbors[start:start + len(block), :k] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + len(block), :k] = np.take_along_axis(top_scores, order, axis=1)
+        return neighbors, scores
+
+    def _build(self, items: List[Dict], fingerprints: List[str]):
+        self.ids = [item['id'] for item in items]
+        self.row_of = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.fingerprints = fingerprints
+        self.vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True, min_df=1)
+        self.vectorizer.fit([_text(item) for item in items] or [''])
+        self.vectors = self._vectorize(items)
+        self.neighbors, self.scores = self._top_k(np.arange(len(items)))
+
+    def refresh(self, catalog):
+        """
+        Bring the graph in line with a catalog snapshot
+
+        Args:
+            catalog (Catalog): Current catalog
+        """
+        items = catalog.get_items(np.flatnonzero(catalog.active))
+        fingerprints = [_fingerprint(item) for item in items]
+        self.built_from = catalog
+
+        new_ids = [item['id'] for item in items]
+        new_ids_set = set(new_ids)
+        old_row = np.array([self.row_of.get(item_id, -1) for item_id in new_ids], dtype=np.int64)
+        changed = np.array([
+            row < 0 or self.fingerprints[row] != fingerprint
+            for row, fingerprint in zip(old_row, fingerprints)
+        ], dtype=bool)
+        removed = [item_id for item_id in self.ids if item_id not in new_ids_set]
+
+        if self.vectors is None or not items or \
+                changed.sum() + len(removed) > SIMILAR_ITEMS_REFIT * max(len(items), 1):
+            self._build(items, fingerprints)
+            return
+        if not changed.any() and not removed:
+            return
+
+        changed_rows = np.flatnonzero(changed)
+        changed_items = [items[row] for row in changed_rows]
+
+        # Assemble vectors in the new row order, reusing unchanged ones
+        stacked = sparse.vstack([self.vectors, self._vectorize(changed_items)], format='csr') \
+            if changed_items else self.vectors
+        source = old_row.copy()
+        source[changed_rows] = self.vectors.shape[0] + np.arange(len(changed_rows))
+        self.vectors = stacked[source]
+
+        # Old row -> new row; the trailing -1 maps padding (-1) to itself
+        old_to_new = np.full(len(self.ids) + 1, -1, dtype=np.int64)
+        kept = np.flatnonzero(old_row >= 0)
+        old_to_new[old_row[kept]] = kept
+
+        neighbors = np.full((len(items), self.k), -1, dtype=np.int32)
+        scores = np.zeros((len(items), self.k), dtype=np.float32)
+        neighbors[kept] = old_to_new[self.neighbors[old_row[kept]]]
+        scores[kept] = self.scores[old_row[kept]]
+
+        self.ids = new_ids
+        self.row_of = {item_id: row for row, item_id in enumerate(new_ids)}
+        self.fingerprints = fingerprints
+
+        # Rows that lost a neighbor to a deletion are recomputed in full
+        lost = (neighbors[kept] < 0) & (self.neighbors[old_row[kept]] >= 0)
+        recompute = np.union1d(changed_rows, kept[lost.any(axis=1)])
+        clean = np.setdiff1d(np.arange(len(items)), recompute)
+        self.neighbors, self.scores = neighbors, scores
+
+        # Removal-only refreshes have no new scores to merge
+        if len(clean) and len(changed_rows):
+            recompute = np.union1d(recompute, self._merge(clean, changed_rows))
+        if len(recompute):
+            self.neighbors[recompute], self.scores[recompute] = self._top_k(recompute)
+
+    def _merge(self, rows: np.ndarray, changed_rows: np.ndarray) -> np.ndarray:
+        """
+        Swap each changed listing's old score for its new one in the given rows
+
+        Returns:
+            np.ndarray: Rows where a listed neighbor's score dropped, whose
+                lists may now be missing a listing and need recomputing
+        """
+        dropped = []
+        block_size = max(1, _BLOCK_CELLS // len(changed_rows))
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            candidate_scores = cosine_similarity(
+                self.vectors[block], self.vectors[changed_rows], dense_output=True
+            ).astype(np.float32)
+            current = self.neighbors[block]
+            stale = np.isin(current, changed_rows)
+
+            # New score of each stale entry, to spot ones that fell
+            position = np.searchsorted(changed_rows, np.where(stale, current, changed_rows[0]))
+            new_scores = np.take_along_axis(candidate_scores, position, axis=1)
+            fell = (stale & (new_scores < self.scores[block] - 1e-6)).any(axis=1)
+            dropped.append(block[fell])
+
+            current_scores = np.where((current < 0) | stale, -np.inf, self.scores[block])
+            merged = np.hstack([current, np.broadcast_to(changed_rows, candidate_scores.shape)])
+            merged_scores = np.hstack([current_scores, candidate_scores])
+            order = np.argsort(-merged_scores, axis=1, kind='stable')[:, :self.k]
+            best = np.take_along_axis(merged, order, axis=1)
+            best_scores = np.take_along_axis(merged_scores, order, axis=1)
+            missing = ~np.isfinite(best_scores)
+            self.neighbors[block] = np.where(missing, -1, best)
+            self.scores[block] = np.where(missing, 0, best_scores)
+        return np.concatenate(dropped)
+
+    def similar(self, item_id: str) -> List[Tuple[str, float]]:
+        """
+        Stored neighbors of a listing
+
+        Args:
+            item_id (str): Item ID
+
+        Returns:
+            list: (item ID, cosine similarity) pairs, most similar first
+        """
+        row = self.row_of.get(item_id)
+        if row is None:
+            return []
+        return [
+            (self.ids[neighbor], float(score))
+            for neighbor, score in zip(self.neighbors[row], self.scores[row])
+            if neighbor >= 0
+        ]
+
+
+# One graph per campus partition, plus the catalog each is being refreshed from
+_graphs: Dict[str, SimilarItems] = {}
+_refreshing: Dict[str, object] = {}
+_graph_lock = threading.Lock()
+
+
+def _refresh(catalog):
+    # refresh() only rebinds attributes, so the copy can be updated while
+    # the current graph keeps answering lookups
+    campus = catalog.campus
+    try:
+        graph = copy.copy(_graphs.get(campus) or SimilarItems())
+        graph.refresh(catalog)
+        with _graph_lock:
+            # A newer catalog's refresh may have started meanwhile; only its result is published
+            if _refreshing.get(campus) is catalog:
+                _graphs[campus] = graph
+    except Exception as e:
+        print(f"Error refreshing similar items: {str(e)}")
+        with _graph_lock:
+            # Let the next get_similar_items() call retry
+            if _refreshing.get(campus) is catalog:
+                del _refreshing[campus]
+
+
+def get_similar_items(catalog) -> SimilarItems:
+    """
+    Get the graph for a catalog's campus, refreshing it when the catalog has been reloaded
+
+    Refreshes run in a background thread while the previous graph keeps
+    serving. The first build runs inline for catalogs of up to
+    SIMILAR_ITEMS_INLINE listings.
+
+    Args:
+        catalog (Catalog): Current catalog snapshot
+
+    Returns:
+        SimilarItems: Shared graph for the campus
+    """
+    campus = catalog.campus
+    with _graph_lock:
+        graph = _graphs.get(campus) or SimilarItems()
+        stale = graph.built_from is not catalog and _refreshing.get(campus) is not catalog
+        if stale:
+            _refreshing[campus] = catalog
+    if not stale:
+        return graph
+
+    if graph.built_from is None and len(catalog) <= SIMILAR_ITEMS_INLINE:
+        _refresh(catalog)
+        return _graphs.get(campus, graph)
+    threading.Thread(target=_refresh, args=(catalog,), daemon=True).start()
+    return graph
+
+
+def is_fair_trade(price, other_price) -> bool:
+    """True when both prices are known and within FAIR_TRADE_RATIO of each other"""
+    try:
+        price, other_price = float(price), float(other_price)
+    except (TypeError, ValueError):
+        return False
+    if price <= 0 or other_price <= 0:
+        return False
+    return min(price, other_price) / max(price, other_price) >= FAIR_TRADE_RATIO
+
+
+def suggest_trades(catalog, item_id: str, user_id: Optional[str] = None, limit: int = 5) -> List[Dict]:
+    """
+    Listings similar to an item that are open to trades
+
+    Args:
+        catalog (Catalog): Current catalog snapshot
+        item_id (str): Item being offered
+        user_id (str): Viewer; their own listings are skipped
+        limit (int): Maximum suggestions
+
+    Returns:
+        list: Item dicts with 'match_score' and 'is_fair' added
+    """
+    item = catalog.get_item(item_id)
+    if item is None:
+        return []
+
+    suggestions = []
+    for other_id, score in get_similar_items(catalog).similar(item_id):
+        row = catalog.row_of.get(other_id)
+        if row is None or not catalog.for_trade[row]:
+            continue
+        other = catalog.items[row]
+        if user_id and other.get('user_id') == user_id:
+            continue
+        suggestions.append({
+            **other,
+            'match_score': score,
+            'is_fair': is_fair_trade(item.get('price'), other.get('price'))
+        })
+        if len(suggestions) >= limit:
+            break
+    return suggestions
@@ -0,0 +1,411 @@
+# snapshot.py - Export and import marketplace collections as compressed columnar snapshots
+#
+#   python -m firebase.snapshot export snapshots/prod --format parquet
+#   python -m firebase.snapshot verify snapshots/prod
+#   python -m firebase.snapshot import snapshots/prod --collections items users
+#
+# A snapshot directory holds one file per collection plus manifest.json with
+# row counts, column types and SHA-256 checksums.
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+COLLECTIONS = ['users', 'items', 'trades', 'trade_proposals']
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow', 'jsonl': '.jsonl.gz'}
+MANIFEST = 'manifest.json'
+# Column holding each document's ID
+ID_COLUMN = '_id'
+# Parquet/Arrow column listing the fields a document stored as explicit nulls,
+# which would otherwise read back as absent
+NULLS_COLUMN = '_nulls'
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 500
+
+
+class SnapshotError(Exception):
+    """Raised for missing files, checksum mismatches and unsupported formats"""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise SnapshotError(
+            "Parquet and Arrow snapshots need pyarrow (pip install pyarrow); "
+            "use --format jsonl to snapshot without it"
+        )
+
+
+# ---- VALUE ENCODING ----
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat()}
+    return str(value)
+
+
+def _json_hook(value):
+    if len(value) == 1 and '$date' in value:
+        return datetime.fromisoformat(value['$date'])
+    return value
+
+
+# Reused because json.loads(object_hook=...) builds a new decoder per call
+_DECODER = json.JSONDecoder(object_hook=_json_hook)
+
+
+def _kind(values: Iterable) -> str:
+    """
+    Column type for a field across every document
+
+    Scalars of one type get a native column; anything nested or mixed is
+    stored as JSON text so it round-trips unchanged.
+    """
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add('bool')
+        elif isinstance(value, int):
+            kinds.add('int')
+        elif isinstance(value, float):
+            kinds.add('float')
+        elif isinstance(value, str):
+            kinds.add('string')
+        elif isinstance(value, datetime):
+            kinds.add('timestamp')
+        else:
+            kinds.add('json')
+    if kinds == {'int', 'float'}:
+        return 'float'
+    if len(kinds) == 1:
+        return kinds.pop()
+    return 'json' if kinds else 'string'
+
+
+def _encode(value, kind: str):
+    if value is None:
+        return None
+    if kind == 'json':
+        return json.dumps(value, default=_json_default, separators=(',', ':'))
+    if kind == 'float':
+        return float(value)
+    if kind == 'timestamp' and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _decode(value, kind: str):
+    if value is None:
+        return None
+    if kind == 'json':
+        return _DECODER.decode(value)
+    return value
+
+
+def _columns(documents: List[Dict]) -> Dict[str, str]:
+    fields = {}
+    for document in documents:
+        for field in document:
+            fields.setdefault(field, None)
+    return {field: _kind(document.get(field) for document in documents) for field in fields}
+
+
+# ---- FILE FORMATS ----
+
+def _arrow_type(pa, kind: str):
+    return {
+        'bool': pa.bool_(),
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'json': pa.string(),
+    }[kind]
+
+
+def _write(path: str, file_format: str, ids: List[str], documents: List[Dict], columns: Dict[str, str]):
+    if file_format == 'jsonl':
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for doc_id, document in zip(ids, documents):
+                f.write(json.dumps({ID_COLUMN: doc_id, **document}, default=_json_default,
+                                   separators=(',', ':')))
+                f.write('\n')
+        return
+
+    pa = _pyarrow()
+    arrays = {ID_COLUMN: pa.array(ids, type=pa.string())}
+    for field, kind in columns.items():
+        arrays[field] = pa.array([_encode(document.get(field), kind) for document in documents],
+                                 type=_arrow_type(pa, kind))
+    nulls = [[field for field, value in document.items() if value is None] or None for document in documents]
+    if any(nulls):
+        arrays[NULLS_COLUMN] = pa.array(nulls, type=pa.list_(pa.string()))
+    table = pa.table(arrays)
+    if file_format == 'parquet':
+        pa.parquet.write_table(table, path, compression='zstd')
+    else:
+        options = pa.ipc.IpcWriteOptions(compression='zstd')
+        with pa.ipc.new_file(path, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+
+def _read(path: str, file_format: str, columns: Dict[str, str]) -> List[Dict]:
+    if file_format == 'jsonl':
+        documents = []
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                documents.append(_DECODER.decode(line))
+        return documents
+
+    pa = _pyarrow()
+    if file_format == 'parquet':
+        table = pa.parquet.read_table(path)
+    else:
+        with pa.ipc.open_file(path) as reader:
+            table = reader.read_all()
+
+    # Decode column by column, then assemble rows, leaving out absent fields
+    # but restoring the ones stored as explicit nulls
+    names = [name for name in table.column_names if name != NULLS_COLUMN]
+    nulls = table.column(NULLS_COLUMN).to_pylist() if NULLS_COLUMN in table.column_names else None
+    decoded = []
+    for name in names:
+        values = table.column(name).to_pylist()
+        kind = columns.get(name)
+        if kind == 'json':
+            values = [_decode(value, kind) for value in values]
+        decoded.append(values)
+    documents = []
+    for position, row in enumerate(zip(*decoded)):
+        document = {name: value for name, value in zip(names, row) if value is not None}
+        if nulls and nulls[position]:
+            document.update(dict.fromkeys(nulls[position]))
+        documents.append(document)
+    return documents
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---- SNAPSHOTS ----
+
+def write_collection(directory: str, name: str, ids: List[str], documents: List[Dict],
+                     file_format: str = 'parquet') -> Dict:
+    """
+    Write one collection's documents to a snapshot file
+
+    Args:
+        directory (str): Snapshot directory (must exist)
+        name (str): Collection name, used for the file name
+        ids (list): Document IDs, parallel to documents
+        documents (list): Document dicts without their IDs
+        file_format (str): 'parquet', 'arrow' or 'jsonl'
+
+    Returns:
+        dict: The collection's manifest entry
+    """
+    columns = _columns(documents)
+    filename = f"{name}{FORMATS[file_format]}"
+    path = os.path.join(directory, filename)
+    _write(path, file_format, ids, documents, columns)
+    return {
+        'file': filename,
+        'rows': len(documents),
+        'columns': columns,
+        'bytes': os.path.getsize(path),
+        'sha256': _sha256(path)
+    }
+
+
+def write_manifest(directory: str, file_format: str, entries: Dict[str, Dict]) -> Dict:
+    """Write manifest.json for the collection entries returned by write_collection()"""
+    manifest = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'format': file_format,
+        'collections': entries
+    }
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def export_snapshot(db, directory: str, file_format: str = 'parquet',
+                    collections: Optional[List[str]] = None) -> Dict:
+    """
+    Export collections to a snapshot directory
+
+    Args:
+        db: Firestore client
+        directory (str): Output directory (created if missing)
+        file_format (str): 'parquet', 'arrow' or 'jsonl'
+        collections (list): Collection names; defaults to COLLECTIONS
+
+    Returns:
+        dict: The manifest written to the directory
+    """
+    if file_format not in FORMATS:
+        raise SnapshotError(f"Unknown format {file_format!r}; choose from {', '.join(FORMATS)}")
+    if file_format != 'jsonl':
+        _pyarrow()
+    os.makedirs(directory, exist_ok=True)
+
+    entries = {}
+    for name in collections or COLLECTIONS:
+        started = time.time()
+        ids, documents = [], []
+        for doc in db.collection(name).stream():
+            ids.append(doc.id)
+            documents.append(doc.to_dict())
+
+        entries[name] = write_collection(directory, name, ids, documents, file_format)
+        print(f"Exported {len(documents)} {name} in {time.time() - started:.1f}s")
+
+    return write_manifest(directory, file_format, entries)
+
+
+def read_manifest(directory: str) -> Dict:
+    """Load a snapshot's manifest"""
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        raise SnapshotError(f"No {MANIFEST} in {directory}")
+    with open(path) as f:
+        return json.load(f)
+
+
+def verify_snapshot(directory: str) -> Dict[str, bool]:
+    """
+    Check every file in a snapshot against its manifest checksum
+
+    Returns:
+        dict: Collection name to whether its file is intact
+    """
+    manifest = read_manifest(directory)
+    results = {}
+    for name, entry in manifest['collections'].items():
+        path = os.path.join(directory, entry['file'])
+        results[name] = os.path.exists(path) and _sha256(path) == entry['sha256']
+    return results
+
+
+def _load(directory: str, collection: str, verify: bool = True) -> List[Dict]:
+    manifest = read_manifest(directory)
+    entry = manifest['collections'].get(collection)
+    if entry is None:
+        raise SnapshotError(f"Snapshot {directory} has no {collection} collection")
+
+    path = os.path.join(directory, entry['file'])
+    if verify and _sha256(path) != entry['sha256']:
+        raise SnapshotError(f"Checksum mismatch for {path}")
+    return _read(path, manifest['format'], entry['columns'])
+
+
+def load_snapshot(directory: str, collection: str, verify: bool = True) -> List[Dict]:
+    """
+    Read one collection from a snapshot without touching Firestore
+
+    Args:
+        directory (str): Snapshot directory
+        collection (str): Collection name
+        verify (bool): Check the file's checksum first
+
+    Returns:
+        list: Documents, with the document ID under 'id' as load_items() returns them
+    """
+    documents = _load(directory, collection, verify)
+    for document in documents:
+        document['id'] = document.pop(ID_COLUMN)
+    return documents
+
+
+def import_snapshot(db, directory: str, collections: Optional[List[str]] = None,
+                    threads: int = 8) -> Dict[str, int]:
+    """
+    Write a snapshot back into Firestore with parallel batched writes
+
+    Documents keep their IDs, so importing twice overwrites rather than duplicates.
+
+    Args:
+        db: Firestore client
+        directory (str): Snapshot directory
+        collections (list): Collection names; defaults to every collection in the snapshot
+        threads (int): Batches committed concurrently
+
+    Returns:
+        dict: Collection name to documents written
+    """
+    manifest = read_manifest(directory)
+    written = {}
+    for name in collections or list(manifest['collections']):
+        started = time.time()
+        documents = _load(directory, name)
+        collection = db.collection(name)
+
+        def commit(chunk):
+            batch = db.batch()
+            for document in chunk:
+                batch.set(collection.document(document.pop(ID_COLUMN)), document)
+            batch.commit()
+            return len(chunk)
+
+        chunks = [documents[i:i + BATCH_SIZE] for i in range(0, len(documents), BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            written[name] = sum(pool.map(commit, chunks))
+        print(f"Imported {written[name]} {name} in {time.time() - started:.1f}s")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import marketplace snapshots")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="write collections to a snapshot directory")
+    export_parser.add_argument('directory')
+    export_parser.add_argument('--format', choices=list(FORMATS), default='parquet')
+    export_parser.add_argument('--collections', nargs='+', default=COLLECTIONS)
+
+    import_parser = commands.add_parser('import', help="write a snapshot back into Firestore")
+    import_parser.add_argument('directory')
+    import_parser.add_argument('--collections', nargs='+')
+    import_parser.add_argument('--threads', type=int, default=8)
+
+    verify_parser = commands.add_parser('verify', help="check snapshot checksums")
+    verify_parser.add_argument('directory')
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'verify':
+            results = verify_snapshot(args.directory)
+            for name, ok in results.items():
+                print(f"{name}: {'ok' if ok else 'CHECKSUM MISMATCH'}")
+            raise SystemExit(0 if all(results.values()) else 1)
+
+        from .firebase_config import db
+        if db is None:
+            raise SnapshotError("Firestore is not initialized")
+        if args.command == 'export':
+            export_snapshot(db, args.directory, args.format, args.collections)
+        else:
+            import_snapshot(db, args.directory, args.collections, args.threads)
+    except SnapshotError as e:
+        print(f"Error: {str(e)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# token_cache.py - Cache of verified Firebase ID tokens and warm signing certificates
+#
+# Verifying an ID token checks its signature against Google's public
+# certificates. Session restoration verifies the same token on every
+# Streamlit rerun, so decoded claims are cached under a hash of the token
+# until the token expires, and the certificates are refetched in the
+# background before their HTTP cache entry lapses so a verification never
+# waits on the network.
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from .metrics import set_gauge
+
+# Verified tokens kept; least recently used are evicted first
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '1024'))
+# Seconds before a token's expiry that its cache entry is dropped
+TOKEN_EXPIRY_MARGIN = float(os.getenv('TOKEN_EXPIRY_MARGIN', '30'))
+# Seconds between background certificate refreshes; 0 disables the refresher
+CERT_REFRESH_INTERVAL = float(os.getenv('CERT_REFRESH_INTERVAL', '1800'))
+
+
+def token_key(id_token: str) -> str:
+    """Cache key for a token; raw tokens are never stored"""
+    return hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+
+
+class TokenCache:
+    """
+    Bounded LRU map of token hash to decoded claims, honouring each token's 'exp'
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, margin: float = TOKEN_EXPIRY_MARGIN):
+        self.max_size = max_size
+        self.margin = margin
+        self.entries: 'OrderedDict[str, Tuple[float, Dict]]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id_token: str) -> Optional[Dict]:
+        """Claims of a previously verified token, or None if unknown or expiring"""
+        key = token_key(id_token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() < entry[0]:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, id_token: str, claims: Dict):
+        """Remember a verified token until shortly before its expiry"""
+        expires = float(claims.get('exp', 0)) - self.margin
+        if expires <= time.time():
+            return
+        key = token_key(id_token)
+        with self.lock:
+            self.entries[key] = (expires, claims)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            size = len(self.entries)
+        set_gauge('token_cache_size', size)
+
+    def discard(self, id_token: str):
+        """Forget a token, e.g. on logout or revocation"""
+        with self.lock:
+            self.entries.pop(token_key(id_token), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def verify_cached(cache: TokenCache, id_token: str, verify: Callable[[str], Dict]) -> Dict:
+    """
+    Decoded claims for a token, verifying it only on a cache miss
+
+    Args:
+        cache (TokenCache): Cache to consult and fill
+        id_token (str): ID token
+        verify (callable): Full verification, e.g. firebase_admin.auth.verify_id_token;
+            its exceptions propagate and failures are not cached
+
+    Returns:
+        dict: Decoded token claims
+    """
+    claims = cache.get(id_token)
+    if claims is None:
+        claims = verify(id_token)
+        cache.put(id_token, claims)
+    return claims
+
+
+class CertificateRefresher:
+    """
+    Background thread that keeps the signing certificate cache warm
+
+    fetch() should go through the same HTTP-caching transport the verifier
+    uses, so each refresh replaces its cached certificates.
+    """
+
+    def __init__(self, fetch: Callable[[], None], interval: float = CERT_REFRESH_INTERVAL):
+        self.fetch = fetch
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start refreshing (once); a no-op when the interval is 0"""
+        with self.lock:
+            if self.interval <= 0 or self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name='cert-refresher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.fetch()
+            except Exception as e:
+                print(f"Error refreshing token certificates: {str(e)}")
+            if self.stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        self.stopped.set()
@@ -1,7 +1,10 @@
 # trade_service.py - Functions for handling trade operations
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, List, Optional
 from .firebase_config import db
+from .archive_service import archive_collection
+from .metrics import instrument_module
+from .firestore_tracker import track_module
 
 def propose_trade(user_id: str, item_id: str, trade_data: Dict) -> Dict:
     """
@@ -24,8 +27,8 @@ def propose_trade(user_id: str, item_id: str, trade_data: Dict) -> Dict:
             'offered_items': trade_data.get('offered_items', []),
             'message': trade_data.get('message', ''),
             'status': 'pending',
-            'created_at': datetime.now(),
-            'updated_at': datetime.now()
+            'created_at': datetime.now(timezone.utc),
+            'updated_at': datetime.now(timezone.utc)
         })
         
         return {
@@ -38,12 +41,13 @@ def propose_trade(user_id: str, item_id: str, trade_data: Dict) -> Dict:
             'error': str(e)
         }
 
-def get_trade_proposals(user_id: str) -> Dict:
+def get_trade_proposals(user_id: str, include_archived: bool = False) -> Dict:
     """
     Get all trade proposals for a user's items.
     
     Args:
         user_id (str): ID of the user
+        include_archived (bool): Also return closed trades moved to trades_archive
         
     Returns:
         dict: Result with success status and list of trade proposals or error message
@@ -55,6 +59,9 @@ def get_trade_proposals(user_id: str) -> Dict:
         
         # Get trade proposals for these items
         trades_ref = db.collection('trades').where('item_id', 'in', item_ids).get()
+        if include_archived:
+            trades_ref = list(trades_ref) + list(
+                db.collection(archive_collection('trades')).where('item_id', 'in', item_ids).get())
         trades = []
         
         for trade in trades_ref:
@@ -108,7 +115,7 @@ def accept_trade(trade_id: str, user_id: str) -> Dict:
         # Update trade status
         trade_ref.update({
             'status': 'accepted',
-            'updated_at': datetime.now()
+            'updated_at': datetime.now(timezone.utc)
         })
         
         return {
@@ -156,7 +163,7 @@ def reject_trade(trade_id: str, user_id: str) -> Dict:
         # Update trade status
         trade_ref.update({
             'status': 'rejected',
-            'updated_at': datetime.now()
+            'updated_at': datetime.now(timezone.utc)
         })
         
         return {
@@ -166,4 +173,7 @@ def reject_trade(trade_id: str, user_id: str) -> Dict:
         return {
             'success': False,
             'error': str(e)
-        } 
\ No newline at end of file
+        }
+
+instrument_module(__name__)
+track_module(__name__)
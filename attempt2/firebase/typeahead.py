@@ -0,0 +1,314 @@
+# typeahead.py - Popularity-weighted prefix completions for the global search box
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from .campus import ALL_CAMPUSES, item_partitions, partition_key
+from .catalog import is_active
+
+# Completions cached per trie node
+TOP_K = 10
+# A term is also reachable from the start of its 2nd and 3rd words, so
+# "cam" completes "Leica M3 Camera"
+MAX_WORD_OFFSETS = 3
+
+# How much each source adds to a term's popularity
+WEIGHTS = {
+    'name': 1.0,
+    'brand': 2.0,
+    'category': 0.5,
+    'query': 3.0,
+}
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse whitespace"""
+    return _WHITESPACE.sub(' ', text or '').strip().lower()
+
+
+class _Node:
+    __slots__ = ('children', 'terms', 'top')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.terms = None
+        self.top: List[str] = []
+
+
+class Typeahead:
+    """
+    Trie whose nodes cache their TOP_K most popular completions
+
+    A lookup walks one node per typed character and returns the cached list,
+    so suggestion cost doesn't depend on how many terms share the prefix.
+    Weight increases update the cached lists along the term's paths; decreases
+    recompute those lists bottom-up from the children's lists.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.weights: Dict[str, float] = {}
+        self.display: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    def _keys(self, term: str) -> List[str]:
+        words = term.split(' ')
+        return [' '.join(words[i:]) for i in range(min(len(words), MAX_WORD_OFFSETS))]
+
+    def _rank(self, terms: Iterable[str]) -> List[str]:
+        return sorted(terms, key=lambda t: (-self.weights[t], t))[:TOP_K]
+
+    def load(self, weighted_terms: Iterable[tuple]):
+        """
+        Bulk-insert terms, computing every node's cached list in one pass
+
+        Much faster than repeated add() calls when building from scratch.
+
+        Args:
+            weighted_terms (list): (display text, weight) pairs; repeats accumulate
+        """
+        with self.lock:
+            for text, weight in weighted_terms:
+                term = normalize(text)
+                if not term or weight <= 0:
+                    continue
+                self.weights[term] = self.weights.get(term, 0.0) + weight
+                self.display.setdefault(term, text.strip())
+
+            nodes = [self.root]
+            for term in self.weights:
+                for key in self._keys(term):
+                    node = self.root
+                    for char in key:
+                        child = node.children.get(char)
+                        if child is None:
+                            child = node.children[char] = _Node()
+                            nodes.append(child)
+                        node = child
+                    if node.terms is None:
+                        node.terms = set()
+                    node.terms.add(term)
+
+            # Children are always created after their parent, so walking the
+            # creation order backwards fills every child's list first
+            for node in reversed(nodes):
+                candidates = set(node.terms or ())
+                for child in node.children.values():
+                    candidates.update(child.top)
+                node.top = self._rank(candidates)
+
+    def add(self, text: str, weight: float = 1.0):
+        """
+        Add popularity to a term, inserting it if new
+
+        Args:
+            text (str): Term as it should be displayed
+            weight (float): Popularity to add
+        """
+        term = normalize(text)
+        if not term or weight <= 0:
+            return
+
+        with self.lock:
+            self.weights[term] = self.weights.get(term, 0.0) + weight
+            self.display.setdefault(term, text.strip())
+            for key in self._keys(term):
+                node = self.root
+                path = [node]
+                for char in key:
+                    node = node.children.setdefault(char, _Node())
+                    path.append(node)
+                if node.terms is None:
+                    node.terms = set()
+                node.terms.add(term)
+                for node in path:
+                    if term not in node.top:
+                        node.top.append(term)
+                    node.top = self._rank(node.top)
+
+    def remove(self, text: str, weight: float = 1.0):
+        """
+        Remove popularity from a term, dropping it once it reaches zero
+
+        Args:
+            text (str): Term
+            weight (float): Popularity to remove
+        """
+        term = normalize(text)
+        with self.lock:
+            if term not in self.weights:
+                return
+            remaining = self.weights[term] - weight
+            if remaining > 1e-9:
+                self.weights[term] = remaining
+            else:
+                remaining = 0.0
+
+            for key in self._keys(term):
+                node = self.root
+                path = [(None, None, node)]
+                for char in key:
+                    child = node.children.get(char)
+                    if child is None:
+                        break
+                    path.append((node, char, child))
+                    node = child
+                else:
+                    if not remaining and node.terms:
+                        node.terms.discard(term)
+                if not remaining:
+                    self.weights[term] = 0.0
+
+                # Rebuild cached lists deepest first, pruning empty branches
+                for parent, char, node in reversed(path):
+                    candidates = set(node.terms or ())
+                    for child in node.children.values():
+                        candidates.update(child.top)
+                    candidates = {t for t in candidates if self.weights.get(t, 0) > 0}
+                    node.top = self._rank(candidates)
+                    if parent is not None and not node.children and not node.terms:
+                        del parent.children[char]
+
+            if not remaining:
+                del self.weights[term]
+                self.display.pop(term, None)
+
+    def suggest(self, prefix: str, k: int = 5) -> List[str]:
+        """
+        Most popular completions of a prefix
+
+        Args:
+            prefix (str): Text typed so far
+            k (int): Maximum suggestions (at most TOP_K)
+
+        Returns:
+            list: Display forms of the completions, most popular first
+        """
+        key = normalize(prefix)
+        if not key:
+            return []
+        with self.lock:
+            node = self.root
+            for char in key:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            return [self.display[term] for term in node.top[:k]]
+
+
+def _listing_terms(item: Dict) -> List[tuple]:
+    terms = []
+    if item.get('name'):
+        terms.append((item['name'], WEIGHTS['name']))
+    if item.get('brand'):
+        terms.append((item['brand'], WEIGHTS['brand']))
+    if item.get('category'):
+        terms.append((item['category'], WEIGHTS['category']))
+    return terms
+
+
+# Engines, the catalog each was built from and in-flight rebuilds, per campus partition
+_engines: Dict[str, Typeahead] = {}
+_built_from: Dict[str, object] = {}
+_building: Dict[str, object] = {}
+# Submitted query counts per campus partition
+_queries: Dict[str, Dict[str, int]] = {}
+_engine_lock = threading.Lock()
+
+
+def build_typeahead(items: Iterable[Dict], campus: str = ALL_CAMPUSES) -> Typeahead:
+    """
+    Build an engine over listings plus every search query recorded for a campus
+
+    Args:
+        items (list): Item dicts
+        campus (str): Partition whose recorded queries are included
+
+    Returns:
+        Typeahead: New engine
+    """
+    weighted_terms = [term for item in items for term in _listing_terms(item)]
+    queries = _queries.get(campus, {})
+    weighted_terms.extend((query, WEIGHTS['query'] * count) for query, count in list(queries.items()))
+    engine = Typeahead()
+    engine.load(weighted_terms)
+    return engine
+
+
+def _rebuild(catalog):
+    engine = build_typeahead((item for item in catalog.items if is_active(item)), catalog.campus)
+    with _engine_lock:
+        _engines[catalog.campus] = engine
+        _built_from[catalog.campus] = catalog
+
+
+def get_typeahead(catalog) -> Typeahead:
+    """
+    Get the engine for a catalog's campus, rebuilding it when the catalog has been reloaded
+
+    The first build happens inline; later rebuilds run in a background thread
+    while the previous engine keeps serving suggestions.
+
+    Args:
+        catalog (Catalog): Current catalog snapshot
+
+    Returns:
+        Typeahead: Shared engine for the campus
+    """
+    campus = catalog.campus
+    if campus not in _engines:
+        _rebuild(catalog)
+        return _engines[campus]
+
+    with _engine_lock:
+        engine = _engines[campus]
+        stale = _built_from.get(campus) is not catalog and _building.get(campus) is not catalog
+        if stale:
+            _building[campus] = catalog
+    if stale:
+        threading.Thread(target=_rebuild, args=(catalog,), daemon=True).start()
+    return engine
+
+
+def index_listing(item: Dict):
+    """Add a new or updated listing's terms to its campus's engines"""
+    for campus in item_partitions(item):
+        engine = _engines.get(campus)
+        if engine is not None:
+            for text, weight in _listing_terms(item):
+                engine.add(text, weight)
+
+
+def remove_listing(item: Dict):
+    """Remove a deleted or replaced listing's terms from its campus's engines"""
+    for campus in item_partitions(item):
+        engine = _engines.get(campus)
+        if engine is not None:
+            for text, weight in _listing_terms(item):
+                engine.remove(text, weight)
+
+
+def record_query(query: str, campus: Optional[str] = None):
+    """
+    Count a submitted search so popular queries are suggested
+
+    Args:
+        query (str): Submitted query
+        campus (str): Searcher's campus; popular queries are tracked per campus
+    """
+    query = query.strip()
+    if not query:
+        return
+    key = normalize(query)
+    for partition in {partition_key(campus), ALL_CAMPUSES}:
+        with _engine_lock:
+            counts = _queries.setdefault(partition, {})
+            counts[key] = counts.get(key, 0) + 1
+        engine = _engines.get(partition)
+        if engine is not None:
+            engine.add(query, WEIGHTS['query'])
@@ -4,6 +4,11 @@ import firebase_admin
 from firebase_admin import firestore
 import datetime
 from typing import Dict, List, Optional
+from .write_buffer import defer_update
+from .campus import campus_of
+from .percolator import update_wishlist
+from .metrics import instrument_module
+from .firestore_tracker import track_module
 
 def get_user_profile(user_id):
     """
@@ -26,24 +31,38 @@ def get_user_profile(user_id):
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def update_user_profile(user_id, profile_data):
+def update_user_profile(user_id, profile_data, defer=False):
     """
     Update user profile
     
     Args:
         user_id (str): User's ID
         profile_data (dict): New profile data
+        defer (bool): Queue the write in the write-behind buffer instead of
+            waiting for it; only for activity fields such as last_seen
         
     Returns:
         dict: Result with success status or error
     """
     try:
+        if defer:
+            defer_update('users', user_id, profile_data)
+            return {'success': True}
         user_ref = db.collection('users').document(user_id)
         user_ref.update(profile_data)
         return {'success': True}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
+def record_activity(user_id):
+    """
+    Stamp a user's last_seen without waiting for the write
+    
+    Args:
+        user_id (str): User's ID
+    """
+    update_user_profile(user_id, {'last_seen': datetime.datetime.now(datetime.timezone.utc)}, defer=True)
+
 # ---- WISHLIST MANAGEMENT ----
 
 def add_to_wishlist(user_id, wishlist_item):
@@ -95,14 +114,15 @@ def add_to_wishlist(user_id, wishlist_item):
         wishlist = user_data.get('wishlist', [])
         
         # Add new item with timestamp
-        wishlist_item['added_at'] = datetime.datetime.now()
+        wishlist_item['added_at'] = datetime.datetime.now(datetime.timezone.utc)
         wishlist.append(wishlist_item)
         
         # Update wishlist
         user_ref.update({
             'wishlist': wishlist,
-            'last_updated': datetime.datetime.now()
+            'last_updated': datetime.datetime.now(datetime.timezone.utc)
         })
+        update_wishlist(user_id, wishlist, campus_of(user_data))
         
         return {'success': True}
     except Exception as e:
@@ -133,6 +153,7 @@ def remove_from_wishlist(user_id, item_index):
             
             # Update wishlist
             user_ref.update({'wishlist': wishlist})
+            update_wishlist(user_id, wishlist, campus_of(user_data))
             
             return {'success': True}
         else:
@@ -166,9 +187,13 @@ def update_wishlist_item(user_id, item_index, new_item):
             
             # Update wishlist
             user_ref.update({'wishlist': wishlist})
+            update_wishlist(user_id, wishlist, campus_of(user_data))
             
             return {'success': True}
         else:
             return {'success': False, 'error': 'Invalid item index'}
     except Exception as e:
-        return {'success': False, 'error': str(e)}
\ No newline at end of file
+        return {'success': False, 'error': str(e)}
+
+instrument_module(__name__)
+track_module(__name__)
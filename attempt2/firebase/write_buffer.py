@@ -0,0 +1,225 @@
+# write_buffer.py - Write-behind buffer for activity fields that don't need immediate durability
+#
+# last_login, last_seen and view counts are written on hot paths (login, every
+# rerun, every item view). Instead of a round-trip each, updates are queued
+# here, coalesced per document (later values win, increments add up) and
+# written in batches by a background thread every WRITE_BUFFER_INTERVAL
+# seconds, as soon as WRITE_BUFFER_MAX documents are pending, and at exit.
+# A crash loses at most one interval of activity updates. Flushes update()
+# documents rather than merging into them, so updates queued for a document
+# that has since been deleted are dropped instead of recreating it as a stub.
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
+
+from .firebase_config import db
+from .metrics import record, set_gauge
+
+# Buffer activity writes; 0 writes them immediately
+WRITE_BUFFER_ENABLED = os.getenv('WRITE_BUFFER_ENABLED', '1') == '1'
+# Seconds between background flushes
+WRITE_BUFFER_INTERVAL = float(os.getenv('WRITE_BUFFER_INTERVAL', '2'))
+# Pending documents that trigger an early flush
+WRITE_BUFFER_MAX = int(os.getenv('WRITE_BUFFER_MAX', '200'))
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 500
+
+_Key = Tuple[str, str]
+
+
+def _data(entry: Dict) -> Dict:
+    data = dict(entry['fields'])
+    for field, amount in entry['increments'].items():
+        data[field] = firestore.Increment(amount)
+    return data
+
+
+def _update_existing(collection: str, doc_id: str, data: Dict) -> bool:
+    """Update a document if it still exists; returns False if it was deleted"""
+    try:
+        db.collection(collection).document(doc_id).update(data)
+        return True
+    except NotFound:
+        return False
+
+
+class WriteBuffer:
+    """
+    Coalescing queue of partial document updates, flushed with batched update writes
+    """
+
+    def __init__(self, interval: float = WRITE_BUFFER_INTERVAL, max_pending: int = WRITE_BUFFER_MAX):
+        self.interval = interval
+        self.max_pending = max_pending
+        # (collection, document ID) -> {'fields': {...}, 'increments': {...}}
+        self.pending: 'OrderedDict[_Key, Dict]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def _entry(self, collection: str, doc_id: str) -> Dict:
+        key = (collection, doc_id)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = {'fields': {}, 'increments': {}}
+        return entry
+
+    def _queued(self):
+        depth = len(self.pending)
+        set_gauge('write_buffer_depth', depth)
+        if depth >= self.max_pending:
+            self.wake.set()
+        self._start()
+
+    def update(self, collection: str, doc_id: str, fields: Dict):
+        """Queue field values for a document; a later value for a field replaces an earlier one"""
+        with self.lock:
+            self._entry(collection, doc_id)['fields'].update(fields)
+            self._queued()
+
+    def increment(self, collection: str, doc_id: str, field: str, amount: float = 1):
+        """Queue an increment; increments to the same field are summed"""
+        with self.lock:
+            increments = self._entry(collection, doc_id)['increments']
+            increments[field] = increments.get(field, 0) + amount
+            self._queued()
+
+    def discard(self, collection: str, doc_id: str):
+        """Drop pending updates for a document, e.g. before deleting it"""
+        with self.lock:
+            self.pending.pop((collection, doc_id), None)
+            set_gauge('write_buffer_depth', len(self.pending))
+
+    def _requeue(self, entries: 'OrderedDict[_Key, Dict]'):
+        # Values queued since the failed flush are newer, so they win
+        with self.lock:
+            for key, entry in entries.items():
+                current = self.pending.get(key)
+                if current is None:
+                    self.pending[key] = entry
+                    continue
+                current['fields'] = {**entry['fields'], **current['fields']}
+                for field, amount in entry['increments'].items():
+                    current['increments'][field] = current['increments'].get(field, 0) + amount
+            set_gauge('write_buffer_depth', len(self.pending))
+
+    def flush(self) -> int:
+        """
+        Write everything pending
+
+        Documents are written with update(), so only the queued fields change
+        and documents deleted in the meantime are not recreated. A batch with
+        a deleted document is rejected as a whole, so its documents are then
+        written one at a time and the deleted ones dropped. Entries that fail
+        for any other reason are queued again.
+
+        Returns:
+            int: Documents written
+        """
+        with self.flush_lock:
+            with self.lock:
+                entries, self.pending = self.pending, OrderedDict()
+                set_gauge('write_buffer_depth', 0)
+            if not entries:
+                return 0
+
+            started = time.perf_counter()
+            written = dropped = 0
+            items = list(entries.items())
+            try:
+                for start in range(0, len(items), BATCH_SIZE):
+                    chunk = items[start:start + BATCH_SIZE]
+                    batch = db.batch()
+                    for (collection, doc_id), entry in chunk:
+                        batch.update(db.collection(collection).document(doc_id), _data(entry))
+                    try:
+                        batch.commit()
+                        written += len(chunk)
+                    except NotFound:
+                        for (collection, doc_id), entry in chunk:
+                            if _update_existing(collection, doc_id, _data(entry)):
+                                written += 1
+                            else:
+                                dropped += 1
+            except Exception as e:
+                print(f"Error flushing write buffer: {str(e)}")
+                self._requeue(OrderedDict(items[written + dropped:]))
+                record('write_buffer.flush', time.perf_counter() - started, error=True, kind='buffer')
+                return written
+            record('write_buffer.flush', time.perf_counter() - started, kind='buffer')
+            set_gauge('write_buffer_last_flush_size', written)
+            if dropped:
+                print(f"Dropped buffered updates for {dropped} deleted documents")
+            return written
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def depth(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+
+_buffer = WriteBuffer()
+atexit.register(_buffer.flush)
+
+
+def defer_update(collection: str, doc_id: str, fields: Dict):
+    """
+    Update a document's activity fields without waiting for the write
+
+    Args:
+        collection (str): Collection name
+        doc_id (str): Document ID
+        fields (dict): Field values to update; ignored if the document no longer exists
+    """
+    if not WRITE_BUFFER_ENABLED:
+        _update_existing(collection, doc_id, fields)
+        return
+    _buffer.update(collection, doc_id, fields)
+
+
+def defer_increment(collection: str, doc_id: str, field: str, amount: float = 1):
+    """
+    Increment a counter field without waiting for the write
+
+    Args:
+        collection (str): Collection name
+        doc_id (str): Document ID
+        field (str): Numeric field
+        amount (float): Amount to add
+    """
+    if not WRITE_BUFFER_ENABLED:
+        _update_existing(collection, doc_id, {field: firestore.Increment(amount)})
+        return
+    _buffer.increment(collection, doc_id, field, amount)
+
+
+def discard(collection: str, doc_id: str):
+    """Drop a document's pending updates so a flush doesn't recreate it after a delete"""
+    _buffer.discard(collection, doc_id)
+
+
+def flush() -> int:
+    """Write all pending updates now; returns the number of documents written"""
+    return _buffer.flush()
+
+
+def pending_count() -> int:
+    """Documents with updates waiting to be written"""
+    return _buffer.depth()